@@ -0,0 +1,265 @@
+# benchmarks/run.py
+
+# Offline benchmarks: crawl, extract and evaluate a synthetic site against fake model backends.
+#   python -m benchmarks.run small wide --output results.json --compare baseline.json
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from rufus.agents import EvaluatorAgent
+from rufus.config import RufusConfig
+from rufus.crawler import IntelligentCrawler
+from rufus.extractor import ExtractorAgent
+from rufus.testing import FakeEmbeddings, FakeLLMServer
+from .site import SyntheticSite
+
+INSTRUCTIONS = 'summer concerts and city events'
+
+SCENARIOS = {
+    'small': {'site': {'pages': 200, 'fanout': 10, 'page_bytes': 8 * 1024}},
+    'wide': {'site': {'pages': 1000, 'fanout': 50, 'page_bytes': 4 * 1024}},
+    'heavy': {'site': {'pages': 100, 'fanout': 5, 'page_bytes': 256 * 1024}},
+    'slow-models': {
+        'site': {'pages': 200, 'fanout': 10, 'page_bytes': 8 * 1024, 'latency': 0.02},
+        'embedding_latency': 0.005,
+        'llm_latency': 0.05,
+    },
+}
+
+
+class TimedCrawler(IntelligentCrawler):
+    # Records the wall time of every fetch as the crawler sees it
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetch_latencies = []
+
+    async def fetch_with_headers(self, url, headers=None):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_with_headers(url, headers)
+        finally:
+            self.fetch_latencies.append(time.perf_counter() - started)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def current_rss_mb():
+    # Resident set size right now; None where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class RSSSampler:
+    # Highest resident set size seen while one stage runs, sampled from a thread. ru_maxrss alone
+    # would credit every stage with the peak of whatever ran before it. Without /proc the process
+    # high-water mark is all there is.
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        if self.peak is not None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.sample()
+        if self.peak is None:
+            self.peak = peak_rss_mb()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak, 1) if self.peak is not None else None
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def stage(pages, seconds, rss, **extra):
+    return dict(
+        pages=pages,
+        seconds=round(seconds, 3),
+        pages_per_sec=round(pages / seconds, 2) if seconds else None,
+        peak_rss_mb=rss.peak_mb,
+        **extra,
+    )
+
+
+async def run_scenario(name, parameters):
+    site = await SyntheticSite(**parameters['site']).start()
+    llm = await FakeLLMServer(latency=parameters.get('llm_latency', 0.0)).start()
+    embeddings = FakeEmbeddings(latency=parameters.get('embedding_latency', 0.0))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            config = RufusConfig(
+                embeddings_model=embeddings,
+                max_pages=site.pages,
+                relevance_threshold=parameters.get('relevance_threshold', 0.2),
+                page_store_dir=tmp,
+                llm_base_url=llm.base_url,
+                llm_requests_per_minute=100000,
+                llm_tokens_per_minute=100000000,
+            )
+            stages = {}
+
+            crawler = TimedCrawler(site.url, INSTRUCTIONS, config)
+            started = time.perf_counter()
+            with RSSSampler() as rss:
+                await crawler.crawl()
+            latencies = np.array(crawler.fetch_latencies) * 1000
+            pages = max(crawler.pages_crawled, 1)
+            stages['crawl'] = stage(
+                crawler.pages_crawled, time.perf_counter() - started, rss,
+                relevant_pages=len(crawler.relevant_pages),
+                bytes_fetched=site.bytes_sent,
+                fetch_latency_ms={
+                    'p50': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+                    'p99': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+                },
+                embedding_calls_per_page=round((embeddings.query_calls + embeddings.document_calls) / pages, 3),
+                texts_embedded_per_page=round(embeddings.texts_embedded / pages, 3),
+            )
+
+            extractor = ExtractorAgent(
+                config.extraction_granularity,
+                parser=crawler.parser,
+                max_tokens=config.chunk_max_tokens,
+                overlap=config.chunk_overlap_tokens,
+                tokenizer=config.tokenizer,
+            )
+            started = time.perf_counter()
+            with RSSSampler() as rss:
+                extracted_data = await extractor.extract_data(crawler.relevant_pages)
+            stages['extract'] = stage(
+                len(crawler.relevant_pages), time.perf_counter() - started, rss,
+                documents=len(extracted_data),
+                passages=sum(len(data['content']) for data in extracted_data),
+            )
+            crawler.relevant_pages.close()
+            crawler.parser.close()
+
+            evaluator = EvaluatorAgent(config.evaluation_threshold, 'benchmark-key', config)
+            started = time.perf_counter()
+            with RSSSampler() as rss:
+                scored_data = await evaluator.evaluate_data(extracted_data, INSTRUCTIONS)
+            stages['evaluate'] = stage(
+                len(extracted_data), time.perf_counter() - started, rss,
+                accepted=sum(1 for _, score in scored_data if score >= config.evaluation_threshold),
+                llm_calls=llm.requests,
+                llm_calls_per_page=round(llm.requests / max(len(extracted_data), 1), 3),
+                cascade=evaluator.cascade_report(),
+            )
+            return stages
+    finally:
+        await site.close()
+        await llm.close()
+
+
+def run_in_process(name, parameters):
+    return asyncio.run(run_scenario(name, parameters))
+
+
+def run(names):
+    commit, dirty = git_commit()
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'scenarios': {},
+    }
+    for name in names:
+        parameters = SCENARIOS[name]
+        # A fresh process per scenario, so memory held over from earlier scenarios isn't counted
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            stages = executor.submit(run_in_process, name, parameters).result()
+        results['scenarios'][name] = {'parameters': parameters, 'stages': stages}
+    return results
+
+
+def compare(results, baseline):
+    # Relative change of every throughput and latency figure present in both runs
+    lines = [f"{'scenario/stage/metric':<42}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for name, scenario in results['scenarios'].items():
+        old_scenario = baseline.get('scenarios', {}).get(name)
+        if not old_scenario:
+            continue
+        for stage_name, metrics in scenario['stages'].items():
+            old_metrics = old_scenario['stages'].get(stage_name, {})
+            flat = dict(metrics, **{f'fetch_{key}_ms': value for key, value in metrics.get('fetch_latency_ms', {}).items()})
+            old_flat = dict(old_metrics, **{f'fetch_{key}_ms': value for key, value in old_metrics.get('fetch_latency_ms', {}).items()})
+            for metric in ('pages_per_sec', 'fetch_p50_ms', 'fetch_p99_ms', 'peak_rss_mb', 'embedding_calls_per_page', 'llm_calls_per_page'):
+                old, new = old_flat.get(metric), flat.get(metric)
+                if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+                    change = f'{(new - old) / old:+.1%}' if old else 'n/a'
+                    lines.append(f"{f'{name}/{stage_name}/{metric}':<42}{old:>12}{new:>12}{change:>10}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline Rufus benchmarks')
+    parser.add_argument('scenarios', nargs='*', default=['small'], help=f"any of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.scenarios)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    print(report)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/site.py
+
+# Deterministic synthetic websites served from a local aiohttp server
+
+import asyncio
+import random
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+TOPICS = {
+    'relevant': ['summer concerts in the park', 'free outdoor festival schedule', 'city events calendar and tickets'],
+    'other': ['parking permit renewal rules', 'library opening hours', 'council meeting minutes', 'street cleaning routes',
+              'property tax payment options', 'recycling pickup days', 'animal shelter adoption fees'],
+}
+FILLER = ('the of residents city department service information public program office local community annual '
+          'request please contact available staff update notice application form hours').split()
+
+
+class SyntheticSite:
+    # Page i links to `fanout` other pages chosen from a seeded RNG, so a (pages, fanout, seed) site is
+    # identical on every run. A `relevant_share` of the pages is about the benchmark instructions.
+    def __init__(self, pages=200, fanout=10, page_bytes=8192, relevant_share=0.2, latency=0.0, seed=0):
+        self.pages = pages
+        self.fanout = fanout
+        self.page_bytes = page_bytes
+        self.relevant_share = relevant_share
+        self.latency = latency
+        self.seed = seed
+        self.requests = 0
+        self.bytes_sent = 0
+        self.server = None
+
+    def is_relevant(self, index):
+        return random.Random(f'{self.seed}-topic-{index}').random() < self.relevant_share
+
+    def render(self, index):
+        rng = random.Random(f'{self.seed}-page-{index}')
+        topic = rng.choice(TOPICS['relevant' if self.is_relevant(index) else 'other'])
+        links = sorted(rng.sample(range(self.pages), min(self.fanout, self.pages)))
+        anchors = ''.join(
+            f'<li><a href="/page/{target}">{rng.choice(TOPICS["relevant" if self.is_relevant(target) else "other"])}</a></li>'
+            for target in links
+        )
+        paragraphs = []
+        size = 0
+        while size < self.page_bytes:
+            words = [topic] + rng.choices(FILLER, k=40) + [f'page {index} section {len(paragraphs)}']
+            paragraph = f'<p>{" ".join(words)}.</p>'
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        return (
+            f'<html><head><title>Page {index}: {topic}</title></head><body>'
+            f'<nav><a href="/">Home</a></nav><h1>{topic}</h1>{"".join(paragraphs)}'
+            f'<ul>{anchors}</ul><footer>Synthetic city site</footer></body></html>'
+        )
+
+    async def handle(self, request):
+        index = int(request.match_info.get('index', 0))
+        if index >= self.pages:
+            raise web.HTTPNotFound()
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = self.render(index)
+        self.bytes_sent += len(body)
+        return web.Response(text=body, content_type='text/html')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/', self.handle)
+        app.router.add_get('/page/{index}', self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    @property
+    def url(self):
+        return str(self.server.make_url('/'))
+
+    async def close(self):
+        if self.server is not None:
+            await self.server.close()
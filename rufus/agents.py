@@ -6,12 +6,17 @@ from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain_community.llms import OpenAI
 from .llms import AsyncOpenAI
+from .config import RufusConfig
+from .scoring import BatchScorer
+from .metrics import NULL_METRICS
 
 logger = logging.getLogger(__name__)
 
 class PromptUnderstandingAgent:
-    def __init__(self, api_key):
-        self.llm = AsyncOpenAI(api_key=api_key)
+    def __init__(self, api_key, config=None):
+        config = config or RufusConfig()
+        llm_kwargs = {'openai_api_base': config.llm_base_url} if config.llm_base_url else {}
+        self.llm = AsyncOpenAI(api_key=api_key, **llm_kwargs)
         self.prompt_template = PromptTemplate(
             input_variables=["instructions"],
             template="""
@@ -32,19 +37,29 @@ class PromptUnderstandingAgent:
             return []
 
 class EvaluatorAgent:
-    def __init__(self, evaluation_threshold, api_key):
+    def __init__(self, evaluation_threshold, api_key, config=None):
         self.evaluation_threshold = evaluation_threshold
-        self.llm = AsyncOpenAI(api_key=api_key)
-        self.prompt_template = PromptTemplate(
-            input_variables=["instructions", "data"],
-            template="""
-            Evaluate the relevance of the following data to the instructions on a scale from 0 to 1.
-            Instructions: {instructions}
-            Data: {data}
-            Relevance Score (0-1):
-            """
+        self.config = config or RufusConfig()
+        self.metrics = self.config.metrics or NULL_METRICS
+        llm_kwargs = {'max_retries': 0}  # Retries and backoff are handled by the scorer
+        if self.config.llm_base_url:
+            llm_kwargs['openai_api_base'] = self.config.llm_base_url
+        self.llm = AsyncOpenAI(api_key=api_key, **llm_kwargs)
+        # Packs concurrent evaluations into multi-document prompts under rate limits
+        self.scorer = BatchScorer(
+            self.complete,
+            batch_size=self.config.llm_batch_size,
+            requests_per_minute=self.config.llm_requests_per_minute,
+            tokens_per_minute=self.config.llm_tokens_per_minute,
+            max_retries=self.config.llm_max_retries,
+            timeout=self.config.llm_timeout,
+            max_concurrency=self.config.llm_concurrency,
+            metrics=self.metrics,
         )
-        self.llm_chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
+        self.cascade_stats = {'accepted': 0, 'rejected': 0, 'escalated': 0}
+
+    async def complete(self, prompt):
+        return await self.llm.ainvoke(prompt)
 
     async def evaluate_and_feedback(self, extracted_data, instructions):
         scored_data = await self.evaluate_data(extracted_data, instructions)
@@ -79,15 +94,49 @@ class EvaluatorAgent:
         return []
 
     async def evaluate_data(self, extracted_data, instructions):
-        tasks = [self.evaluate_single_data(data, instructions) for data in extracted_data]
+        # Cascade counts cover this call only, so the report logged after it isn't inflated by earlier ones
+        stats = {'accepted': 0, 'rejected': 0, 'escalated': 0}
+        tasks = [self.evaluate_single_data(data, instructions, stats) for data in extracted_data]
         scored_data = await asyncio.gather(*tasks)
+        self.cascade_stats = stats
         return scored_data
 
-    async def evaluate_single_data(self, data, instructions):
+    def count_cascade(self, outcome, stats):
+        self.metrics.increment('cascade_total', outcome=outcome)
+        if stats is not None:
+            stats[outcome] += 1
+
+    def cascade_score(self, data, stats=None):
+        # Clear-cut crawl similarity settles the score; None sends the document to the LLM
+        relevance = data.get('relevance')
+        if relevance is None:
+            return None
+        reject_below, accept_above = self.config.cascade_reject_below, self.config.cascade_accept_above
+        if reject_below is not None and relevance < reject_below:
+            self.count_cascade('rejected', stats)
+            return 0.0
+        if accept_above is not None and relevance >= accept_above:
+            self.count_cascade('accepted', stats)
+            # Scaled from [accept_above, 1] onto [evaluation_threshold, 1], so accepted documents
+            # keep their order and don't all outrank the ones the LLM scored
+            if accept_above >= 1.0:
+                return 1.0
+            fraction = min((relevance - accept_above) / (1.0 - accept_above), 1.0)
+            return self.evaluation_threshold + (1.0 - self.evaluation_threshold) * fraction
+        return None
+
+    def cascade_report(self):
+        saved = self.cascade_stats['accepted'] + self.cascade_stats['rejected']
+        return dict(self.cascade_stats, llm_calls_saved=saved)
+
+    async def evaluate_single_data(self, data, instructions, stats=None):
+        score = self.cascade_score(data, stats)
+        if score is not None:
+            return (data, score)
+        self.count_cascade('escalated', stats)
         try:
             content_str = ' '.join(data['content'])
-            response = await self.llm_chain.arun(instructions=instructions, data=content_str[:1000])  # Limit to 1000 chars
-            score = float(response.strip())
+            score = await self.scorer.score(instructions, content_str)  # Limited to 1000 chars by the scorer
             return (data, score)
         except Exception as e:
             logger.error(f"Error evaluating data: {e}")
@@ -1,59 +1,397 @@
 # rufus/app.py
 
 import os
+import copy
+import functools
+import json
+import logging
+import time
+import numpy as np
 from dotenv import load_dotenv
 from .agents import PromptUnderstandingAgent, EvaluatorAgent, OutputAgent
 from .crawler import IntelligentCrawler
+from .distributed import DistributedCrawler
 from .extractor import ExtractorAgent
+from .parser import PageParser
+from .dedup import SimHashIndex
+from .output import JSONLWriter
+from .pool import CrawlPool
+from .vectors import VectorStore, VectorStoreWriter
+from .metrics import Metrics, NULL_METRICS
+from .embeddings import HashingEmbeddings, EmbeddingCache, CachedEmbeddings, get_model_id
 from .config import RufusConfig
 import asyncio
 from langchain.embeddings import OpenAIEmbeddings
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class RufusClient:
     def __init__(self, api_key=None, config=None):
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your environment variables or .env file.")
         self.config = config if config else RufusConfig()
-        self.config.embeddings_model = self.config.embeddings_model or OpenAIEmbeddings(openai_api_key=self.api_key)
-        self.prompt_agent = PromptUnderstandingAgent(self.api_key)
-        self.evaluator_agent = EvaluatorAgent(self.config.evaluation_threshold, self.api_key)
-        self.extractor_agent = ExtractorAgent(self.config.extraction_granularity)
+        self.metrics = self.config.metrics or NULL_METRICS
+        if self.config.embeddings_model == 'local':
+            self.config.embeddings_model = HashingEmbeddings()
+        if self.config.embeddings_model is None:
+            self.config.embeddings_model = OpenAIEmbeddings(openai_api_key=self.api_key)
+            # The client can't be pickled into crawl processes, so each one builds its own
+            if self.config.embeddings_factory is None:
+                self.config.embeddings_factory = functools.partial(OpenAIEmbeddings, openai_api_key=self.api_key)
+        # A local crawl model only steers the crawl; extracted documents are ranked with the remote one
+        ranking_model = self.config.ranking_embeddings_model
+        if ranking_model is None and getattr(self.config.embeddings_model, 'local', False):
+            ranking_model = OpenAIEmbeddings(openai_api_key=self.api_key)
+        self.ranker = None
+        if ranking_model is not None:
+            self.ranker = CachedEmbeddings(ranking_model, EmbeddingCache(
+                get_model_id(ranking_model),
+                max_size=self.config.embedding_cache_size,
+                path=self.config.embedding_cache_path,
+            ), self.metrics)
+        self.prompt_agent = PromptUnderstandingAgent(self.api_key, self.config)
+        self.evaluator_agent = EvaluatorAgent(self.config.evaluation_threshold, self.api_key, self.config)
+        # One parser (and process pool, if enabled) shared by the crawler and the extractor
+        self.page_parser = PageParser(self.config.parser_backend, self.config.parse_workers)
+        self.extractor_agent = ExtractorAgent(
+            self.config.extraction_granularity,
+            parser=self.page_parser,
+            dedup_distance=self.config.passage_duplicate_distance,
+            metrics=self.metrics,
+            max_tokens=self.config.chunk_max_tokens,
+            overlap=self.config.chunk_overlap_tokens,
+            tokenizer=self.config.tokenizer,
+        )
         self.output_agent = OutputAgent()
+        self.passage_embeddings = self.ranker  # Created on first export when there is no ranking model
 
-    async def scrape(self, url, instructions):
-        keywords = await self.prompt_agent.parse_instructions(instructions)
-        self.config.instructions = instructions
-        crawler_agent = IntelligentCrawler(url, instructions, self.config)
-        await crawler_agent.crawl()
-        extracted_data = await self.extractor_agent.extract_data(crawler_agent.relevant_pages)
-        feedback = await self.evaluator_agent.evaluate_and_feedback(extracted_data, instructions)
-        if feedback:
-            # Update parameters based on feedback
-            keywords.extend(feedback.get('new_keywords', []))
-            crawler_agent.config.max_depth = feedback.get('adjust_parameters', {}).get('max_depth', crawler_agent.config.max_depth)
-            # Re-run crawling and extraction with updated parameters
-            crawler_agent.reset()
+    async def scrape(self, url, instructions, pool=None, job=None):
+        with self.metrics.span('scrape'):
+            with self.metrics.span('understand'):
+                keywords = await self.prompt_agent.parse_instructions(instructions)
+            # Feedback adjusts the crawl settings, which must not leak into other jobs of a batch
+            config = copy.copy(self.config)
+            config.instructions = instructions
+            if config.crawl_processes > 1 and pool is None:
+                crawler_agent = DistributedCrawler(url, instructions, config)
+            else:
+                crawler_agent = IntelligentCrawler(url, instructions, config, parser=self.page_parser, pool=pool, job=job)
             await crawler_agent.crawl()
-            extracted_data = await self.extractor_agent.extract_data(crawler_agent.relevant_pages)
-        # Final evaluation
-        scored_data = await self.evaluator_agent.evaluate_data(extracted_data, instructions)
-        output = self.output_agent.prepare_output(scored_data)
-        return output
+            extracted_data = await self.extract(crawler_agent)
+            with self.metrics.span('feedback'):
+                feedback = await self.evaluator_agent.evaluate_and_feedback(extracted_data, instructions)
+            if feedback:
+                # Update parameters based on feedback
+                keywords.extend(feedback.get('new_keywords', []))
+                crawler_agent.config.max_depth = feedback.get('adjust_parameters', {}).get('max_depth', crawler_agent.config.max_depth)
+                # Re-run crawling and extraction with updated parameters
+                await crawler_agent.reset()
+                await crawler_agent.crawl()
+                extracted_data = await self.extract(crawler_agent)
+            # Final evaluation
+            with self.metrics.span('evaluate'):
+                scored_data = await self.evaluator_agent.evaluate_data(extracted_data, instructions)
+            logger.info(f"Evaluation cascade: {self.evaluator_agent.cascade_report()}")
+            if config.vector_export_dir:
+                with self.metrics.span('export'):
+                    self.export_vectors(scored_data, instructions, config.vector_export_dir)
+                    # Batch jobs append to one store, indexed once all of them are in
+                    if pool is None:
+                        self.index_vectors(config.vector_export_dir)
+            output = self.output_agent.prepare_output(scored_data)
+            return output
+
+    async def extract(self, crawler_agent):
+        try:
+            with self.metrics.span('extract'):
+                extracted_data = await self.extractor_agent.extract_data(crawler_agent.relevant_pages, crawler_agent.crawl_state)
+            # Near-duplicate URLs collapsed during the crawl are reported with the page that was kept
+            for data in extracted_data:
+                if data['url'] in crawler_agent.aliases:
+                    data['aliases'] = crawler_agent.aliases[data['url']]
+            if self.needs_ranking():
+                self.rank(extracted_data, crawler_agent.instructions)
+            return extracted_data
+        finally:
+            crawler_agent.relevant_pages.close()
+            if crawler_agent.crawl_state is not None:
+                crawler_agent.crawl_state.close()
+
+    def needs_ranking(self):
+        # Only the evaluation cascade reads the ranking similarities; the vector export embeds passages itself
+        config = self.config
+        return self.ranker is not None and (config.cascade_reject_below is not None or config.cascade_accept_above is not None)
+
+    def rank(self, extracted_data, instructions):
+        # Replaces crawl-time similarities with the ranking model's, which the evaluation cascade reads
+        if self.ranker is None or not extracted_data:
+            return extracted_data
+        query = np.asarray(self.ranker.embed_query(instructions), dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        # Truncated to stay within the provider's input limit
+        texts = [' '.join(data['content'])[:8000] for data in extracted_data]
+        batch_size = self.config.embedding_batch_size
+        for start in range(0, len(texts), batch_size):
+            matrix = np.asarray(self.ranker.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1)
+            norms[norms == 0] = 1.0
+            for data, similarity in zip(extracted_data[start:start + batch_size], matrix @ query / norms):
+                data['relevance'] = float(similarity)
+        return extracted_data
+
+    def export_vectors(self, scored_data, instructions, directory):
+        # Every passage of the accepted documents, embedded with the ranking model (or the crawl model)
+        # through its cache, so documents ranked or exported before cost no new embedding requests
+        if self.passage_embeddings is None:
+            model = self.config.embeddings_model
+            self.passage_embeddings = CachedEmbeddings(model, EmbeddingCache(
+                get_model_id(model),
+                max_size=self.config.embedding_cache_size,
+                path=self.config.embedding_cache_path,
+            ), self.metrics)
+        rows = [
+            {'url': data['url'], 'passage': i, 'text': text, 'score': score, 'instructions': instructions}
+            for data, score in scored_data if score >= self.config.evaluation_threshold
+            for i, text in enumerate(data['content'])
+        ]
+        batch_size = self.config.embedding_batch_size
+        with VectorStoreWriter(directory, self.passage_embeddings.cache.model_id) as writer:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                writer.add(self.passage_embeddings.embed_documents([row['text'] for row in batch]), batch)
+        logger.info(f"Exported {len(rows)} passages to {directory}")
+        return len(rows)
+
+    def index_vectors(self, directory):
+        with VectorStore(directory) as store:
+            if len(store) >= self.config.vector_index_min_rows:
+                store.build_index()
+
+    def close(self):
+        self.page_parser.close()
+        if self.ranker is not None:
+            self.ranker.cache.close()
+        if self.passage_embeddings is not None and self.passage_embeddings is not self.ranker:
+            self.passage_embeddings.cache.close()
+
+    async def stream(self, url, instructions):
+        # Yields each scored document as soon as it clears evaluation, while the crawl keeps going.
+        # The feedback re-crawl of scrape() is skipped since yielded documents can't be taken back.
+        started = time.monotonic()
+        results = asyncio.Queue(maxsize=2 * self.config.concurrency)
+        crawler_agent = IntelligentCrawler(url, instructions, self.config, parser=self.page_parser, results=results)
+        distance = self.config.passage_duplicate_distance
+        passages = SimHashIndex(distance) if distance is not None else None
+
+        async def crawl():
+            try:
+                await crawler_agent.crawl()
+            except Exception as e:
+                logger.error(f"Error crawling {url}: {e}")
+            # Not reached on cancellation, when nobody is left to read the end marker
+            await results.put(None)
+
+        # Documents waiting to be ranked together, flushed when the batch fills or after a short linger
+        pending = []
+        timer = None
+
+        def flush():
+            nonlocal timer
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            batch = [(data, future) for data, future in pending if not future.done()]
+            pending.clear()
+            try:
+                self.rank([data for data, _ in batch], instructions)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+        async def rank(data):
+            nonlocal timer
+            future = asyncio.get_running_loop().create_future()
+            pending.append((data, future))
+            if len(pending) >= self.config.embedding_batch_size:
+                flush()
+            elif timer is None:
+                timer = asyncio.get_running_loop().call_later(0.05, flush)
+            await future
+
+        async def process(url, page):
+            data = await self.extractor_agent.extract_from_page(url, page, crawler_agent.crawl_state)
+            if not data or not self.extractor_agent.drop_duplicate_passages(data, passages):
+                return None
+            if self.needs_ranking():
+                await rank(data)
+            data, score = await self.evaluator_agent.evaluate_single_data(data, instructions)
+            if score < self.config.evaluation_threshold:
+                return None
+            if url in crawler_agent.aliases:
+                data['aliases'] = list(crawler_agent.aliases[url])
+            return dict(data, score=score)
+
+        crawl_task = asyncio.create_task(crawl())
+        evaluations = set()
+        # Pages taken off the queue beyond what the scorer can have in flight would only pile up here;
+        # leaving them queued makes a slow evaluation hold the crawl back
+        max_evaluations = max(1, self.config.llm_concurrency * self.config.llm_batch_size)
+        getter = None
+        crawling = True
+        yielded = 0
+        try:
+            while crawling or evaluations:
+                if crawling and getter is None and len(evaluations) < max_evaluations:
+                    getter = asyncio.create_task(results.get())
+                done, _ = await asyncio.wait(evaluations | ({getter} if getter else set()), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is getter:
+                        getter = None
+                        item = task.result()
+                        if item is None:
+                            crawling = False
+                        else:
+                            evaluations.add(asyncio.create_task(process(*item)))
+                        continue
+                    evaluations.discard(task)
+                    document = task.result()
+                    if document:
+                        if not yielded:
+                            self.metrics.observe('first_document_seconds', time.monotonic() - started)
+                            logger.info(f"First document after {time.monotonic() - started:.1f}s")
+                        yielded += 1
+                        self.metrics.increment('documents_streamed_total')
+                        yield document
+            await crawl_task
+        finally:
+            for task in [crawl_task, getter, *evaluations]:
+                if task is not None and not task.done():
+                    task.cancel()
+            if timer is not None:
+                timer.cancel()
+            await asyncio.gather(crawl_task, *evaluations, return_exceptions=True)
+            await crawler_agent.close()
+            crawler_agent.relevant_pages.close()
+            if crawler_agent.crawl_state is not None:
+                crawler_agent.crawl_state.close()
+            logger.info(f"Streamed {yielded} documents in {time.monotonic() - started:.1f}s")
+
+    async def stream_to_jsonl(self, url, instructions, path, flush_every=10, flush_interval=5.0):
+        count = 0
+        with JSONLWriter(path, flush_every=flush_every, flush_interval=flush_interval) as writer:
+            async for document in self.stream(url, instructions):
+                writer.write(document)
+                count += 1
+        return count
+
+    def run_stream(self, url, instructions, path):
+        try:
+            return asyncio.run(self.stream_to_jsonl(url, instructions, path))
+        finally:
+            self.close()
 
     def run(self, url, instructions):
-        return asyncio.run(self.scrape(url, instructions))
+        try:
+            return asyncio.run(self.scrape(url, instructions))
+        finally:
+            self.close()
+
+    async def batch(self, jobs, path):
+        # Runs many scrape() jobs in one event loop. They share this client's agents, LLM client and
+        # parser, plus one CrawlPool (HTTP session, embedding cache, per-host politeness, and a global
+        # budget of page visits split fairly between jobs). Each job's line is written when it finishes.
+        pool = CrawlPool(self.config, budget=self.config.batch_concurrency)
+        slots = asyncio.Semaphore(self.config.batch_jobs)
+        counts = {'succeeded': 0, 'failed': 0}
+
+        async def run_job(job, writer):
+            async with slots:
+                started = time.monotonic()
+                with self.metrics.span('job', job=job['id']):
+                    try:
+                        documents = await self.scrape(job['url'], job['instructions'], pool=pool, job=job['id'])
+                    except Exception as e:
+                        logger.error(f"Job {job['id']} ({job['url']}) failed: {e}")
+                        record = {'id': job['id'], 'url': job['url'], 'error': str(e)}
+                        counts['failed'] += 1
+                    else:
+                        record = {'id': job['id'], 'url': job['url'], 'documents': documents}
+                        counts['succeeded'] += 1
+                record['instructions'] = job['instructions']
+                record['seconds'] = round(time.monotonic() - started, 3)
+                writer.write(record)
+                self.metrics.increment('batch_jobs_total', outcome='error' if 'error' in record else 'ok')
+                logger.info(f"Job {job['id']} finished in {record['seconds']}s")
+
+        try:
+            with JSONLWriter(path, flush_every=1) as writer:
+                await asyncio.gather(*(run_job(job, writer) for job in jobs))
+        finally:
+            await pool.close()
+        if self.config.vector_export_dir and counts['succeeded']:
+            self.index_vectors(self.config.vector_export_dir)
+        return counts
+
+    def run_batch(self, jobs_path, output_path):
+        try:
+            return asyncio.run(self.batch(load_jobs(jobs_path), output_path))
+        finally:
+            self.close()
+
+def load_jobs(path):
+    # One JSON object per line with 'url' and 'instructions'; 'id' defaults to the line number
+    jobs = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {e}")
+            if not isinstance(job, dict) or not job.get('url') or not job.get('instructions'):
+                raise ValueError(f"{path}:{number}: a job needs 'url' and 'instructions'")
+            job.setdefault('id', number)
+            jobs.append(job)
+    return jobs
 
 def main():
     import argparse
 
     parser = argparse.ArgumentParser(description='Run Rufus web data extraction.')
-    parser.add_argument('url', type=str, help='The starting URL for crawling.')
-    parser.add_argument('instructions', type=str, help='User-defined instructions for data extraction.')
+    parser.add_argument('url', type=str, nargs='?', help='The starting URL for crawling.')
+    parser.add_argument('instructions', type=str, nargs='?', help='User-defined instructions for data extraction.')
+    parser.add_argument('--jobs', type=str, help='Run every job of this JSONL file (url, instructions, optional id) in one process.')
+    parser.add_argument('--output', type=str, default='results.jsonl', help='Where --jobs writes one result line per job.')
+    parser.add_argument('--jsonl', type=str, help='Stream documents to this JSONL file as soon as they are scored.')
+    parser.add_argument('--vectors', type=str, help='Export accepted passages and their embeddings to this directory for search.')
+    parser.add_argument('--metrics', type=str, help='Write a JSON run report of counters, histograms and stage spans here.')
+    parser.add_argument('--prometheus', type=str, help='Write the run metrics in Prometheus text format here.')
     args = parser.parse_args()
+    if not args.jobs and not (args.url and args.instructions):
+        parser.error('url and instructions are required unless --jobs is given')
 
-    client = RufusClient()
-    documents = client.run(args.url, args.instructions)
-    print(documents)
+    metrics = Metrics() if args.metrics or args.prometheus else None
+    client = RufusClient(config=RufusConfig(metrics=metrics, vector_export_dir=args.vectors))
+    try:
+        if args.jobs:
+            counts = client.run_batch(args.jobs, args.output)
+            print(f"{counts['succeeded']} jobs succeeded and {counts['failed']} failed; results in {args.output}")
+        elif args.jsonl:
+            count = client.run_stream(args.url, args.instructions, args.jsonl)
+            print(f'{count} documents written to {args.jsonl}')
+        else:
+            documents = client.run(args.url, args.instructions)
+            print(documents)
+    finally:
+        if args.metrics:
+            metrics.write_report(args.metrics)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
@@ -0,0 +1,165 @@
+# rufus/chunker.py
+
+import functools
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'caption'}
+GROUPED_TAGS = {'li', 'tr', 'dt', 'dd'}  # Consecutive items of a list or table stay in one passage
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])')
+WORD = re.compile(r'\S+')
+GRANULARITIES = ('paragraph', 'sentence', 'window')
+
+
+class WordTokenizer:
+    # Whitespace tokens, used when tiktoken or its encoding files aren't available
+    name = 'words'
+
+    def encode(self, text):
+        return WORD.findall(text)
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.name = encoding.name
+
+    def encode(self, text):
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, tokens):
+        return self.encoding.decode(tokens)
+
+
+@functools.lru_cache(maxsize=None)  # Loaded once per process, not once per page
+def get_tokenizer(name='cl100k_base'):
+    if name and name != 'words':
+        try:
+            import tiktoken
+            return TiktokenTokenizer(tiktoken.get_encoding(name))
+        except ImportError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {name}, counting words instead: {e}")
+    return WordTokenizer()
+
+
+@functools.lru_cache(maxsize=None)
+def get_sentence_splitter():
+    # nltk's Punkt model when its data is installed; it is never downloaded at crawl time
+    try:
+        from nltk.tokenize import PunktTokenizer
+        return PunktTokenizer().tokenize
+    except (ImportError, LookupError):
+        logger.info("nltk punkt data not found; splitting sentences on punctuation")
+        return SENTENCE_END.split
+
+
+class Chunker:
+    # Cuts a ParsedPage into passages along its block structure (headings, paragraphs, list items, table rows):
+    #   paragraph: one passage per block, with a heading joined to the block after it and lists/tables grouped
+    #   sentence:  the sentences of each block
+    #   window:    whole blocks packed up to max_tokens, consecutive passages sharing `overlap` tokens
+    # Paragraph and window passages never exceed max_tokens; longer blocks are split into overlapping windows.
+    def __init__(self, granularity='paragraph', max_tokens=256, overlap=32, tokenizer='cl100k_base'):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity {granularity!r}; expected one of {', '.join(GRANULARITIES)}")
+        if not 0 <= overlap < max_tokens:
+            raise ValueError('overlap must be smaller than max_tokens')
+        self.granularity = granularity
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.tokenizer = get_tokenizer(tokenizer)
+
+    @property
+    def key(self):
+        # Identifies the output for cached extractions; any setting change invalidates them
+        if self.granularity == 'sentence':
+            return 'sentence'
+        return f'{self.granularity}:{self.max_tokens}:{self.overlap}:{self.tokenizer.name}'
+
+    def chunk(self, page):
+        return self.chunk_blocks(self.page_blocks(page))
+
+    def chunk_text(self, text):
+        return self.chunk_blocks([('p', text)] if text.strip() else [])
+
+    def chunk_blocks(self, blocks):
+        if self.granularity == 'sentence':
+            passages = [sentence for _, text in blocks for sentence in self.sentences(text)]
+        elif self.granularity == 'window':
+            passages = self.windows([text for _, text in blocks])
+        else:
+            passages = [part for text in self.paragraphs(blocks) for part in self.split(text)]
+        return [passage.strip() for passage in passages if passage.strip()]
+
+    def page_blocks(self, page):
+        # Text outside block tags (div soup) is lost from blocks; such pages are chunked from their text
+        blocks = page.blocks
+        if not blocks or 2 * sum(len(text) for _, text in blocks) < len(page.text):
+            return [('p', page.text)] if page.text else []
+        return blocks
+
+    def sentences(self, text):
+        return [sentence.strip() for sentence in get_sentence_splitter()(text) if sentence.strip()]
+
+    def paragraphs(self, blocks):
+        passages = []
+        heading = None
+        group, group_tag = [], None
+        for tag, text in blocks:
+            if tag in HEADING_TAGS:
+                if group:
+                    passages.append('\n'.join(group))
+                    group, group_tag = [], None
+                # Consecutive headings (h1 then h2) introduce the same passage
+                heading = f'{heading}\n{text}' if heading else text
+                continue
+            if group and (tag != group_tag or tag not in GROUPED_TAGS):
+                passages.append('\n'.join(group))
+                group = []
+            if heading:
+                group.append(heading)
+                heading = None
+            group.append(text)
+            group_tag = tag
+        if group:
+            passages.append('\n'.join(group))
+        if heading:
+            passages.append(heading)
+        return passages
+
+    def split(self, text):
+        tokens = self.tokenizer.encode(text)
+        if len(tokens) <= self.max_tokens:
+            return [text]
+        return [self.tokenizer.decode(window) for window in self.slide(tokens)]
+
+    def slide(self, tokens):
+        stride = self.max_tokens - self.overlap
+        return [tokens[start:start + self.max_tokens] for start in range(0, max(len(tokens) - self.overlap, 1), stride)]
+
+    def windows(self, texts):
+        passages = []
+        current = []
+        fresh = 0  # Tokens of `current` not already emitted as another passage's overlap
+        for text in texts:
+            tokens = self.tokenizer.encode(text + '\n')
+            if fresh and len(current) + len(tokens) > self.max_tokens:
+                passages.append(current)
+                current = current[len(current) - self.overlap:] if self.overlap else []
+                fresh = 0
+            current = current + tokens
+            fresh += len(tokens)
+            while len(current) > self.max_tokens:
+                passages.append(current[:self.max_tokens])
+                current = current[self.max_tokens - self.overlap:]
+                fresh = max(len(current) - self.overlap, 0)
+        if fresh:
+            passages.append(current)
+        return [self.tokenizer.decode(passage) for passage in passages]
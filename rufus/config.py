@@ -2,21 +2,138 @@
 
 from langchain.embeddings import OpenAIEmbeddings
 
+# Default relevance thresholds. Hashed TF-IDF cosines run far lower than neural embedding ones:
+# on-topic pages mostly score 0.05-0.2, so the local bound leans towards recall and leaves the
+# rest to the LLM evaluation
+RELEVANCE_THRESHOLD = 0.3
+LOCAL_RELEVANCE_THRESHOLD = 0.05
+
 class RufusConfig:
     def __init__(
         self,
         max_depth=10,
         extraction_granularity='paragraph',
+        chunk_max_tokens=256,
+        chunk_overlap_tokens=32,
+        tokenizer='cl100k_base',
         evaluation_threshold=0.7,
-        relevance_threshold=0.3,
+        relevance_threshold=None,
         embeddings_model=None,
+        ranking_embeddings_model=None,
         max_pages=1000,
         concurrency=10,
+        connection_limit=100,
+        connection_limit_per_host=10,
+        dns_cache_ttl=300,
+        keepalive_timeout=30,
+        http_compression=True,
+        request_timeout=10,
+        per_host_concurrency=8,
+        per_host_initial_concurrency=2,
+        politeness_delay=0.0,
+        respect_robots=True,
+        user_agent='Rufus/1.0',
+        max_fetch_retries=3,
+        max_response_bytes=5 * 1024 * 1024,
+        allowed_content_types=('text/html', 'application/xhtml+xml', 'text/plain'),
+        skip_extensions=(
+            '.pdf', '.zip', '.gz', '.tar', '.rar', '.7z', '.exe', '.dmg', '.iso', '.bin',
+            '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico', '.bmp', '.tif', '.tiff',
+            '.mp3', '.mp4', '.avi', '.mov', '.wmv', '.webm', '.wav', '.ogg',
+            '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.csv',
+            '.css', '.js', '.json', '.xml', '.rss', '.woff', '.woff2', '.ttf', '.eot',
+        ),
+        embedding_cache_size=10000,
+        embedding_cache_path=None,
+        embedding_batch_size=256,
+        frontier_max_size=100000,
+        parser_backend='auto',
+        parse_workers=0,
+        page_store_dir=None,
+        crawl_state_path=None,
+        llm_batch_size=5,
+        llm_requests_per_minute=500,
+        llm_tokens_per_minute=200000,
+        llm_max_retries=5,
+        llm_timeout=60,
+        llm_concurrency=8,
+        llm_base_url=None,
+        cascade_reject_below=None,
+        cascade_accept_above=None,
+        near_duplicate_distance=3,
+        passage_duplicate_distance=3,
+        crawl_processes=1,
+        shard_by='url',
+        embeddings_factory=None,
+        vector_export_dir=None,
+        vector_index_min_rows=10000,
+        batch_jobs=8,
+        batch_concurrency=64,
+        metrics=None,
     ):
         self.max_depth = max_depth
-        self.extraction_granularity = extraction_granularity
+        self.extraction_granularity = extraction_granularity  # 'paragraph', 'sentence' or 'window' passages
+        self.chunk_max_tokens = chunk_max_tokens  # longest paragraph or window passage
+        self.chunk_overlap_tokens = chunk_overlap_tokens  # tokens shared by consecutive windows
+        self.tokenizer = tokenizer  # tiktoken encoding counting those tokens; words are counted without tiktoken
         self.evaluation_threshold = evaluation_threshold
-        self.relevance_threshold = relevance_threshold
-        self.embeddings_model = embeddings_model
+        if relevance_threshold is None:
+            local = embeddings_model == 'local' or getattr(embeddings_model, 'local', False)
+            relevance_threshold = LOCAL_RELEVANCE_THRESHOLD if local else RELEVANCE_THRESHOLD
+        self.relevance_threshold = relevance_threshold  # crawl-time similarity a page needs; None picks the model's default
+        self.embeddings_model = embeddings_model  # crawl-time scoring; 'local' selects the offline HashingEmbeddings
+        self.ranking_embeddings_model = ranking_embeddings_model  # re-scores extracted documents for the cascade bounds only; defaults to OpenAI when crawling locally
         self.max_pages = max_pages
         self.concurrency = concurrency
+        # HTTP connection pool shared by every fetch of a crawl
+        self.connection_limit = connection_limit  # 0 means unlimited
+        self.connection_limit_per_host = connection_limit_per_host  # 0 means unlimited
+        self.dns_cache_ttl = dns_cache_ttl  # seconds, None caches forever
+        self.keepalive_timeout = keepalive_timeout  # seconds an idle connection is kept open
+        self.http_compression = http_compression  # advertise and decode gzip/deflate
+        self.request_timeout = request_timeout  # seconds per request
+        # Per-host politeness: concurrency adapts (AIMD) between 1 and per_host_concurrency from latency and errors
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_initial_concurrency = per_host_initial_concurrency
+        self.politeness_delay = politeness_delay  # minimum seconds between requests to a host; robots.txt Crawl-delay may raise it
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent  # sent with every request and matched against robots.txt
+        self.max_fetch_retries = max_fetch_retries  # retries of a URL answered with 429/503, after Retry-After
+        # Responses worth reading: larger bodies are abandoned mid-stream, other types before the body is read
+        self.max_response_bytes = max_response_bytes  # None disables the cap
+        self.allowed_content_types = allowed_content_types
+        self.skip_extensions = frozenset(extension.lower() for extension in skip_extensions)  # never requested
+        # Embedding cache: in-memory LRU bound and optional sqlite file that persists across runs
+        self.embedding_cache_size = embedding_cache_size
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_batch_size = embedding_batch_size  # texts per embed_documents request
+        self.frontier_max_size = frontier_max_size  # pending URLs kept, lowest priority dropped first; None is unbounded
+        self.parser_backend = parser_backend  # BeautifulSoup tree builder; 'auto' picks lxml when installed
+        self.parse_workers = parse_workers  # processes for HTML parsing; 0 parses on the event loop
+        self.page_store_dir = page_store_dir  # where relevant pages are spilled; None uses the system temp dir
+        self.crawl_state_path = crawl_state_path  # sqlite file enabling incremental recrawls; None disables it
+        # LLM relevance scoring: documents per prompt, rate limits and retries on 429s/timeouts
+        self.llm_batch_size = llm_batch_size
+        self.llm_requests_per_minute = llm_requests_per_minute
+        self.llm_tokens_per_minute = llm_tokens_per_minute
+        self.llm_max_retries = llm_max_retries
+        self.llm_timeout = llm_timeout  # seconds per request
+        self.llm_concurrency = llm_concurrency  # requests in flight
+        self.llm_base_url = llm_base_url  # OpenAI-compatible endpoint; None uses the default API
+        # Cascade: crawl-time similarity below/above these bounds decides without an LLM call; None disables a bound
+        self.cascade_reject_below = cascade_reject_below
+        self.cascade_accept_above = cascade_accept_above
+        # SimHash bits two pages/passages may differ by and still count as duplicates; None disables
+        self.near_duplicate_distance = near_duplicate_distance
+        self.passage_duplicate_distance = passage_duplicate_distance
+        # Distributed crawl: processes sharing one sqlite frontier, each owning the URLs that hash to it
+        self.crawl_processes = crawl_processes  # 1 crawls on the calling event loop
+        self.shard_by = shard_by  # 'url' spreads a single site across processes; 'host' keeps each host in one process
+        self.embeddings_factory = embeddings_factory  # picklable callable rebuilding embeddings_model in each process
+        # RAG export: passages with their embeddings, memory-mapped and searchable (rufus.vectors.VectorStore)
+        self.vector_export_dir = vector_export_dir  # None skips the export
+        self.vector_index_min_rows = vector_index_min_rows  # stores this large also get a coarse (IVF) index
+        # Batch mode: jobs crawled at once, and page visits in flight across all of them
+        self.batch_jobs = batch_jobs
+        self.batch_concurrency = batch_concurrency  # None leaves each job to its own concurrency
+        self.metrics = metrics  # rufus.metrics.Metrics collecting counters, histograms and spans; None records nothing
@@ -1,116 +1,447 @@
 # rufus/crawler.py
 
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import codecs
+import os
+import re
+import time
+from collections import Counter
+from urllib.parse import urlparse
 import logging
 import numpy as np
 import traceback
-import hashlib
+from .embeddings import EmbeddingCache, CachedEmbeddings, get_model_id
+from .frontier import URLFrontier, canonicalize_url
+from .parser import PageParser
+from .store import PageStore
+from .state import CrawlState, content_hash
+from .dedup import SimHashIndex, simhash
+from .metrics import NULL_METRICS, BYTE_BUCKETS
+from .politeness import HostScheduler, RobotsCache, Throttled, THROTTLED_STATUS, parse_retry_after
+from .pool import create_session
 
 logger = logging.getLogger(__name__)
 
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
 
 class IntelligentCrawler:
-    def __init__(self, base_url, instructions, config):
+    def __init__(self, base_url, instructions, config, parser=None, results=None, pool=None, job=None):
         self.base_url = base_url.rstrip('/')  # Remove trailing slash for consistency
         self.instructions = instructions
         self.config = config
-        self.visited = set()
-        self.relevant_pages = []
-        self.url_queue = asyncio.PriorityQueue()  # Use PriorityQueue for prioritizing URLs
-        self.embeddings_model = self.config.embeddings_model
+        self.metrics = self.config.metrics or NULL_METRICS
+        self.pages_crawled = 0
+        self.relevant_pages = PageStore(self.config.page_store_dir)  # Spilled to disk instead of held in RAM
+        self.duplicates = self.new_duplicate_index()
+        self.aliases = {}  # Kept URL -> near-duplicate URLs collapsed into it
+        self.results = results  # Optional asyncio.Queue receiving relevant pages as they are found
+        self.frontier = URLFrontier(max_size=self.config.frontier_max_size)  # Deduplicating priority frontier
+        # A CrawlPool shares the session, embedding cache, host scheduler and robots rules with other
+        # crawls and closes them itself; `job` identifies this crawl in the pool's fair budget
+        self.pool = pool
+        self.job = job if job is not None else self.base_url
+        if pool is not None:
+            self.embedding_cache = pool.embedding_cache
+        else:
+            self.embedding_cache = EmbeddingCache(
+                get_model_id(self.config.embeddings_model),
+                max_size=self.config.embedding_cache_size,
+                path=self.config.embedding_cache_path,
+            )
+        if getattr(self.config.embeddings_model, 'local', False):
+            self.embeddings_model = self.config.embeddings_model  # In-process models are cheaper than the cache
+        else:
+            self.embeddings_model = CachedEmbeddings(self.config.embeddings_model, self.embedding_cache, self.metrics)
         self.instructions_embedding = self.get_embedding(self.instructions)
+        self.instructions_vector = self.normalize(self.instructions_embedding)
         self.max_pages = self.config.max_pages  # Limit total pages to crawl
         self.semaphore = asyncio.Semaphore(self.config.concurrency)
+        self.session = None  # Created lazily inside the running event loop
+        self.skipped = Counter()  # URLs and responses dropped before their body was read, by reason
+        self.scheduler = self.new_scheduler()
+        if pool is not None:
+            self.robots = pool.robots
+        else:
+            self.robots = RobotsCache(self.config.user_agent) if self.config.respect_robots else None
+        self.retries = Counter()  # URL -> throttled attempts so far
+        # Opt-in record of earlier runs, used for conditional GETs and reuse of unchanged pages
+        self.crawl_state = CrawlState(self.config.crawl_state_path, self.base_url) if self.config.crawl_state_path else None
+        # A parser passed in is shared with other components and closed by its owner
+        self.owns_parser = parser is None
+        self.parser = parser or PageParser(self.config.parser_backend, self.config.parse_workers)
+
+    async def reset(self):
+        await self.close()
+        self.pages_crawled = 0
+        self.relevant_pages.close()
+        self.relevant_pages = PageStore(self.config.page_store_dir)
+        self.duplicates = self.new_duplicate_index()
+        self.aliases = {}
+        self.skipped = Counter()
+        self.scheduler = self.new_scheduler()
+        self.retries = Counter()
+        self.frontier = URLFrontier(max_size=self.config.frontier_max_size)
+
+    def new_duplicate_index(self):
+        distance = self.config.near_duplicate_distance
+        return SimHashIndex(distance) if distance is not None else None
+
+    def new_scheduler(self):
+        if self.pool is not None:
+            return self.pool.scheduler
+        return HostScheduler(
+            self.requeue,
+            max_concurrency=self.config.per_host_concurrency,
+            initial_concurrency=self.config.per_host_initial_concurrency,
+            min_delay=self.config.politeness_delay,
+        )
+
+    def requeue(self, url, priority, depth):
+        self.frontier.requeue(url, priority, depth)
+
+    def is_duplicate(self, url, page):
+        # Mirrors, print views and query variants are collapsed before any embedding spend
+        if self.duplicates is None or not page.text:
+            return False
+        original = self.duplicates.find_or_add(simhash(page.text), url)
+        if original is None:
+            return False
+        self.aliases.setdefault(original, []).append(url)
+        self.metrics.increment('pages_duplicate_total')
+        logger.debug(f"Skipping {url}: near-duplicate of {original}")
+        return True
 
-    def reset(self):
-        self.visited = set()
-        self.relevant_pages = []
-        self.url_queue = asyncio.PriorityQueue()
+    def get_session(self):
+        # One pooled session per crawl so connections are reused across fetches
+        if self.pool is not None:
+            return self.pool.get_session()
+        if self.session is None or self.session.closed:
+            self.session = create_session(self.config)
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        if self.owns_parser:
+            self.parser.close()
+        if self.pool is None:
+            self.scheduler.close()
+            logger.info(f"Host scheduler stats: {self.scheduler.stats()}")
+            self.embedding_cache.close()
+            logger.info(f"Embedding cache stats: {self.embedding_cache.stats()}")
+        if self.crawl_state is not None:
+            self.crawl_state.close()
+            logger.info(f"Crawl state stats: {self.crawl_state.stats()}")
+        logger.info(f"Frontier stats: {self.frontier.stats()}")
+        if self.skipped:
+            logger.info(f"Skipped fetches: {dict(self.skipped)}")
 
     async def crawl(self):
-        await self.enqueue_url(self.base_url, priority=0)
-        tasks = []
-        while not self.url_queue.empty() and len(self.visited) < self.max_pages:
-            _, url = await self.url_queue.get()
-            if url in self.visited:
-                continue
-            tasks.append(asyncio.create_task(self.fetch_and_process(url)))
-            if len(tasks) >= self.config.concurrency:
-                await asyncio.gather(*tasks)
-                tasks = []
-        if tasks:
-            await asyncio.gather(*tasks)
-
-    async def fetch_and_process(self, url):
-        self.visited.add(url)
-        logger.info(f"Processing URL: {url}")
         try:
-            response_text = await self.fetch(url)
-            if response_text:
-                if await self.is_relevant(response_text):
-                    self.relevant_pages.append((url, response_text))
-                await self.extract_and_enqueue_links(response_text, url)
+            with self.metrics.span('crawl'):
+                await self.run_workers()
+        finally:
+            await self.close()
+
+    async def run_workers(self):
+        await self.enqueue_url(self.base_url, priority=0, depth=0)
+        # Long-lived workers keep every slot busy instead of waiting on whole batches
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.config.concurrency)]
+        try:
+            # Done only once the queue is empty and no worker is still processing a page
+            await self.frontier.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def worker(self):
+        while True:
+            priority, depth, url = await self.frontier.get()
+            self.metrics.gauge('frontier_size', len(self.frontier))
+            deferred = False
+            try:
+                if self.pages_crawled < self.max_pages:
+                    deferred = await self.visit(url, priority, depth)
+            finally:
+                # Deferred URLs come back through the frontier and are finished then
+                if not deferred:
+                    self.frontier.task_done()
+                if self.pages_crawled >= self.max_pages:
+                    self.drain_deferred()
+
+    def drain_deferred(self):
+        # With the page budget spent, URLs parked for a busy host would only be skipped once woken,
+        # and no further release may come to wake them; they are finished here instead
+        for _ in self.scheduler.drain(self.requeue):
+            self.frontier.task_done()
+
+    async def visit(self, url, priority, depth):
+        if self.pool is None:
+            return await self.visit_host(url, priority, depth)
+        # A slot of the pool's global budget, shared fairly with the other crawls
+        await self.pool.acquire(self.job)
+        try:
+            return await self.visit_host(url, priority, depth)
+        finally:
+            self.pool.release(self.job)
+
+    async def visit_host(self, url, priority, depth):
+        # Returns True when the URL was handed to the scheduler to wait for its host
+        host = urlparse(url).netloc
+        if not self.scheduler.try_acquire(host):
+            self.scheduler.defer(host, url, priority, depth, self.requeue)
+            return True
+        try:
+            if not await self.is_allowed(url):
+                self.skip('robots')
+                return False
+            await self.fetch_and_process(url, depth)
+        except Throttled as e:
+            self.pages_crawled -= 1
+            if self.retries[url] >= self.config.max_fetch_retries:
+                logger.error(f"Giving up on {url} after repeated {e.status} responses")
+                return False
+            self.retries[url] += 1
+            self.scheduler.defer(host, url, priority, depth, self.requeue)
+            return True
+        finally:
+            self.scheduler.release(host)
+        return False
+
+    async def is_allowed(self, url):
+        if self.robots is None:
+            return True
+        session = self.get_session()
+        self.scheduler.set_delay(urlparse(url).netloc, await self.robots.crawl_delay(session, url))
+        return await self.robots.allowed(session, url)
+
+    async def fetch_and_process(self, url, depth=0):
+        self.pages_crawled += 1
+        self.metrics.increment('pages_crawled_total')
+        logger.debug(f"Processing URL: {url} at depth {depth}")
+        try:
+            result = await self.load_page(url)
+            if result:
+                page, similarity = result
+                if similarity >= self.config.relevance_threshold:
+                    # Kept with the page so the evaluator can skip the LLM for clear-cut cases
+                    page.relevance = similarity
+                    self.metrics.increment('pages_relevant_total')
+                    if self.results is not None:
+                        # A bounded queue makes the crawl wait for a slow consumer
+                        await self.results.put((url, page))
+                    else:
+                        self.relevant_pages.append((url, page))
+                if depth < self.config.max_depth:
+                    await self.enqueue_links(page.links, depth + 1)
+        except Throttled:
+            raise
         except Exception as e:
             logger.error(f"Error processing {url}: {e}")
             logger.debug(traceback.format_exc())
 
+    async def load_page(self, url):
+        # Returns (page, similarity to the instructions), reusing stored results when the page is unchanged
+        record = self.crawl_state.get(url) if self.crawl_state is not None else None
+        headers = self.crawl_state.validators(record) if record else None
+        status, response_text, response_headers = await self.fetch_with_headers(url, headers)
+        if status == 304 and record:
+            self.crawl_state.not_modified += 1
+            self.metrics.increment('pages_reused_total', reason='not_modified')
+            if self.is_duplicate(url, record['page']):
+                return None
+            return record['page'], self.stored_similarity(url, record, response_headers)
+        if not response_text:
+            return None
+        page_hash = content_hash(response_text) if self.crawl_state is not None else None
+        if record and record['page'] is not None and record['content_hash'] == page_hash:
+            self.crawl_state.unchanged += 1
+            self.metrics.increment('pages_reused_total', reason='unchanged')
+            if self.is_duplicate(url, record['page']):
+                return None
+            return record['page'], self.stored_similarity(url, record, response_headers)
+        # Parsed once here; the extractor consumes the same page record
+        page = await self.parse(url, response_text)
+        if self.is_duplicate(url, page):
+            return None
+        self.fit([page.text])
+        embedding = self.embed_texts([page.text])[0]
+        similarity = float(self.score_vectors(embedding[np.newaxis])[0])
+        if self.crawl_state is not None:
+            self.crawl_state.save(
+                url, response_headers.get('ETag'), response_headers.get('Last-Modified'),
+                page_hash, self.embedding_cache.model_id, embedding, similarity, page,
+            )
+        return page, similarity
+
+    def stored_similarity(self, url, record, response_headers):
+        # Stored embeddings are rescored so changed instructions still apply; other models re-embed
+        self.fit([record['page'].text])
+        if record['embedding'] is not None and record['model_id'] == self.embedding_cache.model_id:
+            embedding = record['embedding']
+        else:
+            embedding = self.embed_texts([record['page'].text])[0]
+        similarity = float(self.score_vectors(embedding[np.newaxis])[0])
+        self.crawl_state.touch(url, response_headers.get('ETag'), response_headers.get('Last-Modified'), similarity)
+        return similarity
+
     async def fetch(self, url):
+        _, response_text, _ = await self.fetch_with_headers(url)
+        return response_text
+
+    async def fetch_with_headers(self, url, headers=None):
+        # Returns (status, body for 200 responses, response headers); status is None on errors
+        host = urlparse(url).netloc
+        started = time.monotonic()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10, allow_redirects=True) as response:
-                    if response.status == 200:
-                        return await response.text()
-                    else:
-                        logger.error(f"Non-200 response for {url}: {response.status}")
-                        return None
+            session = self.get_session()
+            async with session.get(url, headers=headers, allow_redirects=True) as response:
+                retry_after = parse_retry_after(response.headers.get('Retry-After')) if response.status in THROTTLED_STATUS else 0.0
+                latency = time.monotonic() - started
+                self.scheduler.record(host, latency, response.status, retry_after)
+                self.metrics.observe('fetch_seconds', latency)
+                self.metrics.increment('fetch_requests_total', status=response.status)
+                if response.status in THROTTLED_STATUS:
+                    raise Throttled(url, response.status, retry_after)
+                if response.status == 200:
+                    return response.status, await self.read_text(url, response), response.headers
+                if response.status != 304:
+                    logger.error(f"Non-200 response for {url}: {response.status}")
+                return response.status, None, response.headers
+        except Throttled:
+            raise
         except Exception as e:
+            self.scheduler.record(host)
+            self.metrics.increment('fetch_errors_total', error=type(e).__name__)
             logger.error(f"Error fetching {url}: {e}")
             logger.debug(traceback.format_exc())
+            return None, None, {}
+
+    async def read_text(self, url, response):
+        # Headers are checked before any of the body is read, and the body is decoded only once accepted
+        content_type = response.headers.get('Content-Type')
+        if content_type and response.content_type not in self.config.allowed_content_types:
+            self.skip('content_type')
+            logger.debug(f"Skipping {url}: content type {response.content_type}")
+            return None
+        limit = self.config.max_response_bytes
+        if limit is not None and response.content_length is not None and response.content_length > limit:
+            self.skip('size')
+            logger.debug(f"Skipping {url}: {response.content_length} bytes")
             return None
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if limit is not None and size > limit:
+                self.skip('size')
+                logger.debug(f"Skipping {url}: body exceeds {limit} bytes")
+                return None
+            chunks.append(chunk)
+        self.metrics.observe('fetch_bytes', size, buckets=BYTE_BUCKETS)
+        self.metrics.increment('fetch_bytes_total', size)
+        return self.decode(b''.join(chunks), response.charset)
+
+    def decode(self, body, charset=None):
+        # Header charset, then a <meta> declaration near the top of the page, then UTF-8
+        if not charset:
+            match = META_CHARSET.search(body, 0, 2048)
+            charset = match.group(1).decode('ascii') if match else None
+        try:
+            codecs.lookup(charset or 'utf-8')
+        except LookupError:
+            charset = None
+        return body.decode(charset or 'utf-8', errors='replace')
+
+    def is_skipped(self, url):
+        extension = os.path.splitext(urlparse(url).path)[1].lower()
+        return extension in self.config.skip_extensions
+
+    def skip(self, reason):
+        self.skipped[reason] += 1
+        self.metrics.increment('fetch_skipped_total', reason=reason)
+
+    async def parse(self, url, html_content):
+        with self.metrics.timer('parse_seconds'):
+            return await self.parser.parse(url, html_content)
 
     async def is_relevant(self, text):
-        content_embedding = self.get_embedding(text)
-        similarity = self.cosine_similarity(self.instructions_embedding, content_embedding)
+        similarity = self.score_texts([text])[0]
         return similarity >= self.config.relevance_threshold
 
-    async def extract_and_enqueue_links(self, html_content, base_url):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        for tag in soup.find_all('a', href=True):
-            href = tag['href']
-            if href.startswith(('mailto:', 'tel:', 'javascript:', '#')):
-                continue
-            full_url = urljoin(base_url, href)
-            # Normalize URL (remove fragment identifiers)
-            full_url = full_url.split('#')[0]
-            full_url = full_url.rstrip('/')
-            if full_url not in self.visited:
-                # Estimate the relevance of the link based on the link text
-                link_text = tag.get_text(strip=True)
-                priority = await self.estimate_link_priority(link_text)
-                await self.enqueue_url(full_url, priority)
+    async def extract_and_enqueue_links(self, html_content, base_url, depth=1):
+        page = await self.parse(base_url, html_content)
+        await self.enqueue_links(page.links, depth)
 
+    async def enqueue_links(self, page_links, depth=1):
+        links = []
+        for href, link_text in page_links:
+            full_url = canonicalize_url(href)
+            if urlparse(full_url).scheme not in ('http', 'https'):
+                continue
+            if self.is_skipped(full_url):
+                self.skip('extension')
+                continue
+            # Pending URLs are still scored so a better anchor can raise their priority
+            if not self.frontier.visited(full_url):
+                links.append((full_url, link_text))
+        # Estimate the relevance of every link from its text in one batch
+        link_texts = list(dict.fromkeys(text for _, text in links if text))
+        similarities = dict(zip(link_texts, self.score_texts(link_texts)))
+        for full_url, link_text in links:
+            # Priority queue uses lower numbers as higher priority
+            priority = 1.0 - float(similarities[link_text]) if link_text else 1.0
+            await self.enqueue_url(full_url, priority, depth)
 
     async def estimate_link_priority(self, link_text):
         if not link_text:
             return 1.0  # Lowest priority
-        link_embedding = self.get_embedding(link_text)
-        similarity = self.cosine_similarity(self.instructions_embedding, link_embedding)
         # Priority queue uses lower numbers as higher priority
-        return 1.0 - similarity  # Lower value means higher priority
+        return 1.0 - float(self.score_texts([link_text])[0])  # Lower value means higher priority
 
-    async def enqueue_url(self, url, priority):
-        url_hash = hashlib.sha256(url.encode()).hexdigest()
-        if url_hash not in self.visited:
-            await self.url_queue.put((priority, url))
-            logger.info(f"Enqueued URL: {url} with priority {priority}")
+    async def enqueue_url(self, url, priority, depth=0):
+        if self.frontier.put(url, priority, depth):
+            logger.debug(f"Enqueued URL: {url} with priority {priority}")
 
-    # Add caching for embeddings
     def get_embedding(self, text):
         return self.embeddings_model.embed_query(text)
 
+    def embed_texts(self, texts):
+        # Chunk to stay within the provider's per-request input limit
+        batch_size = self.config.embedding_batch_size
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.append(np.asarray(self.embeddings_model.embed_documents(texts[start:start + batch_size]), dtype=np.float32))
+        return np.concatenate(vectors)
+
+    def fit(self, texts):
+        # Models with corpus statistics, such as HashingEmbeddings' IDF, learn from every crawled page
+        if hasattr(self.embeddings_model, 'partial_fit'):
+            self.embeddings_model.partial_fit(texts)
+
+    def score_texts(self, texts):
+        # Cosine similarity of every text to the instructions as one matrix-vector product
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        self.metrics.observe('scored_texts', len(texts), buckets=(1, 10, 50, 100, 500, 1000, 5000))
+        with self.metrics.timer('score_seconds'):
+            if hasattr(self.embeddings_model, 'similarities'):
+                return self.embeddings_model.similarities(texts, self.instructions_vector)
+            return self.score_vectors(self.embed_texts(texts))
+
+    def score_vectors(self, matrix):
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.0
+        return (matrix @ self.instructions_vector) / norms
+
+    def normalize(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
     # Add cosine similarity function
     def cosine_similarity(self, a, b):
         a = np.array(a)
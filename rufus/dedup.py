@@ -0,0 +1,64 @@
+# rufus/dedup.py
+
+import re
+import zlib
+import numpy as np
+
+TOKEN = re.compile(r'\w+')
+BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+def shingle_hashes(text, size=3):
+    # 64-bit hashes of overlapping word n-grams; zlib.crc32 keeps them stable across processes
+    tokens = TOKEN.findall(text.lower())
+    if not tokens:
+        return np.zeros(0, dtype=np.uint64)
+    shingles = [' '.join(tokens[i:i + size]).encode('utf-8') for i in range(max(1, len(tokens) - size + 1))]
+    return np.array([zlib.crc32(shingle) | zlib.crc32(shingle, 0x9E3779B9) << 32 for shingle in shingles], dtype=np.uint64)
+
+
+def simhash(text, size=3):
+    hashes = shingle_hashes(text, size)
+    if not len(hashes):
+        return 0
+    bits = ((hashes[:, np.newaxis] >> BIT_SHIFTS) & np.uint64(1)).astype(np.int32)
+    votes = 2 * bits.sum(axis=0) - len(hashes)
+    return int(sum(1 << i for i in np.flatnonzero(votes > 0)))
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex:
+    # LSH over 64-bit SimHash fingerprints. The fingerprint is split into max_distance + 1 bands,
+    # so any two fingerprints within max_distance bits agree exactly on at least one band.
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = 64 // bands
+        self.bands = [(i * width, (1 << (64 - i * width if i == bands - 1 else width)) - 1) for i in range(bands)]
+        self.tables = [{} for _ in self.bands]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def query(self, fingerprint):
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for candidate, key in table.get((fingerprint >> shift) & mask, ()):
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, fingerprint, key):
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, key))
+        self.size += 1
+
+    def find_or_add(self, fingerprint, key):
+        # Key of an earlier near-duplicate, or None after indexing this fingerprint
+        existing = self.query(fingerprint)
+        if existing is None:
+            self.add(fingerprint, key)
+        return existing
@@ -0,0 +1,358 @@
+# rufus/distributed.py
+
+import asyncio
+import copy
+import heapq
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+from .crawler import IntelligentCrawler
+from .frontier import FingerprintSet, canonicalize_url, url_fingerprint
+from .politeness import Throttled
+from .state import CrawlState
+from .store import PageStore
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(url, shards, by='url'):
+    key = urlsplit(url).netloc if by == 'host' else url
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+
+class SharedFrontier:
+    # URLFrontier for one shard of a multi-process crawl, backed by a sqlite (WAL) file all shards share.
+    # Every URL has one row, so a URL is admitted once across all processes; each process claims the
+    # best pending URLs of its own shard. Discovered links are buffered and written when a page is done,
+    # in the same transaction that retires it, so the crawl is finished exactly when no URL is pending
+    # and no process holds a claimed one.
+    def __init__(self, path, shard, shards, shard_by='url', batch_size=8, poll_interval=0.05):
+        self.path = path
+        self.shard = shard
+        self.shards = shards
+        self.shard_by = shard_by
+        self.batch_size = batch_size  # URLs claimed per query
+        self.poll_interval = poll_interval  # seconds between looks at other shards' progress
+        self.db = None  # Opened lazily, so the frontier can be built before it reaches its process
+        self.heap = []  # Claimed URLs not yet handed out, as (priority, order, depth, url)
+        self.order = 0
+        self.outbox = {}  # Discovered URL -> (priority, depth), not yet written
+        self.sent = FingerprintSet()  # URLs this process has already written
+        self.claimed_urls = FingerprintSet()
+        self.unfinished = 0  # Claimed here and not yet task_done()
+        self.claimed = 0
+        self.refill = None
+
+    @classmethod
+    def create(cls, path, shards):
+        db = sqlite3.connect(path)
+        try:
+            cls.create_tables(db)
+            db.executemany('INSERT OR REPLACE INTO workers (shard, in_flight) VALUES (?, 0)', [(shard,) for shard in range(shards)])
+            db.execute("INSERT OR REPLACE INTO control (key, value) VALUES ('pages', 0)")
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def create_tables(db):
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                priority REAL NOT NULL,
+                depth INTEGER NOT NULL,
+                claimed INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        db.execute('CREATE INDEX IF NOT EXISTS pending ON urls (shard, claimed, priority)')
+        db.execute('CREATE TABLE IF NOT EXISTS workers (shard INTEGER PRIMARY KEY, in_flight INTEGER NOT NULL)')
+        # Untyped values, so the page counter compares as a number
+        db.execute('CREATE TABLE IF NOT EXISTS control (key TEXT PRIMARY KEY, value)')
+
+    def get_db(self):
+        if self.db is None:
+            # Transactions are explicit so claims can take the write lock before reading
+            self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.create_tables(self.db)
+        return self.db
+
+    def __len__(self):
+        return len(self.heap)
+
+    def qsize(self):
+        return len(self.heap)
+
+    def empty(self):
+        return not self.heap
+
+    def visited(self, url):
+        url = canonicalize_url(url)
+        fingerprint = url_fingerprint(url)
+        if fingerprint in self.claimed_urls:
+            return True
+        row = self.get_db().execute('SELECT claimed FROM urls WHERE url = ?', (url,)).fetchone()
+        if row is not None and row[0]:
+            self.claimed_urls.add(fingerprint)
+            return True
+        return False
+
+    def put(self, url, priority, depth=0):
+        # True when the URL is new to this process; other shards may already know it
+        url = canonicalize_url(url)
+        pending = self.outbox.get(url)
+        if pending is not None:
+            self.outbox[url] = (min(priority, pending[0]), min(depth, pending[1]))
+            return False
+        self.outbox[url] = (priority, depth)
+        return self.sent.add(url_fingerprint(url))
+
+    def requeue(self, url, priority, depth=0):
+        # A deferred URL stays claimed by this process
+        self.push(url, priority, depth)
+
+    def push(self, url, priority, depth):
+        self.order += 1
+        heapq.heappush(self.heap, (priority, self.order, depth, url))
+
+    def write_outbox(self, db):
+        if self.outbox:
+            db.executemany(
+                'INSERT INTO urls (url, shard, priority, depth) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(url) DO UPDATE SET priority = min(priority, excluded.priority), '
+                'depth = min(depth, excluded.depth) WHERE claimed = 0',
+                [(url, shard_for(url, self.shards, self.shard_by), priority, depth) for url, (priority, depth) in self.outbox.items()],
+            )
+            self.outbox = {}
+
+    def commit(self, claim=0):
+        db = self.get_db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            self.write_outbox(db)
+            rows = []
+            if claim:
+                rows = db.execute(
+                    'SELECT url, priority, depth FROM urls WHERE shard = ? AND claimed = 0 ORDER BY priority LIMIT ?',
+                    (self.shard, claim),
+                ).fetchall()
+                db.executemany('UPDATE urls SET claimed = 1 WHERE url = ?', [(url,) for url, _, _ in rows])
+            db.execute('UPDATE workers SET in_flight = ? WHERE shard = ?', (self.unfinished + len(rows), self.shard))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        for url, priority, depth in rows:
+            self.claimed_urls.add(url_fingerprint(url))
+            self.push(url, priority, depth)
+        self.unfinished += len(rows)
+        self.claimed += len(rows)
+        return len(rows)
+
+    async def get(self):
+        while True:
+            if self.heap:
+                priority, _, depth, url = heapq.heappop(self.heap)
+                return priority, depth, url
+            if self.refill is not None:
+                await self.refill.wait()
+                continue
+            # One worker queries for the shard while the rest wait on it
+            self.refill = asyncio.Event()
+            try:
+                if not self.commit(claim=self.batch_size):
+                    await asyncio.sleep(self.poll_interval)
+            finally:
+                self.refill.set()
+                self.refill = None
+
+    def task_done(self):
+        if self.unfinished <= 0:
+            raise ValueError('task_done() called too many times')
+        self.unfinished -= 1
+        # Links found on the page become visible before the page stops counting as in flight
+        self.commit()
+
+    def finished(self):
+        if self.unfinished:
+            return False
+        self.commit()
+        db = self.get_db()
+        if db.execute("SELECT 1 FROM control WHERE key = 'aborted'").fetchone():
+            raise RuntimeError('Distributed crawl aborted by another shard')
+        if db.execute('SELECT 1 FROM urls WHERE claimed = 0 LIMIT 1').fetchone():
+            return False
+        return not db.execute('SELECT 1 FROM workers WHERE in_flight > 0 LIMIT 1').fetchone()
+
+    async def join(self):
+        while not self.finished():
+            await asyncio.sleep(self.poll_interval)
+
+    def take_page(self, max_pages):
+        # One page of the crawl-wide budget, shared by every shard
+        cursor = self.get_db().execute("UPDATE control SET value = value + 1 WHERE key = 'pages' AND value < ?", (max_pages,))
+        return cursor.rowcount == 1
+
+    def return_page(self):
+        self.get_db().execute("UPDATE control SET value = value - 1 WHERE key = 'pages'")
+
+    def abort(self):
+        self.get_db().execute("INSERT OR REPLACE INTO control (key, value) VALUES ('aborted', ?)", (str(self.shard),))
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def stats(self):
+        return {
+            'shard': self.shard,
+            'claimed': self.claimed,
+            'pending': len(self.heap),
+            'unfinished': self.unfinished,
+        }
+
+
+def crawl_shard(base_url, instructions, config, frontier_path, shard, shards):
+    # Entry point of a worker process
+    return asyncio.run(run_shard(base_url, instructions, config, frontier_path, shard, shards))
+
+
+class ShardCrawler(IntelligentCrawler):
+    # Draws every page from the budget shared through the frontier, so shards that own more
+    # of the site (all of it, when a single host is sharded by host) can crawl more of it
+    async def fetch_and_process(self, url, depth=0):
+        if not self.frontier.take_page(self.config.max_pages):
+            # Other shards spent the rest; what is left in this shard is skipped and drained
+            self.max_pages = self.pages_crawled
+            return
+        try:
+            await super().fetch_and_process(url, depth)
+        except Throttled:
+            self.frontier.return_page()
+            raise
+
+
+async def run_shard(base_url, instructions, config, frontier_path, shard, shards):
+    if config.embeddings_factory is not None:
+        config.embeddings_model = config.embeddings_factory()
+    crawler = ShardCrawler(base_url, instructions, config)
+    crawler.frontier = SharedFrontier(frontier_path, shard, shards, config.shard_by, batch_size=config.concurrency)
+    try:
+        await crawler.crawl()
+    except BaseException:
+        crawler.frontier.abort()
+        raise
+    finally:
+        crawler.frontier.close()
+    crawler.relevant_pages.close(remove=False)
+    return {
+        'path': crawler.relevant_pages.path,
+        'pages_crawled': crawler.pages_crawled,
+        'aliases': crawler.aliases,
+        'frontier': crawler.frontier.stats(),
+    }
+
+
+class DistributedCrawler:
+    # Stands in for IntelligentCrawler, crawling with config.crawl_processes processes. Each process runs
+    # an ordinary crawler on its shard of a SharedFrontier; their relevant pages are merged into one store.
+    def __init__(self, base_url, instructions, config, processes=None):
+        self.base_url = base_url.rstrip('/')
+        self.instructions = instructions
+        self.config = config
+        self.processes = processes or config.crawl_processes
+        self.pages_crawled = 0
+        self.relevant_pages = PageStore(self.config.page_store_dir)
+        self.aliases = {}
+        self.crawl_state = CrawlState(self.config.crawl_state_path, self.base_url) if self.config.crawl_state_path else None
+
+    def shard_config(self):
+        # Metrics recorded in a child would be lost with it; the parent records the merged totals.
+        # Children don't rank, and rebuild the crawl model from embeddings_factory when there is one.
+        config = copy.copy(self.config)
+        config.crawl_processes = 1
+        config.metrics = None
+        config.ranking_embeddings_model = None
+        if config.embeddings_factory is not None:
+            config.embeddings_model = None
+        else:
+            try:
+                pickle.dumps(config.embeddings_model)
+            except Exception as e:
+                raise TypeError(
+                    f"embeddings_model can't be sent to crawl processes ({e}); "
+                    f"set embeddings_factory to a picklable callable that builds it"
+                ) from e
+        if config.shard_by == 'url':
+            # Every process sees every host, so each gets its share of the per-host politeness
+            config.per_host_concurrency = max(1, config.per_host_concurrency // self.processes)
+            config.per_host_initial_concurrency = max(1, config.per_host_initial_concurrency // self.processes)
+            config.politeness_delay = config.politeness_delay * self.processes
+        return config
+
+    async def crawl(self):
+        metrics = self.config.metrics
+        directory = tempfile.mkdtemp(prefix='rufus-frontier-', dir=self.config.page_store_dir)
+        frontier_path = os.path.join(directory, 'frontier.sqlite')
+        started = time.monotonic()
+        try:
+            SharedFrontier.create(frontier_path, self.processes)
+            # Seeded before any worker starts, so none can find the frontier empty and stop early
+            seed = SharedFrontier(frontier_path, 0, self.processes, self.config.shard_by)
+            seed.put(self.base_url, 0.0, 0)
+            seed.commit()
+            seed.close()
+            config = self.shard_config()
+            loop = asyncio.get_running_loop()
+            # Spawned, not forked, so children start without this process' event loop and threads
+            with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+                shards = [
+                    loop.run_in_executor(executor, crawl_shard, self.base_url, self.instructions, config, frontier_path, shard, self.processes)
+                    for shard in range(self.processes)
+                ]
+                results = await asyncio.gather(*shards, return_exceptions=True)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+            self.merge(results)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        logger.info(
+            f"Crawled {self.pages_crawled} pages with {self.processes} processes in {time.monotonic() - started:.1f}s, "
+            f"{len(self.relevant_pages)} relevant"
+        )
+        if metrics is not None:
+            metrics.increment('pages_crawled_total', self.pages_crawled)
+            metrics.increment('pages_relevant_total', len(self.relevant_pages))
+
+    def merge(self, results):
+        paths = [result['path'] for result in results if result['path']]
+        self.relevant_pages.close()
+        self.relevant_pages = PageStore.merge(paths, self.config.page_store_dir)
+        for path in paths:
+            os.remove(path)
+        for result in results:
+            self.pages_crawled += result['pages_crawled']
+            for url, duplicates in result['aliases'].items():
+                self.aliases.setdefault(url, []).extend(duplicates)
+            logger.info(f"Shard stats: {result['frontier']}")
+
+    async def reset(self):
+        self.pages_crawled = 0
+        self.relevant_pages.close()
+        self.relevant_pages = PageStore(self.config.page_store_dir)
+        self.aliases = {}
+
+    async def close(self):
+        pass
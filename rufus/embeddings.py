@@ -0,0 +1,223 @@
+# rufus/embeddings.py
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import zlib
+from collections import OrderedDict
+import numpy as np
+from .metrics import NULL_METRICS
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r'\w+')
+
+
+def get_model_id(model):
+    # Cache entries are only valid for the model that produced them
+    for attr in ('model', 'model_name'):
+        name = getattr(model, attr, None)
+        if isinstance(name, str) and name:
+            return f'{type(model).__name__}:{name}'
+    return type(model).__name__
+
+
+class EmbeddingCache:
+    def __init__(self, model_id, max_size=10000, path=None):
+        self.model_id = model_id
+        self.max_size = max_size
+        self.path = path
+        self.memory = OrderedDict()  # In-memory LRU tier
+        self.db = None  # On-disk tier, opened lazily
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f'{self.model_id}\0{text}'.encode('utf-8')).digest()
+
+    def get_db(self):
+        if self.path is None:
+            return None
+        if self.db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)')
+        return self.db
+
+    def remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def get_many(self, texts):
+        keys = [self.key(text) for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+        for i, key in enumerate(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                results[i] = vector
+            else:
+                missing.setdefault(key, []).append(i)
+        db = self.get_db()
+        if db is not None and missing:
+            found = {}
+            missing_keys = list(missing)
+            # Stay well below sqlite's bound-parameter limit
+            for start in range(0, len(missing_keys), 500):
+                chunk = missing_keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for key, blob in db.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', chunk):
+                    found[bytes(key)] = np.frombuffer(blob, dtype=np.float32)
+            for key, vector in found.items():
+                self.remember(key, vector)
+                for i in missing.pop(key):
+                    self.disk_hits += 1
+                    results[i] = vector
+        self.misses += sum(len(indexes) for indexes in missing.values())
+        return results
+
+    def put(self, text, embedding):
+        self.put_many([text], [embedding])
+
+    def put_many(self, texts, embeddings):
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            key = self.key(text)
+            vector = np.asarray(embedding, dtype=np.float32)
+            self.remember(key, vector)
+            rows.append((key, vector.tobytes()))
+        db = self.get_db()
+        if db is not None and rows:
+            db.executemany('INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)', rows)
+            db.commit()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / total if total else 0.0,
+            'memory_size': len(self.memory),
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class CachedEmbeddings:
+    # Wraps an embeddings model so only cache misses reach the provider
+    def __init__(self, model, cache, metrics=None):
+        self.model = model
+        self.cache = cache
+        self.metrics = metrics or NULL_METRICS
+
+    def embed_query(self, text):
+        vector = self.cache.get(text)
+        if vector is None:
+            self.metrics.increment('embedding_cache_misses_total')
+            self.metrics.increment('embedding_requests_total')
+            self.metrics.increment('embedding_texts_total')
+            with self.metrics.timer('embedding_request_seconds'):
+                vector = np.asarray(self.model.embed_query(text), dtype=np.float32)
+            self.cache.put(text, vector)
+        else:
+            self.metrics.increment('embedding_cache_hits_total')
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        misses = sum(1 for vector in vectors if vector is None)
+        self.metrics.increment('embedding_cache_hits_total', len(texts) - misses)
+        self.metrics.increment('embedding_cache_misses_total', misses)
+        if missing:
+            self.metrics.increment('embedding_requests_total')
+            self.metrics.increment('embedding_texts_total', len(missing))
+            with self.metrics.timer('embedding_request_seconds'):
+                embedded = self.model.embed_documents(missing)
+            self.cache.put_many(missing, embedded)
+            lookup = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(missing, embedded)}
+            vectors = [vector if vector is not None else lookup[text] for text, vector in zip(texts, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+
+class HashingEmbeddings:
+    # Offline embeddings for crawl-time scoring: hashed unigram/bigram counts, with IDF weights
+    # fitted incrementally over the crawled pages. Queries are left unweighted, so document
+    # vectors can be compared with a query embedded before any page was seen.
+    local = True  # Cheaper than a cache lookup and drifts with the IDF, so never cached
+
+    def __init__(self, n_features=2 ** 12, bigrams=True):
+        self.n_features = n_features
+        self.bigrams = bigrams
+        self.model = f'hashing-{n_features}{"-bigrams" if bigrams else ""}'
+        self.document_frequency = np.zeros(n_features, dtype=np.float32)
+        self.documents = 0
+
+    def term_frequencies(self, texts):
+        # Sparse (rows, columns, sublinear signed term frequencies) for a batch of texts
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            tokens = TOKEN.findall(text.lower())
+            if self.bigrams:
+                tokens += [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+            hashes.extend(zlib.crc32(token.encode('utf-8')) for token in tokens)
+            rows.extend([row] * len(tokens))
+        hashes = np.array(hashes, dtype=np.int64)
+        # The sign bit keeps colliding features from only adding up
+        signs = np.where(hashes & (1 << 31), -1.0, 1.0)
+        keys, inverse = np.unique(np.array(rows, dtype=np.int64) * self.n_features + hashes % self.n_features, return_inverse=True)
+        counts = np.bincount(inverse, weights=signs, minlength=len(keys))
+        return keys // self.n_features, keys % self.n_features, np.copysign(np.log1p(np.abs(counts)), counts)
+
+    def partial_fit(self, texts):
+        _, columns, _ = self.term_frequencies(texts)
+        np.add.at(self.document_frequency, columns, 1)
+        self.documents += len(texts)
+        return self
+
+    def idf(self):
+        if not self.documents:
+            return np.ones(self.n_features, dtype=np.float32)
+        return (np.log((1.0 + self.documents) / (1.0 + self.document_frequency)) + 1.0).astype(np.float32)
+
+    def transform(self, texts, weighted=True):
+        rows, columns, frequencies = self.term_frequencies(texts)
+        if weighted:
+            frequencies = frequencies * self.idf()[columns]
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        matrix[rows, columns] = frequencies
+        return matrix
+
+    def similarities(self, texts, vector):
+        # Cosine similarity of each text to a unit-length query vector, without densifying the texts
+        rows, columns, frequencies = self.term_frequencies(texts)
+        weights = frequencies * self.idf()[columns]
+        dots = np.bincount(rows, weights=weights * vector[columns], minlength=len(texts))
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(texts)))
+        norms[norms == 0] = 1.0
+        return (dots / norms).astype(np.float32)
+
+    def embed_documents(self, texts):
+        return self.transform(texts)
+
+    def embed_query(self, text):
+        return self.transform([text], weighted=False)[0]
@@ -1,55 +1,83 @@
 # rufus/extractor.py
 
 import asyncio
-from bs4 import BeautifulSoup
 import logging
-import re
 import json
+import time
+from .parser import ParsedPage, PageParser, parse_page
+from .chunker import Chunker
+from .dedup import SimHashIndex, simhash
+from .metrics import NULL_METRICS
 
 logger = logging.getLogger(__name__)
 
 class ExtractorAgent:
-    def __init__(self, granularity='paragraph'):
+    def __init__(self, granularity='paragraph', parser_backend='auto', parser=None, dedup_distance=None, metrics=None,
+                 max_tokens=256, overlap=32, tokenizer='cl100k_base'):
         self.granularity = granularity
+        self.chunker = Chunker(granularity, max_tokens=max_tokens, overlap=overlap, tokenizer=tokenizer)
+        self.metrics = metrics or NULL_METRICS
+        self.parser = parser or PageParser(parser_backend)
+        self.dedup_distance = dedup_distance  # SimHash bits for passage-level dedup; None keeps every passage
 
-    async def extract_data(self, pages):
-        tasks = [self.extract_from_page(url, content) for url, content in pages]
-        extracted_data = await asyncio.gather(*tasks)
-        return [data for data in extracted_data if data]
+    async def extract_data(self, pages, crawl_state=None):
+        return [data async for data in self.iter_data(pages, crawl_state=crawl_state)]
 
-    async def extract_from_page(self, url, content):
+    async def iter_data(self, pages, window=32, crawl_state=None):
+        # Pages are pulled lazily, a window at a time, so a disk-backed store is never loaded whole
+        passages = SimHashIndex(self.dedup_distance) if self.dedup_distance is not None else None
+        batch = []
+        for url, content in pages:
+            batch.append(self.extract_from_page(url, content, crawl_state))
+            if len(batch) >= window:
+                for data in await asyncio.gather(*batch):
+                    if data and self.drop_duplicate_passages(data, passages):
+                        yield data
+                batch = []
+        for data in await asyncio.gather(*batch):
+            if data and self.drop_duplicate_passages(data, passages):
+                yield data
+
+    def drop_duplicate_passages(self, data, passages):
+        # Boilerplate repeated across pages is kept only where it was first seen
+        if passages is None:
+            return True
+        count = len(data['content'])
+        data['content'] = [text for text in data['content'] if passages.find_or_add(simhash(text), data['url']) is None]
+        self.metrics.increment('passages_duplicate_total', count - len(data['content']))
+        return bool(data['content'])
+
+    async def extract_from_page(self, url, content, crawl_state=None):
+        started = time.perf_counter()
         try:
-            text = self.extract_text(content)
-            if self.granularity == 'sentence':
-                texts = self.extract_sentences(text)
-            else:
-                texts = self.extract_paragraphs(text)
+            # Unchanged pages from an earlier run keep their extracted content
+            texts = crawl_state.get_extracted(url, self.chunker.key) if crawl_state is not None else None
+            # Pages from the crawler arrive already parsed; raw HTML is parsed here
+            page = content if isinstance(content, ParsedPage) else await self.parser.parse(url, content)
+            if texts is None:
+                texts = self.chunker.chunk(page)
+                if crawl_state is not None:
+                    crawl_state.save_extracted(url, self.chunker.key, texts)
             structured_data = {
                 'url': url,
                 'content': texts
             }
+            if page.relevance is not None:
+                structured_data['relevance'] = page.relevance
+            self.metrics.increment('passages_total', len(texts))
+            self.metrics.observe('extract_seconds', time.perf_counter() - started)
             return structured_data
         except Exception as e:
+            self.metrics.increment('extract_errors_total')
             logger.error(f"Error extracting from {url}: {e}")
             return None
 
     def extract_text(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        # Remove unwanted tags
-        for script_or_style in soup(["script", "style", "header", "footer", "nav", "aside"]):
-            script_or_style.decompose()
-        text = soup.get_text(separator=' ')
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        return parse_page('', html_content, self.parser.backend).text
 
     def extract_sentences(self, text):
-        import nltk
-        nltk.download('punkt', quiet=True)
-        from nltk.tokenize import sent_tokenize
-        sentences = sent_tokenize(text)
-        return [sentence.strip() for sentence in sentences if sentence.strip()]
+        return self.chunker.sentences(text)
 
     def extract_paragraphs(self, text):
-        paragraphs = text.split('\n\n')
-        paragraphs = [para.strip() for para in paragraphs if para.strip()]
-        return paragraphs
+        # Plain text has no block structure left; blank lines are the only paragraph breaks
+        return [passage for paragraph in text.split('\n\n') for passage in self.chunker.chunk_text(paragraph)]
@@ -0,0 +1,211 @@
+# rufus/frontier.py
+
+import asyncio
+import functools
+import hashlib
+import heapq
+import itertools
+import sys
+from array import array
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+TRACKING_PARAMS = {
+    'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', '_hsenc', '_hsmi', 'igshid', 'ref_src',
+}
+TRACKING_PREFIXES = ('utm_',)
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+@functools.lru_cache(maxsize=65536)  # Navigation links repeat on every page
+def canonicalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if ':' in host:
+        host = f'[{host}]'  # IPv6 literal
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f'{host}:{port}'
+    query = ''
+    if parts.query:
+        query = urlencode(sorted(
+            (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not is_tracking_param(name)
+        ))
+    # Fragments never change the document and trailing slashes are treated as equivalent
+    return urlunsplit((scheme, netloc, parts.path.rstrip('/'), query, ''))
+
+
+def url_fingerprint(url):
+    fingerprint = int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+    return fingerprint or 1  # 0 marks an empty slot
+
+
+class FingerprintSet:
+    # Open-addressing hash set of 64-bit integers: 8 bytes per slot, at most half full
+    def __init__(self, capacity=1024):
+        size = 1
+        while size < capacity * 2:
+            size <<= 1
+        self.table = array('Q', bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, fingerprint):
+        table, mask = self.table, self.mask
+        i = fingerprint & mask
+        while True:
+            slot = table[i]
+            if slot == fingerprint:
+                return True
+            if slot == 0:
+                return False
+            i = (i + 1) & mask
+
+    def add(self, fingerprint):
+        if (self.count + 1) * 2 > len(self.table):
+            self.grow()
+        table, mask = self.table, self.mask
+        i = fingerprint & mask
+        while True:
+            slot = table[i]
+            if slot == fingerprint:
+                return False
+            if slot == 0:
+                table[i] = fingerprint
+                self.count += 1
+                return True
+            i = (i + 1) & mask
+
+    def grow(self):
+        old = self.table
+        self.table = array('Q', bytes(16 * len(old)))
+        self.mask = len(self.table) - 1
+        self.count = 0
+        for fingerprint in old:
+            if fingerprint:
+                self.add(fingerprint)
+
+    @property
+    def nbytes(self):
+        return self.table.itemsize * len(self.table)
+
+
+class URLFrontier:
+    # Priority frontier with the asyncio.Queue protocol (get/task_done/join).
+    # Every URL is admitted once; rediscovering a pending URL only lowers its priority.
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.seen = FingerprintSet()
+        self.heap = []
+        self.entries = {}  # Pending URL -> heap entry [priority, order, depth, url]
+        self.counter = itertools.count()
+        self.unfinished = 0
+        self.dropped = 0
+        self.not_empty = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.finished.set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def qsize(self):
+        return len(self.entries)
+
+    def empty(self):
+        return not self.entries
+
+    def visited(self, url):
+        # Seen before and no longer waiting in the frontier
+        url = canonicalize_url(url)
+        return url not in self.entries and url_fingerprint(url) in self.seen
+
+    def put(self, url, priority, depth=0):
+        url = canonicalize_url(url)
+        entry = self.entries.get(url)
+        if entry is not None:
+            if priority < entry[0]:
+                # Decrease-key: retire the old heap entry and push the improved one
+                entry[-1] = None
+                self.push(url, priority, min(depth, entry[2]))
+            return False
+        if not self.seen.add(url_fingerprint(url)):
+            return False
+        self.push(url, priority, depth)
+        self.unfinished += 1
+        self.finished.clear()
+        if self.max_size and len(self.entries) > self.max_size + self.max_size // 4:
+            self.trim()
+        return True
+
+    def requeue(self, url, priority, depth=0):
+        # Back into the queue after a deferred attempt; the URL still counts as unfinished
+        if url not in self.entries:
+            self.push(url, priority, depth)
+
+    def push(self, url, priority, depth):
+        entry = [priority, next(self.counter), depth, url]
+        self.entries[url] = entry
+        heapq.heappush(self.heap, entry)
+        self.not_empty.set()
+
+    def pop(self):
+        while self.heap:
+            priority, _, depth, url = heapq.heappop(self.heap)
+            if url is not None:
+                del self.entries[url]
+                return priority, depth, url
+        return None
+
+    async def get(self):
+        while True:
+            item = self.pop()
+            if item is not None:
+                return item
+            self.not_empty.clear()
+            await self.not_empty.wait()
+
+    def task_done(self):
+        if self.unfinished <= 0:
+            raise ValueError('task_done() called too many times')
+        self.unfinished -= 1
+        if self.unfinished == 0:
+            self.finished.set()
+
+    async def join(self):
+        await self.finished.wait()
+
+    def trim(self):
+        # Keep only the max_size best URLs; dropped URLs stay in the seen-set
+        keep = heapq.nsmallest(self.max_size, self.entries.values())
+        dropped = len(self.entries) - len(keep)
+        self.heap = keep
+        heapq.heapify(self.heap)
+        self.entries = {entry[3]: entry for entry in keep}
+        self.dropped += dropped
+        self.unfinished -= dropped
+
+    def memory_usage(self):
+        pending = sum(sys.getsizeof(entry) + sys.getsizeof(entry[3]) for entry in self.entries.values())
+        return self.seen.nbytes + sys.getsizeof(self.heap) + sys.getsizeof(self.entries) + pending
+
+    def stats(self):
+        memory = self.memory_usage()
+        return {
+            'seen': len(self.seen),
+            'pending': len(self.entries),
+            'dropped': self.dropped,
+            'memory_bytes': memory,
+            'bytes_per_url': memory / len(self.seen) if len(self.seen) else 0.0,
+        }
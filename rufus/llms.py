@@ -3,7 +3,6 @@
 import os
 from dotenv import load_dotenv
 from langchain_community.llms import OpenAI
-import asyncio
 
 load_dotenv()
 
@@ -15,7 +14,5 @@ class AsyncOpenAI(OpenAI):
         super().__init__(openai_api_key=api_key, **kwargs)
 
     async def arun(self, *args, **kwargs):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None, lambda: self.run(*args, **kwargs)
-        )
+        # Uses the client's native async API instead of a thread-pool wrapper around the sync one
+        return await self.ainvoke(*args, **kwargs)
@@ -0,0 +1,219 @@
+# rufus/metrics.py
+
+import bisect
+import json
+import time
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+MAX_SPANS = 10000
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class NullMetrics:
+    # Default sink: every hook is a no-op, so uninstrumented runs only pay for the call
+    enabled = False
+
+    def increment(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        pass
+
+    def gauge(self, name, value, **labels):
+        pass
+
+    def span(self, name, **labels):
+        return NULL_SPAN
+
+    def timer(self, name, **labels):
+        return NULL_SPAN
+
+    def report(self):
+        return {}
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class Timer:
+    # Observes the duration of a with-block into a histogram
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Span(Timer):
+    # A pipeline stage: timed like a Timer and also kept, with its start offset, in the run report
+    def __exit__(self, *exc):
+        self.metrics.finish_span(self, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics(NullMetrics):
+    # In-process counters, gauges, histograms and stage spans for one or more runs
+    enabled = True
+
+    def __init__(self, namespace='rufus'):
+        self.namespace = namespace
+        self.started = time.perf_counter()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.spans = []
+        self.dropped_spans = 0
+
+    def key(self, name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = self.key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def gauge(self, name, value, **labels):
+        self.gauges[self.key(name, labels)] = value
+
+    def span(self, name, **labels):
+        return Span(self, name, labels)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def finish_span(self, span, seconds):
+        self.observe('span_seconds', seconds, span=span.name, **span.labels)
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append({
+                'name': span.name,
+                'labels': span.labels,
+                'start': round(span.started - self.started, 6),
+                'seconds': round(seconds, 6),
+            })
+        else:
+            self.dropped_spans += 1
+
+    def counter(self, name, **labels):
+        return self.counters.get(self.key(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get(self.key(name, labels))
+
+    @staticmethod
+    def format_key(name, labels):
+        return name + ('{' + ','.join(f'{key}={value}' for key, value in labels) + '}' if labels else '')
+
+    def report(self):
+        return {
+            'elapsed_seconds': time.perf_counter() - self.started,
+            'counters': {self.format_key(*key): value for key, value in sorted(self.counters.items())},
+            'gauges': {self.format_key(*key): value for key, value in sorted(self.gauges.items())},
+            'histograms': {self.format_key(*key): histogram.summary() for key, histogram in sorted(self.histograms.items())},
+            'spans': self.spans,
+            'dropped_spans': self.dropped_spans,
+        }
+
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def prometheus(self):
+        # Prometheus text exposition format (version 0.0.4)
+        lines = []
+
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+        def by_name(items):
+            grouped = {}
+            for (name, labels), value in sorted(items):
+                grouped.setdefault(name, []).append((labels, value))
+            return grouped.items()
+
+        for name, samples in by_name(self.counters.items()):
+            lines.append(f'# TYPE {self.namespace}_{name} counter')
+            lines.extend(f'{self.namespace}_{name}{labels_text(labels)} {value}' for labels, value in samples)
+        for name, samples in by_name(self.gauges.items()):
+            lines.append(f'# TYPE {self.namespace}_{name} gauge')
+            lines.extend(f'{self.namespace}_{name}{labels_text(labels)} {value}' for labels, value in samples)
+        for name, samples in by_name(self.histograms.items()):
+            lines.append(f'# TYPE {self.namespace}_{name} histogram')
+            for labels, histogram in samples:
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{self.namespace}_{name}_bucket{labels_text(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.namespace}_{name}_sum{labels_text(labels)} {histogram.sum}')
+                lines.append(f'{self.namespace}_{name}_count{labels_text(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.prometheus())
@@ -1,6 +1,8 @@
 # rufus/output.py
 
 import json
+import os
+import time
 
 class OutputAgent:
     def prepare_output(self, scored_data):
@@ -15,3 +17,38 @@ class OutputAgent:
             structured_documents.append(structured_doc)
         # Return the list of structured documents
         return structured_documents
+
+
+class JSONLWriter:
+    # Appends one JSON document per line, flushing every few documents or seconds
+    def __init__(self, path, flush_every=10, flush_interval=5.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, document):
+        self.file.write(json.dumps(document, ensure_ascii=False) + '\n')
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,114 @@
+# rufus/parser.py
+
+import asyncio
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+UNWANTED_TAGS = ["script", "style", "header", "footer", "nav", "aside"]
+BLOCK_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "tr", "pre", "blockquote", "dt", "dd", "caption"]
+SKIPPED_HREFS = ('mailto:', 'tel:', 'javascript:', '#')
+WHITESPACE = re.compile(r'\s+')
+
+
+def resolve_backend(backend='auto'):
+    # Prefer the C-backed lxml parser when it is installed
+    if backend != 'auto':
+        return backend
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+class ParsedPage:
+    # Everything the crawler and extractor need from a page, without the DOM
+    def __init__(self, url, title='', text='', links=None, blocks=None, relevance=None):
+        self.url = url
+        self.title = title
+        self.text = text
+        self.links = links or []  # (absolute url, anchor text)
+        self.blocks = blocks or []  # (tag name, text) for headings, paragraphs, list items and table rows
+        self.relevance = relevance  # Crawl-time similarity to the instructions, once scored
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'title': self.title,
+            'text': self.text,
+            'links': self.links,
+            'blocks': self.blocks,
+            'relevance': self.relevance,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['url'],
+            title=data.get('title', ''),
+            text=data.get('text', ''),
+            links=[tuple(link) for link in data.get('links', [])],
+            blocks=[tuple(block) for block in data.get('blocks', [])],
+            relevance=data.get('relevance'),
+        )
+
+
+def clean_text(text):
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def parse_page(url, html_content, backend='html.parser'):
+    soup = BeautifulSoup(html_content, backend)
+    title = clean_text(soup.title.get_text()) if soup.title else ''
+    # Links are collected before boilerplate removal so navigation is still crawled
+    links = []
+    for tag in soup.find_all('a', href=True):
+        href = tag['href'].strip()
+        if not href or href.startswith(SKIPPED_HREFS):
+            continue
+        links.append((urljoin(url, href).split('#')[0], tag.get_text(strip=True)))
+    for unwanted in soup(UNWANTED_TAGS):
+        unwanted.decompose()
+    blocks = []
+    for tag in soup.find_all(BLOCK_TAGS):
+        # Only the outermost block is kept so nested markup isn't repeated
+        if tag.find_parent(BLOCK_TAGS) is not None:
+            continue
+        block_text = clean_text(tag.get_text(separator=' '))
+        if block_text:
+            blocks.append((tag.name, block_text))
+    text = clean_text(soup.get_text(separator=' '))
+    return ParsedPage(url, title=title, text=text, links=links, blocks=blocks)
+
+
+class PageParser:
+    # Runs parse_page inline, or in a process pool so parsing never blocks the event loop.
+    # Only the compact ParsedPage travels back from the worker processes.
+    def __init__(self, backend='auto', workers=0):
+        self.backend = resolve_backend(backend)
+        self.workers = workers
+        self.executor = None
+
+    def get_executor(self):
+        if self.workers and self.executor is None:
+            # Forking from inside the running event loop would copy its threads and locks into the workers
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    async def parse(self, url, html_content):
+        executor = self.get_executor()
+        if executor is None:
+            return parse_page(url, html_content, self.backend)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, parse_page, url, html_content, self.backend)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,251 @@
+# rufus/politeness.py
+
+import asyncio
+import heapq
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_STATUS = {429, 503}
+MAX_RETRY_AFTER = 600  # seconds; longer requests are treated as this
+
+
+class Throttled(Exception):
+    # The host answered 429/503; the URL should be retried once Retry-After has passed
+    def __init__(self, url, status, retry_after=0.0):
+        super().__init__(f"{url} throttled with {status}")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return 0.0
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return 0.0
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class HostLimiter:
+    def __init__(self, limit, delay=0.0):
+        self.limit = float(limit)  # Concurrent requests allowed, grown and shrunk by AIMD
+        self.delay = delay  # Minimum seconds between request starts (Crawl-delay)
+        self.active = 0
+        self.next_start = 0.0
+        self.latency = None  # Moving average of response latency
+        self.baseline = None  # Recent low latency, i.e. the host when it is not queueing us
+        self.backoff_until = 0.0
+        self.deferred = []  # Heap of (priority, order, depth, url, requeue) waiting for a slot
+        self.timer = None
+        self.requests = 0
+        self.errors = 0
+
+    def slots(self):
+        return max(1, int(self.limit))
+
+    def ready(self, now):
+        return self.active < self.slots() and now >= self.next_start
+
+
+class HostScheduler:
+    # Per-host AIMD concurrency: each success adds about one slot per round trip, while errors,
+    # throttling and latency inflated well past the baseline halve the host's limit.
+    # URLs for a busy host are parked here and handed back to the frontier as slots free up.
+    def __init__(self, requeue, max_concurrency=8, initial_concurrency=2, min_delay=0.0, latency_factor=3.0, decrease=0.5, baseline_drift=0.01):
+        self.requeue = requeue  # Called with (url, priority, depth) when a deferred URL may run, unless defer() names another
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = min(initial_concurrency, max_concurrency)
+        self.min_delay = min_delay
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.baseline_drift = baseline_drift  # share of the gap to each slower response the baseline rises by
+        self.hosts = {}
+        self.order = 0
+
+    def get(self, host):
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            limiter = self.hosts[host] = HostLimiter(self.initial_concurrency, self.min_delay)
+        return limiter
+
+    def set_delay(self, host, delay):
+        limiter = self.get(host)
+        limiter.delay = max(self.min_delay, delay or 0.0)
+
+    def try_acquire(self, host):
+        limiter = self.get(host)
+        now = time.monotonic()
+        if not limiter.ready(now):
+            return False
+        limiter.active += 1
+        limiter.requests += 1
+        limiter.next_start = now + limiter.delay
+        return True
+
+    def defer(self, host, url, priority, depth, requeue=None):
+        # Crawls sharing the scheduler pass their own requeue so URLs return to the right frontier
+        limiter = self.get(host)
+        self.order += 1
+        heapq.heappush(limiter.deferred, (priority, self.order, depth, url, requeue or self.requeue))
+        self.wake(host)
+
+    def release(self, host):
+        limiter = self.get(host)
+        limiter.active -= 1
+        self.wake(host)
+
+    def wake(self, host):
+        # Hand back as many deferred URLs as the host can start now; otherwise retry when the delay ends
+        limiter = self.get(host)
+        if not limiter.deferred:
+            return
+        now = time.monotonic()
+        if now < limiter.next_start:
+            if limiter.timer is None:
+                limiter.timer = asyncio.get_running_loop().call_later(limiter.next_start - now, self.expire, host)
+            return
+        for _ in range(limiter.slots() - limiter.active):
+            if not limiter.deferred:
+                break
+            priority, _, depth, url, requeue = heapq.heappop(limiter.deferred)
+            requeue(url, priority, depth)
+
+    def drain(self, requeue=None):
+        # Removes and returns the (url, priority, depth) parked by one crawl, or by all without `requeue`
+        drained = []
+        for limiter in self.hosts.values():
+            if not limiter.deferred:
+                continue
+            kept = []
+            for item in limiter.deferred:
+                if requeue is None or item[4] == requeue:
+                    drained.append((item[3], item[0], item[2]))
+                else:
+                    kept.append(item)
+            heapq.heapify(kept)
+            limiter.deferred = kept
+        return drained
+
+    def expire(self, host):
+        self.get(host).timer = None
+        self.wake(host)
+
+    def record(self, host, latency=None, status=None, retry_after=0.0):
+        # Feedback from one response; status None means the request failed outright
+        limiter = self.get(host)
+        now = time.monotonic()
+        if status is None or status in THROTTLED_STATUS or status >= 500:
+            limiter.errors += 1
+            self.back_off(limiter, now)
+            if retry_after:
+                limiter.next_start = max(limiter.next_start, now + retry_after)
+            return
+        if status != 200 or latency is None:
+            # 304s, 404s and the like are cheap for the host and say nothing about page latency
+            limiter.limit = min(self.max_concurrency, limiter.limit + 1.0 / limiter.limit)
+            return
+        limiter.latency = latency if limiter.latency is None else 0.8 * limiter.latency + 0.2 * latency
+        # Drops to a faster response at once but creeps back up, so one outlier doesn't pin the host
+        if limiter.baseline is None or latency < limiter.baseline:
+            limiter.baseline = latency
+        else:
+            limiter.baseline += self.baseline_drift * (latency - limiter.baseline)
+        if limiter.latency > self.latency_factor * limiter.baseline:
+            self.back_off(limiter, now)
+        else:
+            limiter.limit = min(self.max_concurrency, limiter.limit + 1.0 / limiter.limit)
+
+    def back_off(self, limiter, now):
+        # Responses already in flight report the same congestion; decrease once per round trip
+        if now < limiter.backoff_until:
+            return
+        limiter.limit = max(1.0, limiter.limit * self.decrease)
+        limiter.backoff_until = now + (limiter.latency or 1.0)
+
+    def close(self):
+        for limiter in self.hosts.values():
+            if limiter.timer is not None:
+                limiter.timer.cancel()
+                limiter.timer = None
+
+    def stats(self):
+        return {
+            host: {
+                'limit': round(limiter.limit, 2),
+                'requests': limiter.requests,
+                'errors': limiter.errors,
+                'latency': round(limiter.latency, 3) if limiter.latency is not None else None,
+                'delay': limiter.delay,
+            }
+            for host, limiter in self.hosts.items()
+        }
+
+
+class RobotsCache:
+    # One robots.txt fetch per origin, shared by every worker asking about that origin
+    def __init__(self, user_agent, attempts=3, retry_delay=0.5, failure_ttl=60.0):
+        self.user_agent = user_agent
+        self.parsers = {}  # origin -> RobotFileParser, or a Future while it is being fetched
+        self.attempts = attempts  # fetches of a robots.txt answered with 5xx or a network error
+        self.retry_delay = retry_delay  # seconds before the first retry, doubled for each later one
+        self.failure_ttl = failure_ttl  # seconds an origin stays disallowed before its robots.txt is fetched again
+        self.expires = {}  # origin -> monotonic time its cached failure ends
+
+    async def get(self, session, url):
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        parser = self.parsers.get(origin)
+        if origin in self.expires and time.monotonic() >= self.expires[origin] and not isinstance(parser, asyncio.Future):
+            del self.expires[origin]
+            parser = None
+        if parser is None:
+            parser = self.parsers[origin] = asyncio.ensure_future(self.fetch(session, origin))
+        if isinstance(parser, asyncio.Future):
+            parser = await asyncio.shield(parser)
+            self.parsers[origin] = parser
+        return parser
+
+    async def fetch(self, session, origin):
+        parser = RobotFileParser(f'{origin}/robots.txt')
+        for attempt in range(self.attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                async with session.get(parser.url, allow_redirects=True) as response:
+                    if response.status == 200:
+                        parser.parse((await response.text(errors='replace')).splitlines())
+                        return parser
+                    if response.status < 500:
+                        parser.allow_all = True
+                        return parser
+                    error = f"status {response.status}"
+            except Exception as e:
+                error = e
+        # Unreachable rules mean nothing may be crawled (RFC 9309), but only until the next try
+        logger.warning(f"Could not fetch {parser.url} after {self.attempts} attempts ({error}); disallowing {origin} for {self.failure_ttl:.0f}s")
+        parser.disallow_all = True
+        self.expires[origin] = time.monotonic() + self.failure_ttl
+        return parser
+
+    async def allowed(self, session, url):
+        parser = await self.get(session, url)
+        return parser.can_fetch(self.user_agent, url)
+
+    async def crawl_delay(self, session, url):
+        parser = await self.get(session, url)
+        delay = parser.crawl_delay(self.user_agent)
+        rate = parser.request_rate(self.user_agent)
+        if rate is not None and rate.requests:
+            delay = max(float(delay or 0.0), rate.seconds / rate.requests)
+        return float(delay) if delay is not None else None
@@ -0,0 +1,119 @@
+# rufus/pool.py
+
+import asyncio
+import logging
+from collections import Counter, deque
+import aiohttp
+from .embeddings import EmbeddingCache, get_model_id
+from .politeness import HostScheduler, RobotsCache
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(config):
+    # Pooled connections, reused across every fetch made with the session
+    connector = aiohttp.TCPConnector(
+        limit=config.connection_limit,
+        limit_per_host=config.connection_limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=config.dns_cache_ttl,
+        keepalive_timeout=config.keepalive_timeout,
+    )
+    headers = {'Accept-Encoding': 'gzip, deflate'} if config.http_compression else {'Accept-Encoding': 'identity'}
+    headers['User-Agent'] = config.user_agent
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=config.request_timeout),
+        auto_decompress=config.http_compression,
+    )
+
+
+class FairLimiter:
+    # Global budget of concurrent page visits. When it is contended, each freed slot goes to the
+    # waiting job holding the fewest, so a job with a large frontier cannot starve the others.
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.held = Counter()
+        self.waiters = {}  # job -> deque of futures, in arrival order
+
+    async def acquire(self, job):
+        if self.in_use < self.limit and not self.waiters:
+            self.grant(job)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(job, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(job)  # Granted just as it was cancelled
+            else:
+                queue = self.waiters.get(job)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self.waiters[job]
+            raise
+
+    def grant(self, job):
+        self.in_use += 1
+        self.held[job] += 1
+
+    def release(self, job):
+        self.in_use -= 1
+        self.held[job] -= 1
+        if not self.held[job]:
+            del self.held[job]
+        while self.in_use < self.limit and self.waiters:
+            waiting = min(self.waiters, key=lambda candidate: self.held[candidate])
+            queue = self.waiters[waiting]
+            future = queue.popleft()
+            if not queue:
+                del self.waiters[waiting]
+            if not future.done():
+                self.grant(waiting)
+                future.set_result(None)
+
+
+class CrawlPool:
+    # Resources shared by concurrent crawls: one HTTP session, one embedding cache, one per-host
+    # scheduler (so politeness holds across jobs hitting the same host), robots.txt rules and the budget.
+    def __init__(self, config, budget=None):
+        self.config = config
+        self.limiter = FairLimiter(budget) if budget else None
+        self.session = None
+        self.embedding_cache = EmbeddingCache(
+            get_model_id(config.embeddings_model),
+            max_size=config.embedding_cache_size,
+            path=config.embedding_cache_path,
+        )
+        self.scheduler = HostScheduler(
+            None,
+            max_concurrency=config.per_host_concurrency,
+            initial_concurrency=config.per_host_initial_concurrency,
+            min_delay=config.politeness_delay,
+        )
+        self.robots = RobotsCache(config.user_agent) if config.respect_robots else None
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = create_session(self.config)
+        return self.session
+
+    async def acquire(self, job):
+        if self.limiter is not None:
+            await self.limiter.acquire(job)
+
+    def release(self, job):
+        if self.limiter is not None:
+            self.limiter.release(job)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.scheduler.close()
+        self.embedding_cache.close()
+        logger.info(f"Shared embedding cache stats: {self.embedding_cache.stats()}")
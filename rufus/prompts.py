@@ -0,0 +1,13 @@
+# rufus/prompts.py
+
+BATCH_EVALUATION_PROMPT = """
+Evaluate the relevance of each numbered document to the instructions on a scale from 0 to 1.
+Instructions: {instructions}
+
+{documents}
+Reply with exactly one line per document in the form "<document number>: <relevance score (0-1)>".
+"""
+
+BATCH_EVALUATION_DOCUMENT = """Document {number}:
+{data}
+"""
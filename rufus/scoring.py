@@ -0,0 +1,200 @@
+# rufus/scoring.py
+
+import asyncio
+import logging
+import random
+import re
+import time
+from .prompts import BATCH_EVALUATION_PROMPT, BATCH_EVALUATION_DOCUMENT
+from .metrics import NULL_METRICS
+
+logger = logging.getLogger(__name__)
+
+# A '.' separator must be followed by whitespace, so a bare '1.0' isn't read as document 1 scoring 0
+SCORE_LINE = re.compile(r'^\W*(?:document\s*)?(\d+)\s*(?:[:)=-]|\.(?=\s))\s*(?:score\s*[:=]?\s*)?(\d*\.?\d+)', re.IGNORECASE | re.MULTILINE)
+BARE_SCORE = re.compile(r'^\s*(\d*\.?\d+)\s*$')
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def is_retryable(error):
+    # Rate limits, timeouts and transient server errors, whichever client raised them
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(error, 'status', None)
+    if status in RETRYABLE_STATUS:
+        return True
+    name = type(error).__name__
+    return any(marker in name for marker in ('RateLimit', 'Timeout', 'Connection'))
+
+
+def retry_after(error):
+    # Seconds requested by the server's Retry-After header, when the error carries a response
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_scores(response, count):
+    if count == 1:
+        # A single document may be answered with a bare score
+        bare = BARE_SCORE.match(response)
+        if bare:
+            return {0: min(max(float(bare.group(1)), 0.0), 1.0)}
+    scores = {}
+    for number, value in SCORE_LINE.findall(response):
+        index = int(number) - 1
+        if 0 <= index < count and index not in scores:
+            scores[index] = min(max(float(value), 0.0), 1.0)
+    return scores
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class BatchScorer:
+    # Coalesces concurrent score() calls into multi-document prompts, under request and token budgets.
+    # `complete` is any coroutine function taking a prompt and returning the completion text.
+    def __init__(
+        self,
+        complete,
+        batch_size=5,
+        max_chars=1000,
+        requests_per_minute=500,
+        tokens_per_minute=200000,
+        max_retries=5,
+        timeout=60,
+        max_concurrency=8,
+        linger=0.05,
+        backoff_base=1.0,
+        backoff_max=30.0,
+        metrics=None,
+    ):
+        self.complete = complete
+        self.metrics = metrics or NULL_METRICS
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.loop = None
+        self.linger = linger
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pending = {}  # instructions -> [(text, future)]
+        self.flush_handles = {}
+        self.tasks = set()
+        self.calls = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+
+    def get_semaphore(self):
+        # asyncio primitives belong to one event loop and a client may run several
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.semaphore
+
+    async def score(self, instructions, text):
+        future = asyncio.get_running_loop().create_future()
+        batch = self.pending.setdefault(instructions, [])
+        batch.append((text[:self.max_chars], future))
+        if len(batch) >= self.batch_size:
+            self.flush(instructions)
+        elif instructions not in self.flush_handles:
+            # Wait briefly for more documents before sending a partial batch
+            self.flush_handles[instructions] = asyncio.get_running_loop().call_later(self.linger, self.flush, instructions)
+        return await future
+
+    async def score_many(self, instructions, texts):
+        return await asyncio.gather(*(self.score(instructions, text) for text in texts))
+
+    def flush(self, instructions):
+        handle = self.flush_handles.pop(instructions, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self.pending.pop(instructions, [])
+        if batch:
+            task = asyncio.get_running_loop().create_task(self.run_batch(instructions, batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, instructions, batch):
+        try:
+            scores = await self.request_scores(instructions, [text for text, _ in batch])
+        except Exception as e:
+            # Retries are spent; splitting the batch now would multiply the load on a throttling provider
+            logger.error(f"Error evaluating data: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(0.0)
+            return 0.0
+        missing = [i for i in range(len(batch)) if i not in scores]
+        if missing and len(batch) > 1:
+            # The reply skipped some documents; score those one at a time
+            retried = await asyncio.gather(*(self.run_batch(instructions, [batch[i]]) for i in missing))
+            scores.update({i: score for i, score in zip(missing, retried)})
+        for i, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(scores.get(i, 0.0))
+        return scores.get(0, 0.0)
+
+    async def request_scores(self, instructions, texts):
+        documents = ''.join(BATCH_EVALUATION_DOCUMENT.format(number=i + 1, data=text) for i, text in enumerate(texts))
+        prompt = BATCH_EVALUATION_PROMPT.format(instructions=instructions, documents=documents)
+        tokens = estimate_tokens(prompt) + 8 * len(texts)  # prompt plus the expected reply
+        attempt = 0
+        while True:
+            await self.requests.acquire()
+            await self.tokens.acquire(tokens)
+            try:
+                async with self.get_semaphore():
+                    self.calls += 1
+                    self.prompt_tokens += tokens
+                    self.metrics.increment('llm_requests_total')
+                    self.metrics.increment('llm_prompt_tokens_total', tokens)
+                    self.metrics.observe('llm_batch_documents', len(texts), buckets=(1, 2, 5, 10, 20, 50))
+                    with self.metrics.timer('llm_request_seconds'):
+                        response = await asyncio.wait_for(self.complete(prompt), self.timeout)
+                return parse_scores(response, len(texts))
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                delay = max(delay, retry_after(e))
+                attempt += 1
+                self.retries += 1
+                self.metrics.increment('llm_retries_total', error=type(e).__name__)
+                logger.warning(f"Retrying LLM request in {delay:.1f}s after {type(e).__name__}")
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        return {'calls': self.calls, 'retries': self.retries, 'prompt_tokens': self.prompt_tokens}
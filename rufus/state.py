@@ -0,0 +1,133 @@
+# rufus/state.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+import numpy as np
+from .parser import ParsedPage
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class CrawlState:
+    # Per-URL results of earlier crawls of one site, used to skip unchanged pages on the next run
+    def __init__(self, path, base_url):
+        self.path = path
+        self.base_url = base_url
+        self.db = None  # Opened lazily
+        self.not_modified = 0
+        self.unchanged = 0
+        self.changed = 0
+
+    def get_db(self):
+        if self.db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    base_url TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT,
+                    model_id TEXT,
+                    embedding BLOB,
+                    relevance REAL,
+                    page BLOB,
+                    extracted TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (base_url, url)
+                )
+            """)
+        return self.db
+
+    def get(self, url):
+        row = self.get_db().execute(
+            'SELECT etag, last_modified, content_hash, model_id, embedding, relevance, page, extracted '
+            'FROM pages WHERE base_url = ? AND url = ?',
+            (self.base_url, url),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, page_hash, model_id, embedding, relevance, page, extracted = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': page_hash,
+            'model_id': model_id,
+            'embedding': np.frombuffer(embedding, dtype=np.float32) if embedding is not None else None,
+            'relevance': relevance,
+            'page': ParsedPage.from_dict(json.loads(zlib.decompress(page))) if page is not None else None,
+            'extracted': json.loads(extracted) if extracted is not None else None,
+        }
+
+    def validators(self, record):
+        # Conditional request headers for a stored record
+        headers = {}
+        if record and record['page'] is not None:
+            if record['etag']:
+                headers['If-None-Match'] = record['etag']
+            if record['last_modified']:
+                headers['If-Modified-Since'] = record['last_modified']
+        return headers
+
+    def save(self, url, etag, last_modified, page_hash, model_id, embedding, relevance, page):
+        # A new version of the page invalidates its extracted content
+        page_blob = zlib.compress(json.dumps(page.to_dict(), ensure_ascii=False).encode('utf-8'))
+        embedding_blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        db = self.get_db()
+        db.execute(
+            'INSERT OR REPLACE INTO pages '
+            '(base_url, url, etag, last_modified, content_hash, model_id, embedding, relevance, page, extracted, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)',
+            (self.base_url, url, etag, last_modified, page_hash, model_id, embedding_blob, relevance, page_blob, time.time()),
+        )
+        db.commit()
+        self.changed += 1
+
+    def touch(self, url, etag, last_modified, relevance):
+        # Same content as last time: refresh validators and score, keep everything else
+        db = self.get_db()
+        db.execute(
+            'UPDATE pages SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), '
+            'relevance = ?, updated_at = ? WHERE base_url = ? AND url = ?',
+            (etag, last_modified, relevance, time.time(), self.base_url, url),
+        )
+        db.commit()
+
+    def get_extracted(self, url, granularity):
+        row = self.get_db().execute(
+            'SELECT extracted FROM pages WHERE base_url = ? AND url = ?', (self.base_url, url)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        extracted = json.loads(row[0])
+        return extracted['content'] if extracted.get('granularity') == granularity else None
+
+    def save_extracted(self, url, granularity, content):
+        db = self.get_db()
+        db.execute(
+            'UPDATE pages SET extracted = ? WHERE base_url = ? AND url = ?',
+            (json.dumps({'granularity': granularity, 'content': content}, ensure_ascii=False), self.base_url, url),
+        )
+        db.commit()
+
+    def stats(self):
+        return {'not_modified': self.not_modified, 'unchanged': self.unchanged, 'changed': self.changed}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,135 @@
+# rufus/store.py
+
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from array import array
+from .parser import ParsedPage
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<I')  # Compressed record length, so a segment can be re-indexed by scanning
+
+
+class PageStore:
+    # Append-only segment file of zlib-compressed (url, page) records with an in-memory offset index.
+    # Behaves like the list it replaces: append(), len() and lazy iteration.
+    def __init__(self, directory=None, compression_level=6):
+        self.directory = directory
+        self.compression_level = compression_level
+        self.path = None
+        self.file = None
+        self.offsets = array('Q')
+        self.lengths = array('I')
+        self.size = 0
+        self.raw_bytes = 0
+
+    @classmethod
+    def load(cls, path):
+        store = cls(os.path.dirname(path))
+        store.path = path
+        with open(path, 'rb') as segment:
+            while True:
+                header = segment.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, = HEADER.unpack(header)
+                store.offsets.append(store.size + HEADER.size)
+                store.lengths.append(length)
+                store.size += HEADER.size + length
+                segment.seek(length, os.SEEK_CUR)
+        return store
+
+    @classmethod
+    def merge(cls, paths, directory=None):
+        # Records are self-delimiting, so segments are concatenated as they are, without recompressing
+        store = cls(directory)
+        segment = store.open_for_append()
+        for path in paths:
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, segment)
+        segment.close()
+        store.file = None
+        return cls.load(store.path)
+
+    def open_for_append(self):
+        if self.file is None:
+            if self.path is None:
+                if self.directory:
+                    os.makedirs(self.directory, exist_ok=True)
+                handle, self.path = tempfile.mkstemp(prefix='rufus-pages-', suffix='.seg', dir=self.directory)
+                os.close(handle)
+            self.file = open(self.path, 'ab')
+        return self.file
+
+    def append(self, item):
+        url, page = item
+        record = {'url': url}
+        if isinstance(page, ParsedPage):
+            record['page'] = page.to_dict()
+        else:
+            record['html'] = page
+        raw = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        blob = zlib.compress(raw, self.compression_level)
+        segment = self.open_for_append()
+        segment.write(HEADER.pack(len(blob)))
+        segment.write(blob)
+        self.offsets.append(self.size + HEADER.size)
+        self.lengths.append(len(blob))
+        self.size += HEADER.size + len(blob)
+        self.raw_bytes += len(raw)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __bool__(self):
+        return len(self.offsets) > 0
+
+    def decode(self, blob):
+        record = json.loads(zlib.decompress(blob).decode('utf-8'))
+        if 'page' in record:
+            return record['url'], ParsedPage.from_dict(record['page'])
+        return record['url'], record['html']
+
+    def __getitem__(self, index):
+        if self.file is not None:
+            self.file.flush()
+        with open(self.path, 'rb') as segment:
+            segment.seek(self.offsets[index])
+            return self.decode(segment.read(self.lengths[index]))
+
+    def __iter__(self):
+        # Records appended while iterating are picked up as well
+        if self.path is None:
+            return
+        with open(self.path, 'rb') as segment:
+            index = 0
+            while index < len(self.offsets):
+                if self.file is not None:
+                    self.file.flush()
+                segment.seek(self.offsets[index])
+                yield self.decode(segment.read(self.lengths[index]))
+                index += 1
+
+    def stats(self):
+        return {
+            'pages': len(self),
+            'raw_bytes': self.raw_bytes,
+            'stored_bytes': self.size,
+        }
+
+    def close(self, remove=True):
+        # The segment is scratch space for one crawl; keep it only when asked to
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if remove and self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+            self.path = None
+            self.offsets = array('Q')
+            self.lengths = array('I')
+            self.size = 0
@@ -0,0 +1,102 @@
+# rufus/testing.py
+
+# Deterministic stand-ins for the remote model backends, used by the test suite
+
+import asyncio
+import re
+import time
+import zlib
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class FakeEmbeddings:
+    # latency is slept per call, blocking like the synchronous provider clients
+    def __init__(self, dim=64, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model = f'fake-{dim}'
+        self.query_calls = 0
+        self.document_calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text):
+        self.texts_embedded += 1
+        vector = [0.0] * self.dim
+        for token in re.findall(r'\w+', text.lower()):
+            vector[zlib.crc32(token.encode()) % self.dim] += 1.0
+        return vector
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class FakeLLMServer:
+    # Local OpenAI-compatible completions endpoint that scores documents by word overlap
+    def __init__(self, latency=0.0, rate_limited_requests=0):
+        self.latency = latency
+        self.rate_limited_requests = rate_limited_requests
+        self.requests = 0
+        self.prompts = []
+        self.server = None
+        self.base_url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/completions', self.handle_completion)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.base_url = str(self.server.make_url('/v1'))
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            await self.server.close()
+
+    def score(self, instructions, document):
+        wanted = set(re.findall(r'\w+', instructions.lower()))
+        found = set(re.findall(r'\w+', document.lower()))
+        return round(len(wanted & found) / len(wanted), 3) if wanted else 0.0
+
+    def reply(self, prompt):
+        instructions = re.search(r'Instructions: (.*)', prompt).group(1)
+        if 'Extracted Keywords' in prompt:
+            return ', '.join(dict.fromkeys(word for word in re.findall(r'\w+', instructions.lower()) if len(word) > 3))
+        documents = re.findall(r'Document (\d+):\n(.*?)(?=\nDocument \d+:|\nReply with)', prompt, re.S)
+        if documents:
+            return '\n'.join(f'{number}: {self.score(instructions, text)}' for number, text in documents)
+        return str(self.score(instructions, re.search(r'Data: (.*)', prompt).group(1)))
+
+    async def handle_completion(self, request):
+        self.requests += 1
+        if self.requests <= self.rate_limited_requests:
+            return web.json_response(
+                {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                status=429, headers={'Retry-After': '0'},
+            )
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = await request.json()
+        prompts = body['prompt'] if isinstance(body['prompt'], list) else [body['prompt']]
+        self.prompts.extend(prompts)
+        choices = [
+            {'text': self.reply(prompt), 'index': i, 'logprobs': None, 'finish_reason': 'stop'}
+            for i, prompt in enumerate(prompts)
+        ]
+        return web.json_response({
+            'id': f'cmpl-{self.requests}',
+            'object': 'text_completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': choices,
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        })
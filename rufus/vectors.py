@@ -0,0 +1,231 @@
+# rufus/vectors.py
+
+import json
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# A vector store directory holds, for N rows of dimension D:
+#   vectors.f32     N x D float32, row-major and L2-normalized, memory-mapped for search
+#   metadata.jsonl  one JSON object per row
+#   offsets.u64     N uint64 byte offsets into metadata.jsonl, so any row is one seek away
+#   manifest.json   N, D, the embedding model and the coarse index, if built
+#   ivf.*           optional inverted-file index: centroids, row ids grouped by list, list boundaries
+VECTORS = 'vectors.f32'
+METADATA = 'metadata.jsonl'
+OFFSETS = 'offsets.u64'
+MANIFEST = 'manifest.json'
+CENTROIDS = 'ivf.centroids.f32'
+LIST_ROWS = 'ivf.rows.u32'
+LIST_OFFSETS = 'ivf.offsets.u64'
+BLOCK_ROWS = 65536  # rows scored per matrix product, bounding the memory a search touches at once
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(directory, manifest):
+    # Written last and replaced atomically; rows beyond its count are ignored and later truncated
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorStoreWriter:
+    # Appends rows to a vector store directory, creating it if needed
+    def __init__(self, directory, model_id=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        manifest = read_manifest(directory) or {'count': 0, 'dim': None, 'metadata_bytes': 0, 'model_id': model_id}
+        if model_id and manifest.get('model_id') and manifest['model_id'] != model_id:
+            raise ValueError(f"{directory} holds {manifest['model_id']} embeddings, not {model_id}")
+        self.manifest = manifest
+        self.manifest.pop('index', None)  # Rebuilt by VectorStore.build_index once the rows change
+        for name in (CENTROIDS, LIST_ROWS, LIST_OFFSETS):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self.vectors = self.open(VECTORS, manifest['count'] * (manifest['dim'] or 0) * 4)
+        self.metadata = self.open(METADATA, manifest['metadata_bytes'])
+        self.offsets = self.open(OFFSETS, manifest['count'] * 8)
+
+    def open(self, name, size):
+        # Drops whatever an interrupted write left past the manifest
+        f = open(os.path.join(self.directory, name), 'ab')
+        f.truncate(size)
+        return f
+
+    def add(self, vectors, metadata):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(metadata):
+            raise ValueError('Expected one vector per metadata record')
+        if not len(matrix):
+            return
+        if self.manifest['dim'] is None:
+            self.manifest['dim'] = matrix.shape[1]
+        elif matrix.shape[1] != self.manifest['dim']:
+            raise ValueError(f"Expected {self.manifest['dim']}-dimensional vectors, got {matrix.shape[1]}")
+        normalize_rows(matrix).astype(np.float32).tofile(self.vectors)
+        offsets = np.empty(len(metadata), dtype=np.uint64)
+        position = self.manifest['metadata_bytes']
+        for i, record in enumerate(metadata):
+            line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+            offsets[i] = position
+            self.metadata.write(line)
+            position += len(line)
+        offsets.tofile(self.offsets)
+        self.manifest['metadata_bytes'] = position
+        self.manifest['count'] += len(matrix)
+
+    def close(self):
+        for f in (self.vectors, self.metadata, self.offsets):
+            f.close()
+        write_manifest(self.directory, self.manifest)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class VectorStore:
+    # Read side of a vector store: rows stay on disk and are paged in by the OS as searches touch them
+    def __init__(self, directory):
+        self.directory = directory
+        manifest = read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No vector store in {directory}")
+        self.manifest = manifest
+        self.count = manifest['count']
+        self.dim = manifest['dim'] or 0
+        self.model_id = manifest.get('model_id')
+        if self.count:
+            self.vectors = np.memmap(self.path(VECTORS), dtype=np.float32, mode='r', shape=(self.count, self.dim))
+            self.offsets = np.memmap(self.path(OFFSETS), dtype=np.uint64, mode='r', shape=(self.count,))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self.offsets = np.zeros(0, dtype=np.uint64)
+        self.metadata = open(self.path(METADATA), 'rb')
+        self.load_index()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load_index(self):
+        index = self.manifest.get('index')
+        self.centroids = self.list_rows = self.list_offsets = None
+        if not index or index['rows'] != self.count:
+            return
+        self.centroids = np.fromfile(self.path(CENTROIDS), dtype=np.float32).reshape(index['lists'], self.dim)
+        self.list_rows = np.memmap(self.path(LIST_ROWS), dtype=np.uint32, mode='r', shape=(self.count,))
+        self.list_offsets = np.fromfile(self.path(LIST_OFFSETS), dtype=np.uint64).astype(np.int64)
+        self.nprobe = index['nprobe']
+
+    def __len__(self):
+        return self.count
+
+    def get(self, row):
+        self.metadata.seek(int(self.offsets[row]))
+        return json.loads(self.metadata.readline())
+
+    def search(self, query, k=10, nprobe=None, exact=False):
+        # Cosine top-k as [metadata + {'id', 'score'}], best first. With a coarse index only the
+        # nprobe lists nearest the query are scored, unless exact is set.
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Expected a {self.dim}-dimensional query, got {query.shape[0]}")
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        if not self.count or k <= 0:
+            return []
+        rows = None
+        if self.centroids is not None and not exact:
+            rows = self.probe(query, nprobe or self.nprobe)
+        ids, scores = self.top_k(query, k, rows)
+        return [dict(self.get(row), id=int(row), score=float(score)) for row, score in zip(ids, scores)]
+
+    def probe(self, query, nprobe):
+        lists = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        rows = [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        # Ascending row ids keep the gather from the memory map sequential
+        return np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.uint32)
+
+    def top_k(self, query, k, rows=None):
+        total = self.count if rows is None else len(rows)
+        best_ids = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, total, BLOCK_ROWS):
+            if rows is None:
+                ids = np.arange(start, min(start + BLOCK_ROWS, total))
+                block = self.vectors[start:start + BLOCK_ROWS]
+            else:
+                ids = rows[start:start + BLOCK_ROWS].astype(np.int64)
+                block = self.vectors[ids]
+            scores = np.asarray(block) @ query
+            ids = np.concatenate([best_ids, ids])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+                ids, scores = ids[keep], scores[keep]
+            best_ids, best_scores = ids, scores
+        order = np.argsort(-best_scores, kind='stable')
+        return best_ids[order], best_scores[order]
+
+    def build_index(self, lists=None, nprobe=None, iterations=10, sample_size=256, seed=0):
+        # Inverted-file index from spherical k-means on a sample of the rows; searches then score
+        # only the rows of the lists nearest the query instead of the whole matrix
+        if not self.count:
+            return
+        lists = min(lists or max(1, int(np.sqrt(self.count))), self.count)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(self.count, min(self.count, lists * sample_size), replace=False))
+        sample = np.asarray(self.vectors[sample_rows])
+        centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind='stable')
+            members, starts = np.unique(assignments[order], return_index=True)
+            centroids[members] = normalize_rows(np.add.reduceat(sample[order], starts, axis=0))
+            empty = np.setdiff1d(np.arange(lists), members)
+            if len(empty):
+                # Lists that lost every member restart from random sample rows
+                centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        assignments = np.empty(self.count, dtype=np.int64)
+        for start in range(0, self.count, BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS])
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        list_offsets = np.searchsorted(assignments[order], np.arange(lists + 1)).astype(np.uint64)
+        centroids.astype(np.float32).tofile(self.path(CENTROIDS))
+        order.astype(np.uint32).tofile(self.path(LIST_ROWS))
+        list_offsets.tofile(self.path(LIST_OFFSETS))
+        self.manifest['index'] = {'lists': lists, 'rows': self.count, 'nprobe': nprobe or max(1, lists // 8)}
+        write_manifest(self.directory, self.manifest)
+        self.load_index()
+        logger.info(f"Built a {lists}-list index over {self.count} vectors")
+
+    def close(self):
+        self.metadata.close()
+        self.vectors = self.offsets = self.list_rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
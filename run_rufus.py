@@ -11,37 +11,41 @@ if sys.platform.startswith('win'):
 # Set stdout encoding to UTF-8
 sys.stdout.reconfigure(encoding='utf-8')
 
+import json
+import os
 from rufus import RufusClient, RufusConfig
 
-config = RufusConfig(
-    max_depth=10,  # Increase depth for deeper crawling
-    extraction_granularity='paragraph',
-    evaluation_threshold=0.5,
-    relevance_threshold=0.2,  # Lower threshold to include more pages
-    max_pages=1000,  # Increase max pages to crawl more content
-    concurrency=20,  # Increase concurrency if needed
-)
+def main():
+    config = RufusConfig(
+        max_depth=10,  # Increase depth for deeper crawling
+        extraction_granularity='paragraph',
+        evaluation_threshold=0.5,
+        relevance_threshold=0.2,  # Lower threshold to include more pages
+        max_pages=1000,  # Increase max pages to crawl more content
+        concurrency=20,  # Increase concurrency if needed
+        embedding_cache_path='.rufus_cache/embeddings.sqlite',  # Reuse embeddings across runs
+    )
 
-client = RufusClient(config=config)
+    client = RufusClient(config=config)
 
-url = "https://sfgov.org"
-instructions = "We're making a chatbot for all the helpful information about activities to do in San Francisco."
+    url = "https://sfgov.org"
+    instructions = "We're making a chatbot for all the helpful information about activities to do in San Francisco."
 
-documents = client.run(url, instructions)
+    documents = client.run(url, instructions)
 
-# Serialize the documents into JSON files
-import json
-import os
+    # Serialize the documents into JSON files, creating the output directory if it doesn't exist
+    output_dir = 'output_documents'
+    os.makedirs(output_dir, exist_ok=True)
 
-# Create output directory if it doesn't exist
-output_dir = 'output_documents'
-os.makedirs(output_dir, exist_ok=True)
+    # Save each document as a separate JSON file
+    for idx, doc in enumerate(documents):
+        filename = f'document_{idx+1}.json'
+        filepath = os.path.join(output_dir, filename)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
 
-# Save each document as a separate JSON file
-for idx, doc in enumerate(documents):
-    filename = f'document_{idx+1}.json'
-    filepath = os.path.join(output_dir, filename)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(doc, f, ensure_ascii=False, indent=2)
+    print('documents stored in', output_dir)
 
-print('documents stored in', output_dir)
+# Worker processes are spawned and re-import this script, which must not start another crawl
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ setup(
     version='0.2.0',
     description='Intelligent web data extraction tool for RAG systems',
     author='nimit dave',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     install_requires=[
         'aiohttp',
         'asyncio',
@@ -20,6 +20,9 @@ setup(
         'nltk',
         'numpy',
     ],
+    extras_require={
+        'fast': ['lxml'],
+    },
     entry_points={
         'console_scripts': [
             'rufus = rufus.app:main',
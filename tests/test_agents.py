@@ -1,26 +1,47 @@
 import unittest
 from rufus.agents import PromptUnderstandingAgent, EvaluatorAgent
 from rufus.config import RufusConfig
+from rufus.testing import FakeLLMServer
 import asyncio
 
 class TestAgents(unittest.TestCase):
     def setUp(self):
         self.api_key = 'test_api_key'
-        self.prompt_agent = PromptUnderstandingAgent(api_key=self.api_key)
-        self.evaluator_agent = EvaluatorAgent(evaluation_threshold=0.7, api_key=self.api_key)
+
+    async def start(self):
+        self.server = await FakeLLMServer().start()
+        config = RufusConfig(llm_base_url=self.server.base_url)
+        self.prompt_agent = PromptUnderstandingAgent(api_key=self.api_key, config=config)
+        self.evaluator_agent = EvaluatorAgent(evaluation_threshold=0.7, api_key=self.api_key, config=config)
 
     def test_prompt_understanding(self):
-        instructions = "Find information about product features and customer FAQs."
-        keywords = asyncio.run(self.prompt_agent.parse_instructions(instructions))
+        async def run():
+            await self.start()
+            try:
+                instructions = "Find information about product features and customer FAQs."
+                return await self.prompt_agent.parse_instructions(instructions)
+            finally:
+                await self.server.close()
+
+        keywords = asyncio.run(run())
         self.assertIsInstance(keywords, list)
         self.assertTrue(len(keywords) > 0)
+        self.assertIn('product', keywords)
 
     def test_evaluator_agent(self):
-        extracted_data = [{'content': ['Sample data']}]
-        instructions = "Sample instructions"
-        scored_data = asyncio.run(self.evaluator_agent.evaluate_data(extracted_data, instructions))
+        async def run():
+            await self.start()
+            try:
+                extracted_data = [{'content': ['Sample data']}]
+                instructions = "Sample instructions"
+                return await self.evaluator_agent.evaluate_data(extracted_data, instructions)
+            finally:
+                await self.server.close()
+
+        scored_data = asyncio.run(run())
         self.assertIsInstance(scored_data, list)
         self.assertTrue(len(scored_data) > 0)
+        self.assertEqual(self.server.requests, 1)
 
 if __name__ == '__main__':
     unittest.main()
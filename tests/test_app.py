@@ -0,0 +1,170 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rufus.app import RufusClient
+from rufus.config import RufusConfig
+from rufus.testing import FakeEmbeddings, FakeLLMServer
+
+class TestStreaming(unittest.TestCase):
+    def make_site(self):
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            topic = 'summer concerts in the park' if index % 2 == 0 else 'parking permit renewal'
+            links = ''.join(f'<a href="/page/{i}">page {i}</a>' for i in range(1, 7)) if index == 0 else ''
+            return web.Response(text=f'<html><body><p>Page {index} about {topic}.</p>{links}</body></html>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/', page)
+        app.router.add_get('/page/{index}', page)
+        return app
+
+    async def start(self, **settings):
+        self.site = TestServer(self.make_site())
+        await self.site.start_server()
+        self.llm = await FakeLLMServer().start()
+        options = dict(
+            embeddings_model=FakeEmbeddings(),
+            relevance_threshold=0.0,
+            evaluation_threshold=0.5,
+            llm_base_url=self.llm.base_url,
+        )
+        options.update(settings)
+        return RufusClient(api_key='test-key', config=RufusConfig(**options))
+
+    async def stop(self):
+        await self.site.close()
+        await self.llm.close()
+
+    def test_stream_yields_scored_documents(self):
+        async def run():
+            client = await self.start()
+            try:
+                return [document async for document in client.stream(str(self.site.make_url('/')), 'summer concerts')]
+            finally:
+                await self.stop()
+
+        documents = asyncio.run(run())
+        self.assertEqual(len(documents), 4)
+        self.assertTrue(all(document['score'] >= 0.5 for document in documents))
+        self.assertTrue(all('summer concerts' in document['content'][0] for document in documents))
+
+    def test_consumer_can_stop_early(self):
+        async def run():
+            client = await self.start()
+            try:
+                stream = client.stream(str(self.site.make_url('/')), 'summer concerts')
+                first = await stream.__anext__()
+                await stream.aclose()
+                return first
+            finally:
+                await self.stop()
+
+        self.assertIn('score', asyncio.run(run()))
+
+    def test_stream_to_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out', 'documents.jsonl')
+
+            async def run():
+                client = await self.start()
+                try:
+                    return await client.stream_to_jsonl(str(self.site.make_url('/')), 'summer concerts', path, flush_every=1)
+                finally:
+                    await self.stop()
+
+            count = asyncio.run(run())
+            with open(path, encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual(count, 4)
+        self.assertEqual(len(lines), 4)
+        self.assertEqual({line['url'] for line in lines}, {line['url'] for line in lines if line['score'] >= 0.5})
+
+    def test_slow_evaluation_holds_the_crawl_back(self):
+        served = []
+
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            served.append(index)
+            links = ''.join(f'<a href="/page/{i}">page {i}</a>' for i in range(1, 60)) if index == 0 else ''
+            return web.Response(text=f'<html><body><p>Summer concerts in the park, night {index}.</p>{links}</body></html>', content_type='text/html')
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/', page)
+            app.router.add_get('/page/{index}', page)
+            site = TestServer(app)
+            await site.start_server()
+            llm = await FakeLLMServer(latency=0.3).start()
+            config = RufusConfig(
+                embeddings_model=FakeEmbeddings(),
+                relevance_threshold=0.0,
+                evaluation_threshold=0.5,
+                llm_base_url=llm.base_url,
+                llm_concurrency=1,
+                llm_batch_size=2,
+                concurrency=2,
+                respect_robots=False,
+                near_duplicate_distance=None,
+            )
+            client = RufusClient(api_key='test-key', config=config)
+            stream = client.stream(str(site.make_url('/')), 'summer concerts')
+            try:
+                await stream.__anext__()
+                await asyncio.sleep(0.3)
+                return len(served)
+            finally:
+                await stream.aclose()
+                client.close()
+                await site.close()
+                await llm.close()
+
+        # Two being scored, four queued, two being fetched, and the home page
+        self.assertLessEqual(asyncio.run(run()), 12)
+
+    def stream_ranked(self, **settings):
+        ranking_model = FakeEmbeddings()
+
+        async def run():
+            client = await self.start(embeddings_model='local', ranking_embeddings_model=ranking_model, **settings)
+            try:
+                return [document async for document in client.stream(str(self.site.make_url('/')), 'summer concerts')]
+            finally:
+                client.close()
+                await self.stop()
+
+        return asyncio.run(run()), ranking_model
+
+    def test_stream_ranks_only_for_the_cascade(self):
+        documents, ranking_model = self.stream_ranked()
+        self.assertEqual(len(documents), 4)
+        self.assertEqual(ranking_model.document_calls, 0)
+
+    def test_stream_ranks_documents_in_batches(self):
+        # Bounds no similarity reaches, so the LLM still scores every document
+        documents, ranking_model = self.stream_ranked(cascade_reject_below=-1.0, cascade_accept_above=2.0)
+        self.assertEqual(len(documents), 4)
+        self.assertGreater(ranking_model.document_calls, 0)
+        self.assertLess(ranking_model.document_calls, 7)
+        self.assertLess(ranking_model.query_calls, 7)
+
+class TestRanking(unittest.TestCase):
+    def test_local_crawl_model_is_ranked_remotely(self):
+        ranking_model = FakeEmbeddings()
+        config = RufusConfig(embeddings_model='local', ranking_embeddings_model=ranking_model)
+        client = RufusClient(api_key='test-key', config=config)
+        data = [
+            {'url': 'a', 'content': ['Parking permit renewal'], 'relevance': 0.9},
+            {'url': 'b', 'content': ['Summer concerts in the park'], 'relevance': 0.1},
+        ]
+        client.rank(data, 'summer concerts')
+        client.close()
+        self.assertTrue(client.config.embeddings_model.local)
+        self.assertGreater(data[1]['relevance'], data[0]['relevance'])
+        self.assertEqual(ranking_model.document_calls, 1)
+
+if __name__ == '__main__':
+    unittest.main()
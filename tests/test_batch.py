@@ -0,0 +1,140 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from unittest import mock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rufus.app import RufusClient, load_jobs
+from rufus.config import RufusConfig
+from rufus.pool import CrawlPool, FairLimiter
+from rufus.testing import FakeEmbeddings, FakeLLMServer
+from rufus.vectors import VectorStore
+
+class TestFairLimiter(unittest.TestCase):
+    def test_freed_slots_go_to_the_job_holding_fewest(self):
+        async def run():
+            limiter = FairLimiter(2)
+            await limiter.acquire('big')
+            await limiter.acquire('big')
+            granted = []
+
+            async def visit(job):
+                await limiter.acquire(job)
+                granted.append(job)
+
+            # 'big' queues three more visits before 'small' asks for one
+            tasks = [asyncio.create_task(visit(job)) for job in ('big', 'big', 'big', 'small')]
+            await asyncio.sleep(0)
+            limiter.release('big')
+            await asyncio.sleep(0)
+            await asyncio.gather(*tasks[3:])
+            return granted, tasks
+
+        granted, tasks = asyncio.run(run())
+        self.assertEqual(granted, ['small'])
+        self.assertTrue(all(task.done() for task in tasks))
+
+    def test_cancelled_waiter_gives_up_its_place(self):
+        async def run():
+            limiter = FairLimiter(1)
+            await limiter.acquire('a')
+            waiter = asyncio.create_task(limiter.acquire('b'))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            limiter.release('a')
+            return limiter
+
+        limiter = asyncio.run(run())
+        self.assertEqual(limiter.in_use, 0)
+        self.assertEqual(limiter.waiters, {})
+
+
+class TestBatch(unittest.TestCase):
+    def make_site(self, topic):
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            links = ''.join(f'<a href="/page/{i}">page {i}</a>' for i in range(1, 4)) if index == 0 else ''
+            return web.Response(text=f'<html><body><p>Page {index} about {topic} number {index}.</p>{links}</body></html>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/', page)
+        app.router.add_get('/page/{index}', page)
+        return app
+
+    def test_jobs_share_one_pool_and_write_as_they_finish(self):
+        sessions = []
+
+        class RecordingPool(CrawlPool):
+            def get_session(self):
+                session = super().get_session()
+                if session not in sessions:
+                    sessions.append(session)
+                return session
+
+        async def run(path):
+            concerts = TestServer(self.make_site('summer concerts in the park'))
+            library = TestServer(self.make_site('library opening hours'))
+            await concerts.start_server()
+            await library.start_server()
+            llm = await FakeLLMServer().start()
+            config = RufusConfig(
+                embeddings_model=FakeEmbeddings(),
+                relevance_threshold=0.0,
+                evaluation_threshold=0.5,
+                llm_base_url=llm.base_url,
+                batch_concurrency=2,
+                near_duplicate_distance=None,
+                vector_export_dir=os.path.join(os.path.dirname(path), 'vectors'),
+                vector_index_min_rows=1,
+            )
+            client = RufusClient(api_key='test-key', config=config)
+            jobs = [
+                {'id': 'concerts', 'url': str(concerts.make_url('/')), 'instructions': 'summer concerts'},
+                {'id': 'library', 'url': str(library.make_url('/')), 'instructions': 'library hours'},
+                {'id': 'again', 'url': str(concerts.make_url('/')), 'instructions': 'summer concerts'},
+            ]
+            try:
+                with mock.patch('rufus.app.CrawlPool', RecordingPool):
+                    return await client.batch(jobs, path)
+            finally:
+                client.close()
+                await concerts.close()
+                await library.close()
+                await llm.close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'results.jsonl')
+            counts = asyncio.run(run(path))
+            with open(path, encoding='utf-8') as f:
+                records = {record['id']: record for record in map(json.loads, f)}
+            with VectorStore(os.path.join(tmp, 'vectors')) as store:
+                exported = {store.get(row)['instructions'] for row in range(len(store))}
+                indexed = store.centroids is not None
+
+        self.assertEqual(counts, {'succeeded': 3, 'failed': 0})
+        self.assertEqual(set(records), {'concerts', 'library', 'again'})
+        self.assertEqual(len(sessions), 1)
+        self.assertEqual(exported, {'summer concerts', 'library hours'})
+        self.assertTrue(indexed)  # Built once, after every job appended its passages
+        for record in records.values():
+            self.assertNotIn('error', record)
+            self.assertTrue(record['documents'])
+        self.assertTrue(all('library' in ' '.join(document['content']) for document in records['library']['documents']))
+
+    def test_load_jobs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'jobs.jsonl')
+            with open(path, 'w') as f:
+                f.write('{"url": "https://example.com", "instructions": "events"}\n\n')
+                f.write('{"id": "b", "url": "https://example.org", "instructions": "hours"}\n')
+            self.assertEqual([job['id'] for job in load_jobs(path)], [1, 'b'])
+            with open(path, 'a') as f:
+                f.write('{"url": "https://example.net"}\n')
+            with self.assertRaisesRegex(ValueError, ':4:'):
+                load_jobs(path)
+
+if __name__ == '__main__':
+    unittest.main()
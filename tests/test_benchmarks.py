@@ -0,0 +1,34 @@
+import unittest
+import asyncio
+import time
+import numpy as np
+from benchmarks.run import RSSSampler, run_scenario, compare, current_rss_mb
+from benchmarks.site import SyntheticSite
+
+class TestBenchmarks(unittest.TestCase):
+    def test_site_is_deterministic(self):
+        self.assertEqual(SyntheticSite(pages=50, seed=1).render(7), SyntheticSite(pages=50, seed=1).render(7))
+        self.assertNotEqual(SyntheticSite(pages=50, seed=1).render(7), SyntheticSite(pages=50, seed=2).render(7))
+        self.assertGreaterEqual(len(SyntheticSite(page_bytes=20000).render(0)), 20000)
+
+    def test_scenario_reports_every_stage(self):
+        stages = asyncio.run(run_scenario('tiny', {'site': {'pages': 20, 'fanout': 4, 'page_bytes': 1024}}))
+        self.assertEqual(list(stages), ['crawl', 'extract', 'evaluate'])
+        self.assertEqual(stages['crawl']['pages'], 20)
+        self.assertIsNotNone(stages['crawl']['fetch_latency_ms']['p99'])
+        self.assertGreater(stages['evaluate']['llm_calls'], 0)
+        self.assertGreater(stages['extract']['peak_rss_mb'], 0)
+        results = {'scenarios': {'tiny': {'stages': stages}}}
+        self.assertIn('tiny/crawl/pages_per_sec', compare(results, results))
+    @unittest.skipIf(current_rss_mb() is None, 'needs /proc')
+    def test_stage_peak_excludes_earlier_stages(self):
+        with RSSSampler() as first:
+            block = np.ones(64 * 1024 * 1024, dtype=np.uint8)
+            time.sleep(0.05)  # Long enough for the sampler to see it
+            del block
+        with RSSSampler() as second:
+            pass
+        self.assertGreater(first.peak_mb - second.peak_mb, 32)
+
+if __name__ == '__main__':
+    unittest.main()
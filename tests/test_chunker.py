@@ -0,0 +1,77 @@
+import unittest
+import asyncio
+from unittest import mock
+from rufus.chunker import Chunker, get_tokenizer
+from rufus.extractor import ExtractorAgent
+from rufus.parser import ParsedPage
+
+BLOCKS = [
+    ('h1', 'Summer events'),
+    ('h2', 'Concerts'),
+    ('p', 'Free concerts in the park every Friday. Bring a blanket.'),
+    ('li', 'Jazz night'),
+    ('li', 'Symphony in the park'),
+    ('tr', 'Fri 7pm Main stage'),
+    ('p', 'Parking is limited.'),
+]
+
+def make_page(blocks):
+    return ParsedPage('https://example.com', text=' '.join(text for _, text in blocks), blocks=blocks)
+
+class TestChunker(unittest.TestCase):
+    def test_paragraphs_follow_blocks(self):
+        chunker = Chunker('paragraph', tokenizer='words')
+        self.assertEqual(chunker.chunk(make_page(BLOCKS)), [
+            'Summer events\nConcerts\nFree concerts in the park every Friday. Bring a blanket.',
+            'Jazz night\nSymphony in the park',
+            'Fri 7pm Main stage',
+            'Parking is limited.',
+        ])
+
+    def test_sentences_stay_within_blocks(self):
+        chunker = Chunker('sentence', tokenizer='words')
+        passages = chunker.chunk(make_page(BLOCKS[2:4]))
+        self.assertEqual(passages, ['Free concerts in the park every Friday.', 'Bring a blanket.', 'Jazz night'])
+
+    def test_windows_respect_budget_and_overlap(self):
+        blocks = [('p', ' '.join(f'w{block}_{i}' for i in range(7))) for block in range(6)]
+        chunker = Chunker('window', max_tokens=16, overlap=4, tokenizer='words')
+        windows = [passage.split() for passage in chunker.chunk(make_page(blocks))]
+        self.assertTrue(all(len(window) <= 16 for window in windows))
+        for previous, window in zip(windows, windows[1:]):
+            self.assertEqual(previous[-4:], window[:4])
+        # Every token appears, in order, once the overlaps are removed
+        tokens = windows[0] + [token for window in windows[1:] for token in window[4:]]
+        self.assertEqual(tokens, [token for _, text in blocks for token in text.split()])
+
+    def test_long_paragraph_is_split(self):
+        text = ' '.join(f'word{i}' for i in range(50))
+        chunker = Chunker('paragraph', max_tokens=20, overlap=5, tokenizer='words')
+        passages = chunker.chunk_text(text)
+        self.assertEqual(len(passages), 3)
+        self.assertTrue(passages[-1].endswith('word49'))
+
+    def test_page_without_blocks_uses_text(self):
+        chunker = Chunker('paragraph', tokenizer='words')
+        page = ParsedPage('https://example.com', text='Only div text here.', blocks=[('p', 'here')])
+        self.assertEqual(chunker.chunk(page), ['Only div text here.'])
+
+    def test_tokenizer_is_loaded_once(self):
+        self.assertIs(get_tokenizer('words'), get_tokenizer('words'))
+
+    def test_rejects_bad_settings(self):
+        with self.assertRaises(ValueError):
+            Chunker('chapter')
+        with self.assertRaises(ValueError):
+            Chunker('window', max_tokens=10, overlap=10)
+
+class TestExtractorChunking(unittest.TestCase):
+    def test_sentences_need_no_download(self):
+        agent = ExtractorAgent(granularity='sentence', tokenizer='words')
+        with mock.patch('nltk.download') as download:
+            data = asyncio.run(agent.extract_data([('https://example.com', make_page(BLOCKS[2:3]))]))
+        download.assert_not_called()
+        self.assertEqual(data[0]['content'], ['Free concerts in the park every Friday.', 'Bring a blanket.'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,270 @@
 import unittest
 from rufus.crawler import IntelligentCrawler
-from rufus.config import RufusConfig
+from rufus.config import RufusConfig, LOCAL_RELEVANCE_THRESHOLD
+from rufus.embeddings import HashingEmbeddings
+from rufus.testing import FakeEmbeddings
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 import asyncio
+import random
+from urllib.parse import urlparse
 
 class TestCrawler(unittest.TestCase):
     def setUp(self):
-        self.config = RufusConfig(max_depth=1)
-        self.crawler = IntelligentCrawler('https://example.com', ['example'], self.config)
+        self.config = RufusConfig(max_depth=1, embeddings_model=FakeEmbeddings(), relevance_threshold=0.1)
 
     def test_crawler(self):
-        asyncio.run(self.crawler.crawl('https://example.com', depth=0))
-        self.assertIsInstance(self.crawler.relevant_pages, list)
+        async def page(request):
+            return web.Response(text='<html><body><p>example domain</p><a href="/more">example</a></body></html>', content_type='text/html')
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/', page)
+            app.router.add_get('/more', page)
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                crawler = IntelligentCrawler(str(server.make_url('/')), 'example', self.config)
+                await crawler.crawl()
+                return crawler
+            finally:
+                await server.close()
+
+        crawler = asyncio.run(run())
+        self.assertEqual(crawler.pages_crawled, 2)
+        self.assertEqual(len(crawler.relevant_pages), 1)  # /more is a duplicate of the home page
+
+
+class TestCrawlerSession(unittest.TestCase):
+    def setUp(self):
+        self.peers = []
+
+    def make_app(self):
+        async def page(request):
+            self.peers.append(request.transport.get_extra_info('peername'))
+            index = int(request.match_info.get('index', 0))
+            links = ''.join(f'<a href="/page/{i}">page {i}</a>' for i in range(index + 1, min(index + 3, 6)))
+            return web.Response(text=f'<html><body><p>city events page {index}</p>{links}</body></html>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/', page)
+        app.router.add_get('/page/{index}', page)
+        return app
+
+    async def run_crawl(self, config):
+        server = TestServer(self.make_app())
+        await server.start_server()
+        try:
+            crawler = IntelligentCrawler(str(server.make_url('/')), 'city events', config)
+            await crawler.crawl()
+            return crawler
+        finally:
+            await server.close()
+
+    def test_single_session_reused_and_closed(self):
+        config = RufusConfig(embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, concurrency=1)
+        crawler = asyncio.run(self.run_crawl(config))
+        self.assertEqual(crawler.pages_crawled, 6)
+        self.assertEqual(len(self.peers), 6)
+        # keep-alive: every request arrived over the same client connection
+        self.assertEqual(len(set(self.peers)), 1)
+        self.assertIsNone(crawler.session)
+
+    def test_max_depth_is_enforced(self):
+        config = RufusConfig(embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, max_depth=1)
+        crawler = asyncio.run(self.run_crawl(config))
+        paths = sorted(url.split('/', 3)[-1] if url.count('/') > 2 else '' for url, _ in crawler.relevant_pages)
+        self.assertEqual(paths, ['', 'page/1', 'page/2'])
+
+    def test_slow_page_does_not_stall_other_workers(self):
+        events = []
+
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            if index == 1:
+                await asyncio.sleep(0.5)
+                events.append('slow')
+            else:
+                events.append(index)
+            links = ''.join(f'<a href="/page/{i}">page {i}</a>' for i in range(1, 8)) if index == 0 else ''
+            return web.Response(text=f'<html><body>{links}</body></html>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/', page)
+        app.router.add_get('/page/{index}', page)
+
+        async def run():
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                config = RufusConfig(embeddings_model=FakeEmbeddings(), concurrency=2)
+                crawler = IntelligentCrawler(str(server.make_url('/')), 'events', config)
+                await crawler.crawl()
+                return crawler
+            finally:
+                await server.close()
+
+        crawler = asyncio.run(run())
+        self.assertEqual(crawler.pages_crawled, 8)
+        self.assertEqual(events[-1], 'slow')
+
+    def test_session_uses_configured_connector(self):
+        config = RufusConfig(embeddings_model=FakeEmbeddings(), connection_limit=7, connection_limit_per_host=3)
+        crawler = IntelligentCrawler('https://example.com', 'events', config)
+
+        async def check():
+            session = crawler.get_session()
+            self.assertIs(session, crawler.get_session())
+            self.assertEqual(session.connector.limit, 7)
+            self.assertEqual(session.connector.limit_per_host, 3)
+            await crawler.reset()
+            self.assertTrue(session.closed)
+
+        asyncio.run(check())
+
+
+class TestBoundedFetch(unittest.TestCase):
+    def make_app(self):
+        self.requested = []
+
+        async def index(request):
+            links = ''.join(f'<a href="{path}">city events</a>' for path in ('/report.PDF', '/photo', '/big', '/latin'))
+            return web.Response(text=f'<html><body><p>city events</p>{links}</body></html>', content_type='text/html')
+
+        async def photo(request):
+            return web.Response(body=b'\x89PNG' + b'\0' * 4096, content_type='image/png')
+
+        async def big(request):
+            # Chunked, so the size is only discovered while streaming
+            response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+            await response.prepare(request)
+            for _ in range(64):
+                await response.write(b'<p>city events</p>' * 64)
+            await response.write_eof()
+            return response
+
+        async def latin(request):
+            return web.Response(body='<p>caf\xe9 events</p>'.encode('latin-1'), headers={'Content-Type': 'text/html; charset=ISO-8859-1'})
+
+        @web.middleware
+        async def record(request, handler):
+            self.requested.append(request.path)
+            return await handler(request)
+
+        app = web.Application(middlewares=[record])
+        app.router.add_get('/', index)
+        app.router.add_get('/photo', photo)
+        app.router.add_get('/big', big)
+        app.router.add_get('/latin', latin)
+        return app
+
+    def test_useless_payloads_are_not_read(self):
+        config = RufusConfig(embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, max_response_bytes=16 * 1024)
+
+        async def run():
+            server = TestServer(self.make_app())
+            await server.start_server()
+            try:
+                crawler = IntelligentCrawler(str(server.make_url('/')), 'city events', config)
+                await crawler.crawl()
+                return crawler
+            finally:
+                await server.close()
+
+        crawler = asyncio.run(run())
+        self.assertNotIn('/report.PDF', self.requested)
+        self.assertEqual(dict(crawler.skipped), {'extension': 1, 'content_type': 1, 'size': 1})
+        texts = {urlparse(url).path: page.text for url, page in crawler.relevant_pages}
+        self.assertEqual(sorted(texts), ['', '/latin'])
+        self.assertEqual(texts['/latin'], 'caf\xe9 events')
+
+    def test_meta_charset_is_used_without_header(self):
+        config = RufusConfig(embeddings_model=FakeEmbeddings())
+        crawler = IntelligentCrawler('https://example.com', 'city events', config)
+        body = '<html><head><meta charset="windows-1252"></head><body>\u201ccaf\xe9\u201d</body></html>'.encode('cp1252')
+        self.assertIn('\u201ccaf\xe9\u201d', crawler.decode(body))
+        self.assertIn('\ufffd', crawler.decode(b'caf\xe9', 'no-such-charset'))
+
+
+class TestLinkScoring(unittest.TestCase):
+    def test_links_scored_in_chunked_batches(self):
+        model = FakeEmbeddings()
+        config = RufusConfig(embeddings_model=model, embedding_batch_size=100)
+        crawler = IntelligentCrawler('https://example.com', 'city events', config)
+        links = ''.join(f'<a href="/item/{i}">item {i}</a>' for i in range(250))
+        html = f'<html><body>{links}<a href="/events">City events</a><a href="/blank"></a></body></html>'
+
+        async def run():
+            await crawler.extract_and_enqueue_links(html, 'https://example.com')
+            queued = []
+            while not crawler.frontier.empty():
+                priority, _, url = await crawler.frontier.get()
+                queued.append((priority, url))
+            return queued
+
+        queued = asyncio.run(run())
+        self.assertEqual(model.document_calls, 3)
+        self.assertEqual(len(queued), 252)
+        self.assertEqual(queued[0][1], 'https://example.com/events')
+        self.assertAlmostEqual(queued[0][0], 0.0, places=5)
+        self.assertEqual(dict((url, priority) for priority, url in queued)['https://example.com/blank'], 1.0)
+
+    def test_score_texts_matches_cosine_similarity(self):
+        config = RufusConfig(embeddings_model=FakeEmbeddings())
+        crawler = IntelligentCrawler('https://example.com', 'city events', config)
+        texts = ['events in the city', 'parking permits', '']
+        scores = crawler.score_texts(texts)
+        for text, score in zip(texts, scores):
+            expected = crawler.cosine_similarity(crawler.instructions_embedding, crawler.get_embedding(text))
+            self.assertAlmostEqual(float(score), expected, places=5)
+
+    def test_local_model_scores_links_without_cache(self):
+        config = RufusConfig(embeddings_model=HashingEmbeddings())
+        crawler = IntelligentCrawler('https://example.com', 'city events', config)
+        self.assertIs(crawler.embeddings_model, config.embeddings_model)
+        crawler.fit(['city hall opening hours', 'events this weekend'])
+        scores = crawler.score_texts(['City events', 'Parking permits', ''])
+        self.assertGreater(scores[0], scores[1])
+        self.assertEqual(scores[2], 0.0)
+        self.assertEqual(crawler.embedding_cache.stats()['misses'], 0)
+
+class TestLocalRelevance(unittest.TestCase):
+    def test_default_threshold_separates_local_scores(self):
+        filler = 'the city council office residents public service hours contact news report budget meeting agenda street'.split()
+        topic = 'summer concerts park music festival outdoor live band jazz evening stage'.split()
+
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            rng = random.Random(index)
+            words = [rng.choice(filler) for _ in range(200)]
+            if index % 4 == 1:
+                words += [rng.choice(topic) for _ in range(20)]
+                rng.shuffle(words)
+            links = ''.join(f'<a href="/page/{i}">page {i}</a>' for i in range(1, 40)) if index == 0 else ''
+            return web.Response(text=f'<html><body><p>{" ".join(words)}</p>{links}</body></html>', content_type='text/html')
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/', page)
+            app.router.add_get('/page/{index}', page)
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                config = RufusConfig(embeddings_model=HashingEmbeddings(), respect_robots=False, near_duplicate_distance=None)
+                crawler = IntelligentCrawler(str(server.make_url('/')), 'summer concerts in the park', config)
+                await crawler.crawl()
+                return crawler
+            finally:
+                await server.close()
+
+        self.assertEqual(RufusConfig(embeddings_model='local').relevance_threshold, LOCAL_RELEVANCE_THRESHOLD)
+        crawler = asyncio.run(run())
+        relevant = sorted(int(url.rsplit('/', 1)[-1]) if '/page/' in url else 0 for url, _ in crawler.relevant_pages)
+        crawler.relevant_pages.close()
+        self.assertEqual(crawler.pages_crawled, 40)
+        # Every page about the topic is kept, and most of the others are not
+        self.assertLessEqual(set(range(1, 40, 4)), set(relevant))
+        self.assertLess(len(relevant), 15)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rufus.config import RufusConfig
+from rufus.crawler import IntelligentCrawler
+from rufus.dedup import SimHashIndex, simhash, hamming_distance
+from rufus.extractor import ExtractorAgent
+from rufus.parser import ParsedPage
+from rufus.testing import FakeEmbeddings
+
+ARTICLE = ' '.join(f'Residents can register for the summer recreation program number {i} at any city library branch.' for i in range(20))
+
+class TestSimHash(unittest.TestCase):
+    def test_near_duplicates_are_close(self):
+        edited = ARTICLE.replace('number 7', 'number seven')
+        self.assertLessEqual(hamming_distance(simhash(ARTICLE), simhash(edited)), 3)
+        self.assertGreater(hamming_distance(simhash(ARTICLE), simhash('Parking permits are issued by the transit agency.')), 3)
+
+    def test_index_finds_within_distance(self):
+        index = SimHashIndex(max_distance=3)
+        self.assertIsNone(index.find_or_add(0b1011 << 40, 'a'))
+        self.assertEqual(index.find_or_add((0b1011 << 40) ^ 0b111, 'b'), 'a')
+        self.assertIsNone(index.find_or_add((0b1011 << 40) ^ 0b1111, 'c'))
+        self.assertEqual(len(index), 2)
+
+class TestPageDedup(unittest.TestCase):
+    def test_mirror_pages_are_collapsed_into_aliases(self):
+        async def page(request):
+            links = '<a href="/article?print=1">Print</a><a href="/es/article">Espanol</a><a href="/other">Other</a>'
+            body = ARTICLE if request.path != '/other' else 'Parking permits are issued by the transit agency.'
+            if request.path == '/es/article':
+                body = ARTICLE.replace('library', 'library!')
+            return web.Response(text=f'<html><body><p>{body}</p>{links}</body></html>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', page)
+
+        async def run():
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                config = RufusConfig(embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, concurrency=1)
+                crawler = IntelligentCrawler(str(server.make_url('/article')), 'summer recreation', config)
+                await crawler.crawl()
+                return crawler, str(server.make_url('/article'))
+            finally:
+                await server.close()
+
+        crawler, article = asyncio.run(run())
+        self.assertEqual(crawler.pages_crawled, 4)
+        self.assertEqual(len(crawler.relevant_pages), 2)
+        self.assertEqual(sorted(crawler.aliases[article]), [f'{article}?print=1', article.replace('/article', '/es/article')])
+
+class TestPassageDedup(unittest.TestCase):
+    def test_repeated_passages_are_dropped(self):
+        agent = ExtractorAgent(granularity='sentence', dedup_distance=3)
+        agent.chunker.sentences = lambda text: text.split('|')
+        pages = [
+            ('https://example.com/a', ParsedPage('https://example.com/a', text=f'{ARTICLE}|Unique story about parks.')),
+            ('https://example.com/b', ParsedPage('https://example.com/b', text=f'{ARTICLE}|Another story about museums.')),
+            ('https://example.com/c', ParsedPage('https://example.com/c', text=ARTICLE)),
+        ]
+        data = asyncio.run(agent.extract_data(pages))
+        self.assertEqual([item['url'] for item in data], ['https://example.com/a', 'https://example.com/b'])
+        self.assertEqual(data[0]['content'], [ARTICLE, 'Unique story about parks.'])
+        self.assertEqual(data[1]['content'], ['Another story about museums.'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import threading
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rufus.config import RufusConfig
+from rufus.distributed import DistributedCrawler, SharedFrontier, shard_for
+from rufus.store import PageStore
+from rufus.testing import FakeEmbeddings
+
+class LockedEmbeddings(FakeEmbeddings):
+    # Like API clients, holds a lock and so can't be pickled
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.RLock()
+
+class TestSharedFrontier(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'frontier.sqlite')
+        SharedFrontier.create(self.path, 2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def url_for(self, shard):
+        return next(f'https://example.com/{i}' for i in range(100) if shard_for(f'https://example.com/{i}', 2, 'url') == shard)
+
+    def test_links_reach_the_owning_shard_once(self):
+        async def run():
+            first = SharedFrontier(self.path, 0, 2, 'url')
+            second = SharedFrontier(self.path, 1, 2, 'url')
+            first.put(self.url_for(0), 0.0)
+            first.commit()
+            _, _, url = await first.get()
+            # Both shards discover the same link on their pages
+            first.put(self.url_for(1), 0.5, 1)
+            second.put(self.url_for(1), 0.2, 1)
+            first.task_done()
+            second.commit()
+            item = await second.get()
+            done_while_claimed = second.finished()
+            second.task_done()
+            finished = first.finished() and second.finished()
+            first.close()
+            second.close()
+            return url, item, done_while_claimed, finished
+
+        url, item, done_while_claimed, finished = asyncio.run(run())
+        self.assertEqual(url, self.url_for(0))
+        self.assertEqual(item, (0.2, 1, self.url_for(1)))
+        self.assertFalse(done_while_claimed)
+        self.assertTrue(finished)
+
+    def test_claimed_urls_count_as_visited(self):
+        async def run():
+            frontier = SharedFrontier(self.path, 0, 2, 'url')
+            frontier.put(self.url_for(0), 0.0)
+            frontier.commit()
+            before = frontier.visited(self.url_for(0))
+            await frontier.get()
+            return before, frontier.visited(self.url_for(0)), frontier.visited(self.url_for(1))
+
+        self.assertEqual(asyncio.run(run()), (False, True, False))
+
+    def test_page_budget_is_shared(self):
+        first = SharedFrontier(self.path, 0, 2)
+        second = SharedFrontier(self.path, 1, 2)
+        taken = [frontier.take_page(12) for frontier in (first, second) * 7]
+        second.return_page()
+        self.assertEqual(taken, [True] * 12 + [False, False])
+        self.assertTrue(first.take_page(12))
+        self.assertFalse(second.take_page(12))
+        first.close()
+        second.close()
+
+
+class TestDistributedCrawl(unittest.TestCase):
+    def crawl(self, links, **settings):
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            anchors = ''.join(f'<a href="/page/{i}">events {i}</a>' for i in range(1, links + 1)) if index == 0 else ''
+            return web.Response(text=f'<html><body><p>City events page {index}</p>{anchors}</body></html>', content_type='text/html')
+
+        async def run(tmp):
+            app = web.Application()
+            app.router.add_get('/', page)
+            app.router.add_get('/page/{index}', page)
+            server = TestServer(app)
+            await server.start_server()
+            options = dict(
+                embeddings_model=FakeEmbeddings(),
+                relevance_threshold=0.0,
+                near_duplicate_distance=None,
+                respect_robots=False,
+                page_store_dir=tmp,
+                crawl_processes=2,
+            )
+            options.update(settings)
+            config = RufusConfig(**options)
+            crawler = DistributedCrawler(str(server.make_url('/')), 'city events', config)
+            try:
+                await asyncio.wait_for(crawler.crawl(), timeout=60)
+                return crawler.pages_crawled, sorted(url for url, _ in crawler.relevant_pages), os.listdir(tmp)
+            finally:
+                crawler.relevant_pages.close()
+                await server.close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(tmp))
+
+    def test_processes_share_the_crawl_and_merge_pages(self):
+        pages_crawled, urls, files = self.crawl(8)
+        self.assertEqual(pages_crawled, 9)
+        self.assertEqual(len(urls), 9)
+        self.assertEqual(len(set(urls)), 9)
+        self.assertEqual(len(files), 1)  # Only the merged segment is left behind
+
+    def test_page_budget_below_link_count(self):
+        # Workers rebuild the unpicklable model from its factory
+        pages_crawled, urls, _ = self.crawl(19, max_pages=10, embeddings_model=LockedEmbeddings(), embeddings_factory=LockedEmbeddings)
+        self.assertEqual(pages_crawled, 10)
+        self.assertEqual(len(set(urls)), 10)
+
+    def test_single_host_sharded_by_host_gets_the_whole_budget(self):
+        pages_crawled, _, _ = self.crawl(19, max_pages=5, shard_by='host')
+        self.assertEqual(pages_crawled, 5)
+
+    def test_unpicklable_model_needs_a_factory(self):
+        config = RufusConfig(embeddings_model=LockedEmbeddings(), crawl_processes=2)
+        with self.assertRaisesRegex(TypeError, 'embeddings_factory'):
+            DistributedCrawler('https://example.com', 'events', config).shard_config()
+
+    def test_merge_concatenates_segments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            parts = []
+            for name in ('a', 'b'):
+                store = PageStore(tmp)
+                store.append((f'https://example.com/{name}', f'<p>{name}</p>'))
+                store.close(remove=False)
+                parts.append(store.path)
+            merged = PageStore.merge(parts, tmp)
+            self.assertEqual([url for url, _ in merged], ['https://example.com/a', 'https://example.com/b'])
+            merged.close()
+
+if __name__ == '__main__':
+    unittest.main()
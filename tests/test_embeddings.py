@@ -0,0 +1,72 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from rufus.embeddings import EmbeddingCache, CachedEmbeddings, HashingEmbeddings, get_model_id
+from rufus.testing import FakeEmbeddings
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_lru_is_bounded(self):
+        cache = EmbeddingCache('model', max_size=2)
+        cache.put_many(['a', 'b', 'c'], [[1.0], [2.0], [3.0]])
+        self.assertEqual(len(cache.memory), 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c').tolist(), [3.0])
+
+    def test_keys_include_model_id(self):
+        self.assertNotEqual(EmbeddingCache('m1').key('Home'), EmbeddingCache('m2').key('Home'))
+
+    def test_disk_tier_persists_across_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache', 'embeddings.sqlite')
+            first = CachedEmbeddings(FakeEmbeddings(), EmbeddingCache('fake', path=path))
+            first.embed_documents(['Home', 'Contact', 'Home'])
+            first.cache.close()
+
+            model = FakeEmbeddings()
+            cache = EmbeddingCache('fake', path=path)
+            second = CachedEmbeddings(model, cache)
+            second.embed_documents(['Home', 'Contact'])
+            second.embed_query('Home')
+            cache.close()
+            self.assertEqual(model.document_calls, 0)
+            self.assertEqual(model.query_calls, 0)
+            self.assertEqual(cache.stats()['disk_hits'], 2)
+            self.assertEqual(cache.stats()['memory_hits'], 1)
+
+    def test_only_misses_reach_model(self):
+        model = FakeEmbeddings()
+        embeddings = CachedEmbeddings(model, EmbeddingCache(get_model_id(model)))
+        vectors = embeddings.embed_documents(['Home', 'About', 'Home'])
+        self.assertEqual(vectors[0], vectors[2])
+        self.assertEqual(vectors[0], model.embed_query('Home'))
+        embeddings.embed_documents(['Home', 'About'])
+        self.assertEqual(model.document_calls, 1)
+        self.assertEqual(embeddings.cache.stats()['misses'], 3)
+
+class TestHashingEmbeddings(unittest.TestCase):
+    def test_similarities_match_dense_cosine(self):
+        model = HashingEmbeddings(n_features=256)
+        model.partial_fit(['summer concerts in the park', 'parking permits and renewals', 'city council agenda'])
+        texts = ['Summer concerts', 'Parking permits', '', 'council']
+        query = model.embed_query('summer concerts in the park')
+        query /= np.linalg.norm(query)
+        matrix = model.embed_documents(texts)
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.0
+        np.testing.assert_allclose(model.similarities(texts, query), matrix @ query / norms, atol=1e-6)
+
+    def test_idf_favours_rare_terms(self):
+        model = HashingEmbeddings()
+        model.partial_fit([f'city news item {i}' for i in range(20)] + ['city concerts'])
+        query = model.embed_query('city concerts')
+        query /= np.linalg.norm(query)
+        city, concerts = model.similarities(['city tonight', 'concerts tonight'], query)
+        self.assertGreater(concerts, city)
+        self.assertEqual(model.documents, 21)
+
+    def test_vectors_are_stable_across_instances(self):
+        self.assertTrue(np.array_equal(HashingEmbeddings().embed_query('Home'), HashingEmbeddings().embed_query('Home')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,24 +1,56 @@
 import unittest
 from rufus.agents import EvaluatorAgent
+from rufus.config import RufusConfig
+from rufus.testing import FakeLLMServer
 import asyncio
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 class TestEvaluator(unittest.TestCase):
-    def setUp(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your environment variables.")
-        self.evaluator_agent = EvaluatorAgent(evaluation_threshold=0.7, api_key=self.api_key)
-
     def test_evaluator(self):
-        extracted_data = [{'content': ['Sample data']}]
-        instructions = "Sample instructions"
-        scored_data = asyncio.run(self.evaluator_agent.evaluate_data(extracted_data, instructions))
+        async def run():
+            server = await FakeLLMServer().start()
+            try:
+                config = RufusConfig(llm_base_url=server.base_url)
+                evaluator_agent = EvaluatorAgent(evaluation_threshold=0.7, api_key='test-key', config=config)
+                extracted_data = [{'content': ['Sample data']}, {'content': ['Parking permits']}]
+                instructions = "Sample instructions"
+                return await evaluator_agent.evaluate_data(extracted_data, instructions)
+            finally:
+                await server.close()
+
+        scored_data = asyncio.run(run())
         self.assertIsInstance(scored_data, list)
         self.assertTrue(len(scored_data) > 0)
+        self.assertEqual([score for _, score in scored_data], [0.5, 0.0])
+
+class TestEvaluationCascade(unittest.TestCase):
+    def test_only_borderline_documents_reach_llm(self):
+        async def run():
+            server = await FakeLLMServer().start()
+            try:
+                config = RufusConfig(llm_base_url=server.base_url, cascade_reject_below=0.2, cascade_accept_above=0.6)
+                agent = EvaluatorAgent(0.5, 'test-key', config)
+                extracted_data = [
+                    {'url': 'https://example.com/a', 'content': ['city events'], 'relevance': 0.9},
+                    {'url': 'https://example.com/b', 'content': ['city events'], 'relevance': 0.4},
+                    {'url': 'https://example.com/c', 'content': ['city events'], 'relevance': 0.05},
+                    {'url': 'https://example.com/d', 'content': ['parking']},
+                    {'url': 'https://example.com/e', 'content': ['city events'], 'relevance': 0.7},
+                ]
+                # A previous evaluation doesn't count towards the next report
+                await agent.evaluate_data(extracted_data[:1], 'city events')
+                return server, agent, await agent.evaluate_data(extracted_data, 'city events')
+            finally:
+                await server.close()
+
+        server, agent, scored_data = asyncio.run(run())
+        scores = [score for _, score in scored_data]
+        self.assertEqual(scores[1:4], [1.0, 0.0, 0.0])
+        # Accepted similarities map onto [evaluation_threshold, 1] in order
+        self.assertAlmostEqual(scores[0], 0.875)
+        self.assertAlmostEqual(scores[4], 0.625)
+        self.assertEqual(len(server.prompts), 1)
+        self.assertEqual(server.prompts[0].count('Document '), 2)
+        self.assertEqual(agent.cascade_report(), {'accepted': 2, 'rejected': 1, 'escalated': 2, 'llm_calls_saved': 3})
 
 if __name__ == '__main__':
     unittest.main()
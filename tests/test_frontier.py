@@ -0,0 +1,73 @@
+import unittest
+import asyncio
+from rufus.frontier import URLFrontier, FingerprintSet, canonicalize_url, url_fingerprint
+
+class TestCanonicalizeURL(unittest.TestCase):
+    def test_equivalent_urls_collapse(self):
+        variants = [
+            'https://Example.COM:443/events/?b=2&a=1#top',
+            'HTTPS://example.com/events?a=1&b=2&utm_source=news',
+            'https://example.com/events/?a=1&fbclid=xyz&b=2',
+        ]
+        self.assertEqual({canonicalize_url(url) for url in variants}, {'https://example.com/events?a=1&b=2'})
+
+    def test_non_default_port_is_kept(self):
+        self.assertEqual(canonicalize_url('http://example.com:8080/'), 'http://example.com:8080')
+        self.assertEqual(canonicalize_url('http://example.com:80/a'), 'http://example.com/a')
+
+class TestFingerprintSet(unittest.TestCase):
+    def test_add_and_grow(self):
+        fingerprints = FingerprintSet(capacity=4)
+        values = [url_fingerprint(f'https://example.com/{i}') for i in range(1000)]
+        self.assertTrue(all(fingerprints.add(value) for value in values))
+        self.assertFalse(fingerprints.add(values[10]))
+        self.assertEqual(len(fingerprints), 1000)
+        self.assertTrue(all(value in fingerprints for value in values))
+        self.assertNotIn(url_fingerprint('https://example.com/missing'), fingerprints)
+
+class TestURLFrontier(unittest.TestCase):
+    def test_rediscovery_updates_priority_without_duplicates(self):
+        frontier = URLFrontier()
+        self.assertTrue(frontier.put('https://example.com/a', 0.9, depth=3))
+        self.assertFalse(frontier.put('https://example.com/a/', 0.2, depth=1))
+        self.assertFalse(frontier.put('https://example.com/a', 0.5))
+        frontier.put('https://example.com/b', 0.4)
+        self.assertEqual(frontier.qsize(), 2)
+        self.assertEqual(frontier.pop(), (0.2, 1, 'https://example.com/a'))
+        self.assertEqual(frontier.pop(), (0.4, 0, 'https://example.com/b'))
+        self.assertIsNone(frontier.pop())
+        # Already crawled URLs are never admitted again
+        self.assertTrue(frontier.visited('https://example.com/a'))
+        self.assertFalse(frontier.put('https://example.com/a', 0.0))
+
+    def test_size_is_bounded_and_keeps_best(self):
+        frontier = URLFrontier(max_size=100)
+        for i in range(1000):
+            frontier.put(f'https://example.com/{i}', priority=i / 1000)
+        self.assertLessEqual(frontier.qsize(), 125)
+        self.assertEqual(frontier.pop()[2], 'https://example.com/0')
+        stats = frontier.stats()
+        self.assertEqual(stats['seen'], 1000)
+        self.assertGreater(stats['dropped'], 0)
+        self.assertLess(stats['bytes_per_url'], 100)
+
+    def test_join_waits_for_task_done(self):
+        async def run():
+            frontier = URLFrontier()
+            frontier.put('https://example.com', 0)
+            _, _, url = await frontier.get()
+            join = asyncio.create_task(frontier.join())
+            await asyncio.sleep(0)
+            self.assertFalse(join.done())
+            frontier.put('https://example.com/next', 0.5, depth=1)
+            frontier.task_done()
+            await asyncio.sleep(0)
+            self.assertFalse(join.done())
+            await frontier.get()
+            frontier.task_done()
+            await asyncio.wait_for(join, 1)
+
+        asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rufus.config import RufusConfig
+from rufus.crawler import IntelligentCrawler
+from rufus.metrics import Metrics, NULL_METRICS
+from rufus.testing import FakeEmbeddings
+
+class TestMetrics(unittest.TestCase):
+    def test_counters_histograms_and_spans(self):
+        metrics = Metrics()
+        metrics.increment('fetch_requests_total', status=200)
+        metrics.increment('fetch_requests_total', 2, status=200)
+        for value in (0.002, 0.004, 0.02, 0.2):
+            metrics.observe('fetch_seconds', value)
+        with metrics.span('crawl'):
+            pass
+        self.assertEqual(metrics.counter('fetch_requests_total', status='200'), 3)
+        histogram = metrics.histogram('fetch_seconds')
+        self.assertEqual(histogram.count, 4)
+        self.assertTrue(0.0025 <= histogram.quantile(0.5) <= 0.005)
+        report = metrics.report()
+        self.assertEqual(report['counters'], {'fetch_requests_total{status=200}': 3})
+        self.assertEqual([span['name'] for span in report['spans']], ['crawl'])
+        json.dumps(report)
+
+    def test_prometheus_text_format(self):
+        metrics = Metrics()
+        metrics.increment('pages_crawled_total', 5)
+        metrics.gauge('frontier_size', 7)
+        metrics.observe('fetch_bytes', 2000, buckets=(1024, 4096))
+        text = metrics.prometheus()
+        self.assertIn('# TYPE rufus_pages_crawled_total counter\nrufus_pages_crawled_total 5\n', text)
+        self.assertIn('rufus_frontier_size 7', text)
+        self.assertIn('rufus_fetch_bytes_bucket{le="1024"} 0', text)
+        self.assertIn('rufus_fetch_bytes_bucket{le="4096"} 1', text)
+        self.assertIn('rufus_fetch_bytes_bucket{le="+Inf"} 1', text)
+        self.assertIn('rufus_fetch_bytes_count 1', text)
+
+    def test_null_metrics_records_nothing(self):
+        with NULL_METRICS.span('crawl'):
+            NULL_METRICS.increment('pages_crawled_total')
+            NULL_METRICS.observe('fetch_seconds', 1.0)
+        self.assertEqual(NULL_METRICS.report(), {})
+
+    def test_crawl_is_instrumented(self):
+        async def page(request):
+            index = int(request.match_info.get('index', 0))
+            links = ''.join(f'<a href="/page/{i}">events {i}</a>' for i in range(1, 4)) if index == 0 else ''
+            topic = ['city events', 'parking permits', 'library hours', 'council minutes'][index]
+            return web.Response(text=f'<html><body><p>{topic}</p>{links}</body></html>', content_type='text/html')
+
+        async def run(metrics):
+            app = web.Application()
+            app.router.add_get('/', page)
+            app.router.add_get('/page/{index}', page)
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                config = RufusConfig(embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, metrics=metrics)
+                await IntelligentCrawler(str(server.make_url('/')), 'city events', config).crawl()
+            finally:
+                await server.close()
+
+        metrics = Metrics()
+        asyncio.run(run(metrics))
+        self.assertEqual(metrics.counter('pages_crawled_total'), 4)
+        self.assertEqual(metrics.counter('fetch_requests_total', status=200), 4)
+        self.assertEqual(metrics.histogram('fetch_seconds').count, 4)
+        self.assertEqual(metrics.histogram('parse_seconds').count, 4)
+        self.assertGreater(metrics.counter('fetch_bytes_total'), 0)
+        self.assertGreater(metrics.counter('embedding_cache_misses_total'), 0)
+        self.assertEqual(metrics.counter('embedding_requests_total'), metrics.histogram('embedding_request_seconds').count)
+        self.assertEqual([span['name'] for span in metrics.spans], ['crawl'])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.json')
+            metrics.write_report(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)['counters']['pages_crawled_total'], 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import asyncio
+from rufus.parser import ParsedPage, PageParser, parse_page, resolve_backend
+from rufus.extractor import ExtractorAgent
+
+HTML = """
+<html><head><title>City  Events</title><script>var x = 1;</script></head>
+<body>
+  <nav><a href="/home">Home</a><a href="mailto:info@example.com">Mail</a></nav>
+  <h1>Upcoming events</h1>
+  <p>Free concerts in <b>Golden Gate</b> Park.</p>
+  <ul><li><p>Farmers market</p></li><li>Film night</li></ul>
+  <table><tr><td>Mon</td><td>Yoga</td></tr></table>
+  <a href="events/2024#details">Calendar</a>
+  <footer>Copyright</footer>
+</body></html>
+"""
+
+class TestParsePage(unittest.TestCase):
+    def setUp(self):
+        self.page = parse_page('https://example.com/city/', HTML)
+
+    def test_links_include_navigation(self):
+        self.assertEqual(self.page.links, [
+            ('https://example.com/home', 'Home'),
+            ('https://example.com/city/events/2024', 'Calendar'),
+        ])
+
+    def test_text_drops_boilerplate(self):
+        self.assertEqual(self.page.title, 'City Events')
+        self.assertNotIn('var x', self.page.text)
+        self.assertNotIn('Copyright', self.page.text)
+        self.assertNotIn('Home', self.page.text)
+        self.assertIn('Free concerts in Golden Gate Park.', self.page.text)
+
+    def test_blocks_follow_document_structure(self):
+        self.assertEqual(self.page.blocks, [
+            ('h1', 'Upcoming events'),
+            ('p', 'Free concerts in Golden Gate Park.'),
+            ('li', 'Farmers market'),
+            ('li', 'Film night'),
+            ('tr', 'Mon Yoga'),
+        ])
+
+    def test_round_trips_through_dict(self):
+        copy = ParsedPage.from_dict(self.page.to_dict())
+        self.assertEqual(copy.to_dict(), self.page.to_dict())
+
+    def test_auto_backend_resolves(self):
+        self.assertIn(resolve_backend('auto'), ('lxml', 'html.parser'))
+        self.assertEqual(resolve_backend('html5lib'), 'html5lib')
+
+    def test_extractor_consumes_parsed_page(self):
+        agent = ExtractorAgent()
+        data = asyncio.run(agent.extract_data([('https://example.com/city', self.page)]))
+        self.assertEqual(data[0]['url'], 'https://example.com/city')
+        self.assertEqual(data[0]['content'], [
+            'Upcoming events\nFree concerts in Golden Gate Park.',
+            'Farmers market\nFilm night',
+            'Mon Yoga',
+        ])
+
+class TestPageParser(unittest.TestCase):
+    def test_process_pool_matches_inline_parse(self):
+        parser = PageParser(workers=2)
+
+        async def run():
+            return await asyncio.gather(*[parser.parse(f'https://example.com/{i}', HTML) for i in range(4)])
+
+        try:
+            pages = asyncio.run(run())
+            start_method = parser.executor._mp_context.get_start_method()
+        finally:
+            parser.close()
+        self.assertEqual(start_method, 'spawn')
+        self.assertIsNone(parser.executor)
+        for i, page in enumerate(pages):
+            self.assertEqual(page.to_dict(), parse_page(f'https://example.com/{i}', HTML, parser.backend).to_dict())
+
+    def test_inline_mode_has_no_executor(self):
+        parser = PageParser()
+        page = asyncio.run(parser.parse('https://example.com', HTML))
+        self.assertIsNone(parser.executor)
+        self.assertEqual(page.title, 'City Events')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import unittest
+import asyncio
+import time
+from email.utils import formatdate
+from urllib.robotparser import RobotFileParser
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+from rufus.crawler import IntelligentCrawler
+from rufus.config import RufusConfig
+from rufus.politeness import HostScheduler, RobotsCache, parse_retry_after
+from rufus.testing import FakeEmbeddings
+
+class TestHostScheduler(unittest.TestCase):
+    def test_limit_grows_additively_and_halves_on_errors(self):
+        scheduler = HostScheduler(lambda *item: None, max_concurrency=4, initial_concurrency=1)
+        for _ in range(20):
+            scheduler.record('a.test', 0.1, 200)
+        self.assertEqual(scheduler.get('a.test').limit, 4)
+        scheduler.record('a.test', 0.1, 503)
+        scheduler.record('a.test', 0.1, 503)  # Same congestion event, no second decrease
+        self.assertEqual(scheduler.get('a.test').limit, 2)
+        self.assertEqual(scheduler.get('b.test').limit, 1)
+
+    def test_latency_inflation_backs_off(self):
+        scheduler = HostScheduler(lambda *item: None, max_concurrency=8, initial_concurrency=4)
+        scheduler.record('a.test', 0.05, 200)
+        for _ in range(10):
+            scheduler.record('a.test', 1.0, 200)
+        self.assertLess(scheduler.get('a.test').limit, 4)
+
+    def test_fast_outlier_does_not_pin_the_limit(self):
+        scheduler = HostScheduler(lambda *item: None, max_concurrency=8, initial_concurrency=2)
+        scheduler.record('a.test', 0.001, 304)  # Not a page fetch
+        scheduler.record('a.test', 0.01, 200)  # e.g. served from a CDN cache
+        for _ in range(200):
+            scheduler.record('a.test', 0.1, 200)
+        self.assertEqual(scheduler.get('a.test').limit, 8)
+
+    def test_busy_host_defers_until_release(self):
+        requeued = []
+        scheduler = HostScheduler(lambda *item: requeued.append(item), initial_concurrency=1)
+
+        async def run():
+            self.assertTrue(scheduler.try_acquire('a.test'))
+            self.assertFalse(scheduler.try_acquire('a.test'))
+            scheduler.defer('a.test', 'http://a.test/2', 0.5, 1)
+            scheduler.defer('a.test', 'http://a.test/1', 0.1, 1)
+            self.assertEqual(requeued, [])
+            scheduler.release('a.test')
+
+        asyncio.run(run())
+        self.assertEqual(requeued, [('http://a.test/1', 0.1, 1)])
+
+    def test_drain_takes_only_one_crawls_urls(self):
+        theirs = []
+        mine = lambda *item: None
+        scheduler = HostScheduler(None, initial_concurrency=1)
+
+        async def run():
+            scheduler.try_acquire('a.test')
+            scheduler.defer('a.test', 'http://a.test/1', 0.1, 1, mine)
+            scheduler.defer('a.test', 'http://a.test/2', 0.2, 1, lambda *item: theirs.append(item))
+            scheduler.defer('a.test', 'http://a.test/3', 0.3, 2, mine)
+            drained = scheduler.drain(mine)
+            scheduler.release('a.test')
+            return drained
+
+        self.assertEqual(sorted(asyncio.run(run())), [('http://a.test/1', 0.1, 1), ('http://a.test/3', 0.3, 2)])
+        self.assertEqual(theirs, [('http://a.test/2', 0.2, 1)])
+
+    def test_retry_after_formats(self):
+        self.assertEqual(parse_retry_after('5'), 5.0)
+        self.assertAlmostEqual(parse_retry_after(formatdate(time.time() + 30, usegmt=True)), 30, delta=2)
+        self.assertEqual(parse_retry_after('soon'), 0.0)
+        self.assertEqual(parse_retry_after(None), 0.0)
+
+
+class TestPoliteCrawl(unittest.TestCase):
+    def make_app(self):
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def robots(request):
+            return web.Response(text='User-agent: *\nDisallow: /private\n')
+
+        async def page(request):
+            self.requests.append(request.path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                if request.path == '/page/1' and self.requests.count('/page/1') == 1:
+                    return web.Response(status=429, headers={'Retry-After': '0'})
+                await asyncio.sleep(0.01)
+                links = ''.join(f'<a href="/page/{i}">events {i}</a>' for i in range(1, 5)) + '<a href="/private/x">events</a>'
+                topic = ['city events', 'parking permits', 'library hours', 'council minutes', 'park concerts'][len(self.requests) % 5]
+                return web.Response(text=f'<html><body><p>{request.path} {topic}</p>{links}</body></html>', content_type='text/html')
+            finally:
+                self.in_flight -= 1
+
+        app = web.Application()
+        app.router.add_get('/robots.txt', robots)
+        app.router.add_get('/', page)
+        app.router.add_get('/page/{index}', page)
+        app.router.add_get('/private/{name}', page)
+        return app
+
+    def test_robots_politeness_delay_and_retry_after(self):
+        config = RufusConfig(
+            embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, concurrency=8,
+            politeness_delay=0.05, near_duplicate_distance=None,
+        )
+
+        async def run():
+            server = TestServer(self.make_app())
+            await server.start_server()
+            try:
+                crawler = IntelligentCrawler(str(server.make_url('/')), 'events', config)
+                started = time.monotonic()
+                await crawler.crawl()
+                return crawler, time.monotonic() - started
+            finally:
+                await server.close()
+
+        crawler, elapsed = asyncio.run(run())
+        self.assertNotIn('/private/x', self.requests)
+        self.assertEqual(crawler.skipped['robots'], 1)
+        self.assertEqual(self.requests.count('/page/1'), 2)
+        self.assertEqual(crawler.pages_crawled, 5)
+        self.assertEqual(len(crawler.relevant_pages), 5)
+        # The delay spaces out request starts, so requests to the host never overlap here
+        self.assertEqual(self.max_in_flight, 1)
+        self.assertGreaterEqual(elapsed, 0.05 * 5)
+
+    def test_page_budget_below_link_count_finishes(self):
+        # URLs parked for the busy host must not keep the crawl open once max_pages is reached
+        async def page(request):
+            links = ''.join(f'<a href="/page/{i}">events {i}</a>' for i in range(1, 20)) if request.path == '/' else ''
+            await asyncio.sleep(0.01)
+            return web.Response(text=f'<html><body><p>{request.path} events</p>{links}</body></html>', content_type='text/html')
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/', page)
+            app.router.add_get('/page/{index}', page)
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                config = RufusConfig(
+                    embeddings_model=FakeEmbeddings(), relevance_threshold=0.0, max_pages=5,
+                    respect_robots=False, near_duplicate_distance=None,
+                )
+                crawler = IntelligentCrawler(str(server.make_url('/')), 'events', config)
+                await asyncio.wait_for(crawler.crawl(), timeout=10)
+                return crawler
+            finally:
+                await server.close()
+
+        crawler = asyncio.run(run())
+        self.assertEqual(crawler.pages_crawled, 5)
+        self.assertEqual(crawler.frontier.unfinished, 0)
+        self.assertEqual(crawler.scheduler.drain(), [])
+
+    def test_crawl_delay_from_robots(self):
+        robots = RobotsCache('Rufus/1.0')
+        parser = RobotFileParser()
+        parser.parse(['User-agent: rufus', 'Crawl-delay: 2', '', 'User-agent: *', 'Request-rate: 1/5'])
+        robots.parsers['https://a.test'] = parser
+        robots.parsers['https://b.test'] = RobotFileParser()
+        robots.parsers['https://b.test'].allow_all = True
+
+        async def run():
+            return await robots.crawl_delay(None, 'https://a.test/x'), await robots.crawl_delay(None, 'https://b.test/x')
+
+        self.assertEqual(asyncio.run(run()), (2.0, None))
+
+    def test_robots_failures_are_retried_and_expire(self):
+        def make_app(statuses):
+            async def robots(request):
+                return web.Response(text='User-agent: *\nDisallow: /private', status=statuses.pop(0))
+
+            app = web.Application()
+            app.router.add_get('/robots.txt', robots)
+            return app
+
+        async def run():
+            flaky = TestServer(make_app([500, 200]))
+            down = TestServer(make_app([503, 503, 503, 200]))
+            await flaky.start_server()
+            await down.start_server()
+            robots = RobotsCache('Rufus/1.0', retry_delay=0.01, failure_ttl=0.2)
+            try:
+                async with ClientSession() as session:
+                    results = [
+                        await robots.allowed(session, str(flaky.make_url('/page'))),
+                        await robots.allowed(session, str(flaky.make_url('/private'))),
+                        await robots.allowed(session, str(down.make_url('/page'))),
+                    ]
+                    await asyncio.sleep(0.2)
+                    results.append(await robots.allowed(session, str(down.make_url('/page'))))
+                    return results
+            finally:
+                await flaky.close()
+                await down.close()
+
+        self.assertEqual(asyncio.run(run()), [True, False, False, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import asyncio
+import time
+from rufus.agents import EvaluatorAgent
+from rufus.config import RufusConfig
+from rufus.scoring import BatchScorer, TokenBucket, parse_scores, is_retryable
+from rufus.testing import FakeLLMServer
+
+class RateLimited(Exception):
+    status_code = 429
+
+class TestParseScores(unittest.TestCase):
+    def test_numbered_lines(self):
+        self.assertEqual(parse_scores('1: 0.8\nDocument 2: 0.25\n3) 1.4', 3), {0: 0.8, 1: 0.25, 2: 1.0})
+
+    def test_bare_score_for_single_document(self):
+        self.assertEqual(parse_scores(' 0.6 ', 1), {0: 0.6})
+        self.assertEqual(parse_scores('no idea', 1), {})
+        self.assertEqual(parse_scores('1.0', 1), {0: 1.0})
+        self.assertEqual(parse_scores('1', 1), {0: 1.0})
+        self.assertEqual(parse_scores('1. 0.7', 1), {0: 0.7})
+
+class TestTokenBucket(unittest.TestCase):
+    def test_waits_when_empty(self):
+        async def run():
+            bucket = TokenBucket(per_minute=600, capacity=2)  # 10 per second
+            start = time.monotonic()
+            for _ in range(4):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.15)
+
+class TestBatchScorer(unittest.TestCase):
+    def test_concurrent_scores_share_prompts_and_retry(self):
+        prompts = []
+
+        async def complete(prompt):
+            prompts.append(prompt)
+            if len(prompts) == 1:
+                raise RateLimited()
+            count = prompt.count('Document ')
+            # Leave the last document out of the reply to force a single-document retry
+            return '\n'.join(f'{i}: 0.{i}' for i in range(1, count if count > 1 else 2))
+
+        async def run():
+            scorer = BatchScorer(complete, batch_size=3, backoff_base=0.01)
+            return scorer, await scorer.score_many('instructions', [f'doc {i}' for i in range(6)])
+
+        scorer, scores = asyncio.run(run())
+        self.assertEqual(scores, [0.1, 0.2, 0.1, 0.1, 0.2, 0.1])
+        self.assertEqual(scorer.retries, 1)
+        self.assertEqual(scorer.calls, 5)
+
+    def test_failed_batch_is_not_split(self):
+        prompts = []
+
+        async def complete(prompt):
+            prompts.append(prompt)
+            raise RateLimited()
+
+        async def run():
+            scorer = BatchScorer(complete, batch_size=3, max_retries=1, backoff_base=0.01)
+            return await scorer.score_many('instructions', [f'doc {i}' for i in range(3)])
+
+        self.assertEqual(asyncio.run(run()), [0.0, 0.0, 0.0])
+        self.assertEqual(len(prompts), 2)  # The first attempt and its one retry, for all three documents
+
+    def test_retryable_errors(self):
+        self.assertTrue(is_retryable(RateLimited()))
+        self.assertTrue(is_retryable(asyncio.TimeoutError()))
+        self.assertFalse(is_retryable(ValueError('bad prompt')))
+
+class TestEvaluatorAgainstFakeServer(unittest.TestCase):
+    def test_evaluate_data_batches_requests(self):
+        async def run():
+            server = await FakeLLMServer(rate_limited_requests=1).start()
+            try:
+                config = RufusConfig(llm_base_url=server.base_url, llm_batch_size=4)
+                agent = EvaluatorAgent(0.5, 'test-key', config)
+                agent.scorer.backoff_base = 0.01
+                data = [{'url': f'https://example.com/{i}', 'content': ['city events' if i % 2 else 'parking']} for i in range(8)]
+                return server, agent, await agent.evaluate_data(data, 'city events')
+            finally:
+                await server.close()
+
+        server, agent, scored = asyncio.run(run())
+        self.assertEqual([score for _, score in scored], [0.0, 1.0] * 4)
+        self.assertEqual(len(server.prompts), 2)
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(agent.scorer.retries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
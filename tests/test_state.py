@@ -0,0 +1,89 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rufus.config import RufusConfig
+from rufus.crawler import IntelligentCrawler
+from rufus.extractor import ExtractorAgent
+from rufus.parser import ParsedPage
+from rufus.state import CrawlState
+from rufus.testing import FakeEmbeddings
+
+class TestIncrementalRecrawl(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'state.sqlite')
+        self.statuses = []
+        self.body = '<html><body><p>city events</p><a href="/static">Static events</a></body></html>'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_app(self):
+        async def index(request):
+            # ETag-aware page
+            etag = f'"{hash(self.body)}"'
+            if request.headers.get('If-None-Match') == etag:
+                self.statuses.append(304)
+                return web.Response(status=304, headers={'ETag': etag})
+            self.statuses.append(200)
+            return web.Response(text=self.body, content_type='text/html', headers={'ETag': etag})
+
+        async def static(request):
+            # No validators, so only the content hash can detect that nothing changed
+            self.statuses.append(200)
+            return web.Response(text='<html><body><p>more city events</p></body></html>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/', index)
+        app.router.add_get('/static', static)
+        return app
+
+    async def crawl(self, server, model, instructions='city events'):
+        config = RufusConfig(embeddings_model=model, relevance_threshold=0.1, crawl_state_path=self.path)
+        crawler = IntelligentCrawler(str(server.make_url('/')), instructions, config)
+        await crawler.crawl()
+        data = await ExtractorAgent().extract_data(crawler.relevant_pages, crawler.crawl_state)
+        crawler.relevant_pages.close()
+        return crawler, data
+
+    def test_second_run_reuses_stored_results(self):
+        async def run():
+            server = TestServer(self.make_app())
+            await server.start_server()
+            try:
+                first_model = FakeEmbeddings()
+                first, first_data = await self.crawl(server, first_model)
+                second_model = FakeEmbeddings()
+                second, second_data = await self.crawl(server, second_model)
+                self.body = self.body.replace('city events', 'new city events')
+                third, _ = await self.crawl(server, FakeEmbeddings())
+                return first_model, first_data, second_model, second, second_data, third
+            finally:
+                await server.close()
+
+        first_model, first_data, second_model, second, second_data, third = asyncio.run(run())
+        self.assertEqual(self.statuses, [200, 200, 304, 200, 200, 200])
+        self.assertEqual(second.crawl_state.stats(), {'not_modified': 1, 'unchanged': 1, 'changed': 0})
+        self.assertEqual(third.crawl_state.stats(), {'not_modified': 0, 'unchanged': 1, 'changed': 1})
+        self.assertEqual(second_data, first_data)
+        # Only the instructions and the anchor text were embedded on the second run
+        self.assertEqual(second_model.texts_embedded, 2)
+        self.assertLess(second_model.texts_embedded, first_model.texts_embedded)
+
+    def test_extracted_content_is_invalidated_by_new_versions(self):
+        state = CrawlState(self.path, 'https://example.com')
+        page = ParsedPage('https://example.com/a', text='hello')
+        state.save('https://example.com/a', '"v1"', None, 'h1', 'fake', [1.0, 0.0], 0.5, page)
+        state.save_extracted('https://example.com/a', 'paragraph', ['hello'])
+        self.assertEqual(state.get_extracted('https://example.com/a', 'paragraph'), ['hello'])
+        self.assertIsNone(state.get_extracted('https://example.com/a', 'sentence'))
+        self.assertEqual(state.validators(state.get('https://example.com/a')), {'If-None-Match': '"v1"'})
+        state.save('https://example.com/a', '"v2"', None, 'h2', 'fake', [1.0, 0.0], 0.5, page)
+        self.assertIsNone(state.get_extracted('https://example.com/a', 'paragraph'))
+        state.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from rufus.store import PageStore
+from rufus.parser import ParsedPage
+from rufus.extractor import ExtractorAgent
+
+class TestPageStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = PageStore(self.tmp.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def make_page(self, i):
+        return ParsedPage(f'https://example.com/{i}', title=f'Page {i}', text='city events ' * 200,
+                          links=[(f'https://example.com/{i + 1}', 'next')], blocks=[('p', f'paragraph {i}')])
+
+    def test_round_trip_and_compression(self):
+        for i in range(50):
+            self.store.append((f'https://example.com/{i}', self.make_page(i)))
+        self.store.append(('https://example.com/raw', '<html><body>raw</body></html>'))
+        self.assertEqual(len(self.store), 51)
+        records = list(self.store)
+        self.assertEqual(records[7][0], 'https://example.com/7')
+        self.assertEqual(records[7][1].to_dict(), self.make_page(7).to_dict())
+        self.assertEqual(records[-1], ('https://example.com/raw', '<html><body>raw</body></html>'))
+        self.assertEqual(self.store[3][1].title, 'Page 3')
+        stats = self.store.stats()
+        self.assertLess(stats['stored_bytes'], stats['raw_bytes'] / 5)
+
+    def test_iteration_sees_later_appends(self):
+        self.store.append(('https://example.com/0', self.make_page(0)))
+        urls = []
+        for url, _ in self.store:
+            urls.append(url)
+            if len(self.store) < 3:
+                self.store.append((f'https://example.com/{len(self.store)}', self.make_page(len(self.store))))
+        self.assertEqual(urls, ['https://example.com/0', 'https://example.com/1', 'https://example.com/2'])
+
+    def test_segment_can_be_reloaded_and_is_removed_on_close(self):
+        for i in range(3):
+            self.store.append((f'https://example.com/{i}', self.make_page(i)))
+        self.store.close(remove=False)
+        reloaded = PageStore.load(self.store.path)
+        self.assertEqual([url for url, _ in reloaded], [f'https://example.com/{i}' for i in range(3)])
+        reloaded.close()
+        self.assertFalse(os.listdir(self.tmp.name))
+
+    def test_extractor_streams_from_store(self):
+        for i in range(70):
+            self.store.append((f'https://example.com/{i}', self.make_page(i)))
+        data = asyncio.run(ExtractorAgent().extract_data(self.store))
+        self.assertEqual(len(data), 70)
+        self.assertEqual(data[69]['url'], 'https://example.com/69')
+
+if __name__ == '__main__':
+    unittest.main()
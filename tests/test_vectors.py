@@ -0,0 +1,101 @@
+import unittest
+import json
+import os
+import tempfile
+import numpy as np
+from rufus.app import RufusClient
+from rufus.config import RufusConfig
+from rufus.testing import FakeEmbeddings
+from rufus.vectors import VectorStore, VectorStoreWriter, MANIFEST, VECTORS
+
+class TestVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, 'store')
+        self.rng = np.random.default_rng(7)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, vectors, start=0):
+        with VectorStoreWriter(self.directory, 'test-model') as writer:
+            writer.add(vectors, [{'text': f'passage {start + i}'} for i in range(len(vectors))])
+
+    def test_search_matches_brute_force(self):
+        vectors = self.rng.normal(size=(500, 16)).astype(np.float32)
+        self.write(vectors[:300])
+        self.write(vectors[300:], start=300)
+        query = self.rng.normal(size=16)
+        with VectorStore(self.directory) as store:
+            results = store.search(query, k=5)
+            self.assertEqual(len(store), 500)
+            self.assertEqual(store.get(321), {'text': 'passage 321'})
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+        self.assertEqual([result['id'] for result in results], list(expected))
+        self.assertEqual(results[0]['text'], f'passage {expected[0]}')
+        self.assertTrue(all(a['score'] >= b['score'] for a, b in zip(results, results[1:])))
+
+    def test_coarse_index_finds_neighbours_in_clusters(self):
+        centers = self.rng.normal(size=(20, 32))
+        vectors = np.repeat(centers, 100, axis=0) + 0.05 * self.rng.normal(size=(2000, 32))
+        self.write(vectors)
+        with VectorStore(self.directory) as store:
+            store.build_index(lists=20, nprobe=2)
+            queries = centers + 0.05 * self.rng.normal(size=centers.shape)
+            recall = np.mean([
+                len({r['id'] for r in store.search(query, k=10)} & {r['id'] for r in store.search(query, k=10, exact=True)}) / 10
+                for query in queries
+            ])
+        self.assertGreaterEqual(recall, 0.9)
+        with VectorStore(self.directory) as store:
+            self.assertIsNotNone(store.centroids)  # The index is reopened with the store
+
+    def test_appending_drops_the_index_and_interrupted_rows(self):
+        self.write(self.rng.normal(size=(50, 8)))
+        with VectorStore(self.directory) as store:
+            store.build_index(lists=4)
+        # Rows written after the last manifest belong to no one
+        with open(os.path.join(self.directory, VECTORS), 'ab') as f:
+            f.write(b'\0' * 12)
+        self.write(self.rng.normal(size=(10, 8)), start=50)
+        with open(os.path.join(self.directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.assertNotIn('index', manifest)
+        self.assertEqual(os.path.getsize(os.path.join(self.directory, VECTORS)), 60 * 8 * 4)
+        with VectorStore(self.directory) as store:
+            self.assertIsNone(store.centroids)
+            self.assertEqual(store.get(59), {'text': 'passage 59'})
+
+    def test_rejects_mismatched_vectors(self):
+        self.write(self.rng.normal(size=(5, 8)))
+        with self.assertRaises(ValueError):
+            self.write(self.rng.normal(size=(5, 4)))
+        with self.assertRaises(ValueError):
+            VectorStoreWriter(self.directory, 'other-model')
+
+class TestVectorExport(unittest.TestCase):
+    def test_client_exports_accepted_passages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = RufusConfig(embeddings_model=FakeEmbeddings(), evaluation_threshold=0.5, vector_index_min_rows=2)
+            client = RufusClient(api_key='test-key', config=config)
+            scored_data = [
+                ({'url': 'https://example.com/a', 'content': ['Summer concerts in the park', 'Jazz on Fridays']}, 0.9),
+                ({'url': 'https://example.com/b', 'content': ['Parking permits']}, 0.1),
+            ]
+            try:
+                count = client.export_vectors(scored_data, 'summer concerts', tmp)
+                client.index_vectors(tmp)
+            finally:
+                client.close()
+            with VectorStore(tmp) as store:
+                results = store.search(FakeEmbeddings().embed_query('Jazz on Fridays'), k=1, exact=True)
+                indexed = store.centroids is not None
+        self.assertEqual(count, 2)
+        self.assertEqual(results[0]['text'], 'Jazz on Fridays')
+        self.assertEqual(results[0]['url'], 'https://example.com/a')
+        self.assertAlmostEqual(results[0]['score'], 1.0, places=5)
+        self.assertTrue(indexed)
+
+if __name__ == '__main__':
+    unittest.main()